@@ -4,7 +4,8 @@ bind = '0.0.0.0:443'
 backlog = 2048
 
 workers = 5
-worker_class = 'sync'
+worker_class = 'gthread'
+threads = 8
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -14,7 +15,10 @@ keyfile = "/etc/letsencrypt/live/fwnl.joseaugustogoulart.com/privkey.pem"
 
 spew = False
 daemon = False
-#raw_env = []
+# half of the threads process requests, the rest wait (at most FWNL_QUEUE_BUDGET) or get a 503
+# and a quarter may hold WebSocket connections
+raw_env = ['FWNL_POOL_SIZE={}'.format(threads // 2), 'FWNL_MAX_INFLIGHT={}'.format(threads // 2),
+           'FWNL_MAX_SOCKETS={}'.format(threads // 4)]
 #pidfile = None
 umask = 0
 user = None
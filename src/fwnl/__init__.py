@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Natural language interface for FWUnify."""
+
+def __getattr__(name: str):
+  # lazy, so pure modules (e.g. fwnl.analysis) don't load spaCy
+  if name in ('Engine', 'Session'):
+    from . import engine
+    return getattr(engine, name)
+  raise AttributeError("module 'fwnl' has no attribute '{}'".format(name))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Linear-time IP address and network recognizer."""
+
+from functools import lru_cache
+import ipaddress
+import re
+import time
+from typing import Optional
+
+ALLOWED = frozenset('0123456789abcdefABCDEF.:/')
+# longest address plus prefix: 'ffff:ffff:ffff:ffff:ffff:ffff:255.255.255.255/128'
+MAX_LENGTH = 49
+
+@lru_cache(maxsize=4096)
+def recognize(text: str) -> Optional[str]:
+  """Tag a token as an IP address or network.
+
+  Tokens are first checked against the characters and length an address
+  may have, so ordinary words are rejected at a glance; IPv4 candidates are
+  then split into octets and IPv6 ones parsed by `ipaddress`. Every step is
+  linear in the token length.
+
+  Args:
+    text -- Token text.
+
+  Returns:
+    'IPV4', 'IPV6', 'IPV4_RANGE' or 'IPV6_RANGE', or None if the token isn't
+    an address.
+  """
+  if len(text) > MAX_LENGTH or ('.' not in text and ':' not in text) or not ALLOWED.issuperset(text):
+    return None
+  address, slash, prefix = text.partition('/')
+  if slash and not prefix.isdigit():
+    return None
+  if ':' not in address:
+    parts = address.split('.')
+    if len(parts) != 4 or not all(p.isdigit() and len(p) <= 3 and int(p) <= 255 for p in parts):
+      return None
+    if slash:
+      return 'IPV4_RANGE' if int(prefix) <= 32 else None
+    return 'IPV4'
+  try:
+    if slash:
+      return 'IPV{}_RANGE'.format(ipaddress.ip_network(text, strict=False).version)
+    return 'IPV{}'.format(ipaddress.ip_address(text).version)
+  except ValueError:
+    return None
+
+def main():
+  """Benchmark the recognizer against the former token regexes."""
+  octet = r'(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)'
+  ipv6 = r'(([0-9a-fA-F]{1,4}:){7,7}[0-9a-fA-F]{1,4}|([0-9a-fA-F]{1,4}:){1,7}:|([0-9a-fA-F]{1,4}:){1,6}:[0-9a-fA-F]{1,4}|([0-9a-fA-F]{1,4}:){1,5}(:[0-9a-fA-F]{1,4}){1,2}|([0-9a-fA-F]{1,4}:){1,4}(:[0-9a-fA-F]{1,4}){1,3}|([0-9a-fA-F]{1,4}:){1,3}(:[0-9a-fA-F]{1,4}){1,4}|([0-9a-fA-F]{1,4}:){1,2}(:[0-9a-fA-F]{1,4}){1,5}|[0-9a-fA-F]{1,4}:((:[0-9a-fA-F]{1,4}){1,6})|:((:[0-9a-fA-F]{1,4}){1,7}|:)|fe80:(:[0-9a-fA-F]{0,4}){0,4}%[0-9a-zA-Z]{1,}|::(ffff(:0{1,4}){0,1}:){0,1}((25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])\.){3,3}(25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])|([0-9a-fA-F]{1,4}:){1,4}:((25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])\.){3,3}(25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9]))'
+  regexes = [re.compile(r'^{0}(?:\.{0}){{3}}$'.format(octet)),
+             re.compile(r'^{0}(?:\.{0}){{3}}$'.format(ipv6)),
+             re.compile(r'^{0}(?:\.{0}){{3}}\/([1-9]|[12][0-9]|3[01])$'.format(octet))]
+  tokens = {
+    'words': ['block', 'access', 'from', 'the', 'server', 'laboratory', 'http', 'deadbeef'],
+    'addresses': ['10.0.0.5', '192.168.1.0/24', '2001:db8::1', 'fe80::/10', '::ffff:10.0.0.1'],
+    # hex-ish tokens that almost match the IPv6 expression repeated four times
+    'adversarial': ['1:1:1:1:1:1:1::.' * 3 + 'x', '1:2:3:4::.' * 4 + 'x', '::.::.::.:::',
+                    'ffff:ffff:ffff::.' * 4 + 'g', '1::.' * 40, 'a:' * 100 + 'x'],
+  }
+  rounds = 200
+  print('{:<12} {:>14} {:>14} {:>14}'.format('tokens', 'regex (us)', 'recognizer (us)', 'cached (us)'))
+  for name, group in tokens.items():
+    start = time.perf_counter()
+    for _ in range(rounds):
+      for token in group:
+        for regex in regexes:
+          regex.match(token)
+    regex_us = (time.perf_counter() - start) / rounds / len(group) * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+      recognize.cache_clear()
+      for token in group:
+        recognize(token)
+    recognizer_us = (time.perf_counter() - start) / rounds / len(group) * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+      for token in group:
+        recognize(token)
+    cached_us = (time.perf_counter() - start) / rounds / len(group) * 1e6
+    print('{:<12} {:>14.2f} {:>14.2f} {:>14.2f}'.format(name, regex_us, recognizer_us, cached_us))
+
+if __name__ == '__main__':
+  main()
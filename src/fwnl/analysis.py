@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Conflict and redundancy analysis of generated rules."""
+
+import argparse
+import ipaddress
+import json
+import re
+import sys
+import time
+from threading import RLock
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from interfaces.singleton import *
+from .inventory import *
+
+ANY = '*'
+
+Address = Tuple[str, int, int]
+
+def parse_address(text: str, resolver: Callable[[str], Optional[str]]=None) -> Address:
+  """Parse an endpoint or range into an integer address interval.
+
+  Args:
+    text -- Endpoint or range value (IPv4, IPv6, CIDR, hostname or 'any').
+    resolver -- Function mapping hostnames to addresses. (default: None)
+
+  Returns:
+    Tuple of (space, lo, hi) where space is '4' or '6' for addresses,
+    '*' for any address and 'host:<name>' for unresolved hostnames.
+  """
+  text = text.strip().lower()
+  if text == 'any' or text == '':
+    return (ANY, 0, 0)
+  if resolver is not None:
+    text = resolver(text) or text
+  try:
+    net = ipaddress.ip_network(text, strict=False)
+  except ValueError:
+    return ('host:' + text, 0, 0)
+  return (str(net.version), int(net.network_address), int(net.broadcast_address))
+
+def covers(a: Address, b: Address) -> bool:
+  """Check if address interval `a` contains `b`."""
+  if a[0] == ANY:
+    return True
+  return a[0] == b[0] and a[1] <= b[1] and b[2] <= a[2]
+
+def overlaps(a: Address, b: Address) -> bool:
+  """Check if address intervals `a` and `b` intersect."""
+  if a[0] == ANY or b[0] == ANY:
+    return True
+  return a[0] == b[0] and a[1] <= b[2] and b[1] <= a[2]
+
+class Rule(object):
+  """Address/protocol match of a single generated intent."""
+  __slots__ = ('name', 'src', 'dst', 'protocol', 'action', 'before', 'index')
+
+  def __init__(self, name: str, src: Address, dst: Address, protocol: str=ANY,
+               action: str='block', before: bool=False):
+    """Initialize rule.
+
+    Args:
+      name -- Name of the intent.
+      src -- Source address interval.
+      dst -- Destination address interval.
+      protocol -- Traffic protocol, '*' for any. (default: '*')
+      action -- What is done to matched traffic. (default: 'block')
+      before -- Whether the rule goes before all others. (default: False)
+    """
+    self.name = name
+    self.src = src
+    self.dst = dst
+    self.protocol = protocol
+    self.action = action
+    self.before = before
+    self.index = -1
+
+  @classmethod
+  def from_fields(cls, label: str, fields: Dict[str, str],
+                  resolver: Callable[[str], Optional[str]]=None) -> 'Rule':
+    """Build a rule from intent fields.
+
+    Args:
+      label -- Intent label (e.g. 'ACL' or 'TS').
+      fields -- Mapping of lower case command names to their raw values.
+      resolver -- Function mapping hostnames to addresses. (default: None)
+
+    Returns:
+      New rule.
+    """
+    protocol = fields.get('block') or fields.get('for') or ANY
+    if label.upper() == 'TS':
+      action = 'shape {}'.format(fields.get('with', ''))
+    else:
+      action = 'block'
+    return cls(fields.get('name', ''),
+               parse_address(fields.get('from', ANY), resolver),
+               parse_address(fields.get('to', ANY), resolver),
+               protocol.lower(), action.strip(), fields.get('order') == 'before')
+
+  @classmethod
+  def from_intent(cls, intent: Any, resolver: Callable[[str], Optional[str]]=None) -> 'Rule':
+    """Build a rule from a filled intent.
+
+    Args:
+      intent -- Intent whose commands all have values.
+      resolver -- Function mapping hostnames to addresses. (default: None)
+
+    Returns:
+      New rule.
+    """
+    fields = {}
+    for c in intent.commands:
+      value = c.values[c.value]
+      if value.name in ('Before', 'After'):
+        fields[c.name.lower()] = value.name.lower()
+      else:
+        fields[c.name.lower()] = str(value.value)
+    return cls.from_fields(intent.label, fields, resolver)
+
+  def covers(self, other: 'Rule') -> bool:
+    """Check if this rule matches every packet `other` matches."""
+    return ((self.protocol == ANY or self.protocol == other.protocol) and
+            covers(self.src, other.src) and covers(self.dst, other.dst))
+
+  def same(self, other: 'Rule') -> bool:
+    """Check if both rules match exactly the same packets."""
+    return (self.protocol == other.protocol and
+            self.src == other.src and self.dst == other.dst)
+
+  def __repr__(self) -> str:
+    return "Rule('{}')".format(self.name)
+
+class Finding(object):
+  """Relation found between two overlapping rules."""
+  __slots__ = ('kind', 'rule', 'other')
+
+  MESSAGES = {
+    'duplicate': "'{0}' duplicates '{1}'",
+    'shadowing': "'{0}' is shadowed by '{1}' and will never take effect",
+    'redundancy': "'{0}' is redundant with '{1}'",
+    'generalization': "'{0}' generalizes '{1}' with a different action",
+    'correlation': "'{0}' partially overlaps '{1}' with a different action",
+    'overlap': "'{0}' partially overlaps '{1}'",
+  }
+
+  def __init__(self, kind: str, rule: Rule, other: Rule):
+    """Initialize finding.
+
+    Args:
+      kind -- One of duplicate, shadowing, redundancy, generalization,
+              correlation or overlap.
+      rule -- Rule the finding is about (the one taking effect later).
+      other -- Rule it relates to (the one taking effect first).
+    """
+    self.kind = kind
+    self.rule = rule
+    self.other = other
+
+  def as_dict(self) -> Dict[str, str]:
+    return {'kind': self.kind, 'rule': self.rule.name, 'other': self.other.name}
+
+  def __str__(self) -> str:
+    return self.MESSAGES[self.kind].format(self.rule.name, self.other.name)
+
+def classify(first: Rule, second: Rule) -> Optional[str]:
+  """Classify the relation between two rules.
+
+  Args:
+    first -- Rule taking effect first.
+    second -- Rule taking effect later.
+
+  Returns:
+    Kind of relation, or None if the rules don't overlap.
+  """
+  if not (overlaps(first.src, second.src) and overlaps(first.dst, second.dst)):
+    return None
+  same = first.action == second.action
+  if first.same(second):
+    return 'duplicate' if same else 'shadowing'
+  if first.covers(second):
+    return 'redundancy' if same else 'shadowing'
+  if second.covers(first):
+    return 'redundancy' if same else 'generalization'
+  return 'overlap' if same else 'correlation'
+
+class IntervalTree(object):
+  """Static augmented interval tree, rebuilt lazily after insertions."""
+
+  def __init__(self):
+    self._pending: List[Tuple[int, int, Any]] = []
+    self._lo: List[int] = []
+    self._hi: List[int] = []
+    self._max: List[int] = []
+    self._items: List[Any] = []
+
+  def __len__(self) -> int:
+    return len(self._items) + len(self._pending)
+
+  def add(self, lo: int, hi: int, item: Any) -> None:
+    """Insert an interval.
+
+    Args:
+      lo -- Interval start (inclusive).
+      hi -- Interval end (inclusive).
+      item -- Object stored with the interval.
+    """
+    self._pending.append((lo, hi, item))
+
+  def _build(self) -> None:
+    """Sort intervals by start and compute subtree maximum ends."""
+    entries = sorted(list(zip(self._lo, self._hi, self._items)) + self._pending,
+                     key=lambda e: (e[0], e[1]))
+    self._pending = []
+    self._lo = [e[0] for e in entries]
+    self._hi = [e[1] for e in entries]
+    self._items = [e[2] for e in entries]
+    self._max = [0] * len(entries)
+
+    def build(l: int, r: int) -> int:
+      if l >= r:
+        return -1
+      m = (l + r) // 2
+      self._max[m] = max(self._hi[m], build(l, m), build(m + 1, r))
+      return self._max[m]
+    build(0, len(entries))
+
+  def search(self, lo: int, hi: int) -> Iterator[Any]:
+    """Find every interval intersecting [lo, hi].
+
+    Args:
+      lo -- Query start (inclusive).
+      hi -- Query end (inclusive).
+
+    Returns:
+      Iterator over the stored items.
+    """
+    if self._pending:
+      self._build()
+    stack = [(0, len(self._items))]
+    while stack:
+      l, r = stack.pop()
+      if l >= r:
+        continue
+      m = (l + r) // 2
+      if self._max[m] < lo:
+        continue
+      stack.append((l, m))
+      if self._lo[m] <= hi:
+        if self._hi[m] >= lo:
+          yield self._items[m]
+        stack.append((m + 1, r))
+
+class Analyzer(object):
+  """Index of rules by protocol and address space."""
+
+  def __init__(self, resolver: Callable[[str], Optional[str]]=None):
+    """Initialize analyzer.
+
+    Args:
+      resolver -- Function mapping hostnames to addresses. (default: None)
+    """
+    self.resolver = resolver
+    self.rules: List[Rule] = []
+    # side ('src' or 'dst') -> protocol -> address space -> intervals of that side
+    self._trees: Dict[str, Dict[str, Dict[str, IntervalTree]]] = {'src': {}, 'dst': {}}
+    self._lock = RLock()
+
+  def __len__(self) -> int:
+    return len(self.rules)
+
+  def add(self, rule: Rule) -> None:
+    """Add a rule to the index.
+
+    Args:
+      rule -- Rule to be added.
+    """
+    with self._lock:
+      rule.index = len(self.rules)
+      self.rules.append(rule)
+      for side in ('src', 'dst'):
+        address = getattr(rule, side)
+        tree = self._trees[side].setdefault(rule.protocol, {}).setdefault(address[0], IntervalTree())
+        tree.add(address[1], address[2], rule)
+
+  def load(self, text: str) -> int:
+    """Add every intent of a FWUnify configuration.
+
+    Args:
+      text -- Configuration text.
+
+    Returns:
+      Number of rules added.
+    """
+    rules = parse(text, self.resolver)
+    for rule in rules:
+      self.add(rule)
+    return len(rules)
+
+  def candidates(self, rule: Rule) -> Iterator[Rule]:
+    """Find indexed rules overlapping a rule.
+
+    Rules are looked up by source or by destination, whichever enumerates
+    fewer rules (see `_cost`), and filtered by the other side.
+
+    Args:
+      rule -- Rule to look for.
+
+    Returns:
+      Iterator over overlapping rules.
+    """
+    with self._lock:
+      protocols = list(self._trees['src'].keys() if rule.protocol == ANY else (rule.protocol, ANY))
+      side, other = min(('src', 'dst'), ('dst', 'src'), key=lambda s: self._cost(rule, protocols, s[0]))
+      address, opposite = getattr(rule, side), getattr(rule, other)
+      for protocol in protocols:
+        spaces = self._trees[side].get(protocol, {})
+        for space, tree in list(spaces.items()):
+          if address[0] == ANY or space == ANY:
+            found = tree.search(-1, 1 << 128)
+          elif space == address[0]:
+            found = tree.search(address[1], address[2])
+          else:
+            continue
+          for candidate in found:
+            if candidate is not rule and overlaps(opposite, getattr(candidate, other)):
+              yield candidate
+
+  def _cost(self, rule: Rule, protocols: List[str], side: str) -> int:
+    """Count the rules a lookup by one side enumerates at least.
+
+    Every rule of the protocols if the rule's own address is a wildcard,
+    otherwise the wildcard addresses of that side, which overlap anything.
+    """
+    trees = self._trees[side]
+    if getattr(rule, side)[0] == ANY:
+      return sum(len(tree) for p in protocols for tree in trees.get(p, {}).values())
+    return sum(len(trees.get(p, {}).get(ANY, ())) for p in protocols)
+
+  @staticmethod
+  def precedes(a: Rule, b: Rule) -> bool:
+    """Check if rule `a` takes effect before rule `b`.
+
+    Rules placed 'before' all intents go ahead of the others, the latest one
+    first; the remaining rules keep their insertion order.
+    """
+    if a.before != b.before:
+      return a.before
+    return a.index > b.index if a.before else a.index < b.index
+
+  def check(self, rule: Rule) -> List[Finding]:
+    """Check a new rule against the index without adding it.
+
+    Args:
+      rule -- Rule to be checked.
+
+    Returns:
+      List of findings about the new rule.
+    """
+    findings = []
+    for other in self.candidates(rule):
+      if rule.before:
+        kind = classify(rule, other)
+        if kind is not None:
+          findings.append(Finding(kind, other, rule))
+      else:
+        kind = classify(other, rule)
+        if kind is not None:
+          findings.append(Finding(kind, rule, other))
+    return findings
+
+  def analyze(self) -> List[Finding]:
+    """Find every relation between indexed rules.
+
+    Returns:
+      List of findings, each pair reported once.
+    """
+    findings = []
+    with self._lock:
+      for rule in self.rules:
+        for other in self.candidates(rule):
+          if self.precedes(other, rule):
+            kind = classify(other, rule)
+            if kind is not None:
+              findings.append(Finding(kind, rule, other))
+    return findings
+
+class Ruleset(Analyzer, metaclass=SingletonMeta):
+  """Rules already deployed, checked against every generated intent."""
+  pass
+
+INTENT_RX = re.compile(r'define\s+intent\s+(\w+)\s*:')
+FIELD_RX = re.compile(r"^\s*(\w+)\s+(\w+)\('([^']*)'\)", re.MULTILINE)
+
+def parse(text: str, resolver: Callable[[str], Optional[str]]=None) -> List[Rule]:
+  """Parse FWUnify intents generated by `Intent.generate`.
+
+  Args:
+    text -- Configuration text.
+    resolver -- Function mapping hostnames to addresses. (default: None)
+
+  Returns:
+    List of rules, in file order.
+  """
+  rules = []
+  parts = INTENT_RX.split(text)
+  for label, body in zip(parts[1::2], parts[2::2]):
+    fields = {}
+    for key, func, arg in FIELD_RX.findall(body):
+      fields[key.lower()] = func.lower() if func.lower() in ('before', 'after') else arg
+    rules.append(Rule.from_fields(label, fields, resolver))
+  return rules
+
+def main():
+  """Main function."""
+  parser = argparse.ArgumentParser(description='Find conflicting and redundant intents.')
+  parser.add_argument('config', help='FWUnify configuration file')
+  parser.add_argument('--inventory', help='file with host and group aliases to resolve hostnames')
+  parser.add_argument('--json', action='store_true', help='print findings as JSON')
+  args = parser.parse_args()
+
+  start = time.perf_counter()
+  analyzer = Analyzer()
+  if args.inventory is not None:
+    Inventory().load(args.inventory)
+    analyzer.resolver = Inventory().resolve
+  with open(args.config) as f:
+    analyzer.load(f.read())
+  findings = analyzer.analyze()
+  elapsed = time.perf_counter() - start
+
+  if args.json:
+    print(json.dumps([f.as_dict() for f in findings]))
+  else:
+    for f in findings:
+      print('{}: {}'.format(f.kind, f))
+    counts: Dict[str, int] = {}
+    for f in findings:
+      counts[f.kind] = counts.get(f.kind, 0) + 1
+    print('{} rules, {} findings {} in {:.2f}s'.format(
+      len(analyzer), len(findings), counts, elapsed), file=sys.stderr)
+  sys.exit(1 if findings else 0)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Audit trail of generated configurations."""
+
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+from threading import Lock, Thread
+import time
+from typing import Any, Dict, List, Optional
+
+from interfaces.singleton import *
+
+class AuditLog(object, metaclass=SingletonMeta):
+  """JSONL audit sink drained by a background writer.
+
+  Records are queued in memory and written in batches, files are fsync'ed
+  at most every `fsync_interval` seconds and rotated once they reach
+  `max_bytes`. Nothing is written until `open` is called.
+  """
+  batch = 100
+  flush_interval = 1.0
+  fsync_interval = 5.0
+  max_bytes = 10 * 1024 * 1024
+  backups = 5
+  capacity = 10000
+
+  def __init__(self):
+    self.path: Optional[str] = None
+    self.dropped = 0
+    self.written = 0
+    self._queue: queue.Queue = queue.Queue(self.capacity)
+    self._lock = Lock()
+    self._thread: Optional[Thread] = None
+
+  def open(self, path: str) -> None:
+    """Start writing records to a file.
+
+    Args:
+      path -- Path to the JSONL audit file.
+    """
+    with self._lock:
+      self.path = path
+      if self._thread is None:
+        self._thread = Thread(target=self._writer, name='fwnl-audit', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+  def record(self, entry: Dict[str, Any]) -> None:
+    """Queue a record without blocking.
+
+    Records are dropped (and counted) if the queue is full or the log
+    hasn't been opened.
+
+    Args:
+      entry -- JSON serializable record.
+    """
+    if self.path is None:
+      return
+    entry = dict(entry, time=datetime.datetime.now(datetime.timezone.utc).isoformat())
+    try:
+      self._queue.put_nowait(entry)
+    except queue.Full:
+      self.dropped += 1
+
+  def close(self, timeout: float=5.0) -> None:
+    """Write pending records and stop the writer.
+
+    Args:
+      timeout -- Maximum time to wait for the writer, in seconds. (default: 5.0)
+    """
+    if self._thread is None:
+      return
+    self._queue.put(None)
+    self._thread.join(timeout)
+    self._thread = None
+
+  def stats(self) -> Dict[str, Any]:
+    """Get audit counters.
+
+    Returns:
+      Dictionary with written, dropped and queued record counts.
+    """
+    return {'written': self.written, 'dropped': self.dropped, 'queued': self._queue.qsize()}
+
+  def _writer(self) -> None:
+    """Drain the queue into the audit file."""
+    f = None
+    synced = time.monotonic()
+    running = True
+    while running:
+      batch: List[Dict[str, Any]] = []
+      try:
+        batch.append(self._queue.get(timeout=self.flush_interval))
+        while len(batch) < self.batch:
+          batch.append(self._queue.get_nowait())
+      except queue.Empty:
+        pass
+      if None in batch:
+        running = False
+        batch = [e for e in batch if e is not None]
+
+      try:
+        if batch:
+          if f is None:
+            f = open(self.path, 'a')
+          f.write(''.join(json.dumps(e, default=str) + '\n' for e in batch))
+          f.flush()
+          self.written += len(batch)
+        if f is not None and (not running or time.monotonic() - synced >= self.fsync_interval):
+          os.fsync(f.fileno())
+          synced = time.monotonic()
+        if f is not None and f.tell() >= self.max_bytes:
+          os.fsync(f.fileno())
+          f.close()
+          f = None
+          self._rotate()
+      except OSError as e:
+        logging.error('Could not write audit log %s: %s', self.path, e)
+        self.dropped += len(batch)
+        f = None
+    if f is not None:
+      f.close()
+
+  def _rotate(self) -> None:
+    """Shift `path.N` files and move the current file to `path.1`."""
+    for i in range(self.backups - 1, 0, -1):
+      src = '{}.{}'.format(self.path, i)
+      if os.path.exists(src):
+        os.replace(src, '{}.{}'.format(self.path, i + 1))
+    os.replace(self.path, '{}.1'.format(self.path))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Keyword vote tier of the intent classifier."""
+
+from collections import Counter
+import os
+import random
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from interfaces.singleton import *
+
+from .rules import *
+
+class Cascade(object, metaclass=SingletonMeta):
+  """Cheap first tier of intent classification.
+
+  Utterances are only tokenized: each keyword belonging to a single
+  intent's rules is a vote for it, as is each of its entities found by the
+  entity ruler. When the winner leads by at least `margin` votes it is
+  taken as is, otherwise the full similarity model decides. A `check`
+  fraction of the decided utterances also goes through the full model to
+  measure how often both agree.
+  """
+  # token attributes set by the tagger, parser and lemmatizer, missing from `make_doc`
+  annotations = frozenset(('POS', 'TAG', 'MORPH', 'LEMMA', 'DEP', 'ENT_TYPE', 'ENT_IOB', 'SENT_START'))
+  margin = int(os.environ.get('FWNL_CASCADE_MARGIN', 1))
+  check = float(os.environ.get('FWNL_CASCADE_CHECK', 0.05))
+
+  def __init__(self):
+    self.metrics = {'keyword': 0, 'model': 0, 'checked': 0, 'agreed': 0}
+    self._lock = Lock()
+    self._generation: Generation = None
+    self._keywords: Dict[str, str] = {}
+    self._plain = True
+
+  def vote(self, text: str, labels: List[str], margin: int=None,
+           doc: Any=None) -> Optional[Tuple[str, int]]:
+    """Classify an utterance by keyword and entity vote.
+
+    Without a processed document, entities are only voted if none of the
+    entity ruler's patterns need annotations from the pipeline.
+
+    Args:
+      text -- Utterance to be classified.
+      labels -- Labels of the intents to choose from.
+      margin -- Votes the winner must lead by. (default: `margin`)
+      doc -- spaCy document of the utterance, if already processed. (default: None)
+
+    Returns:
+      Tuple of (winning label, its votes), or None if the margin is too
+      small (or the tier is disabled, `margin` 0).
+    """
+    margin = self.margin if margin is None else margin
+    if margin <= 0:
+      self.count('model')
+      return None
+    rules = Rules()
+    generation = rules.current()
+    keywords, plain = self._index(generation)
+    if doc is None:
+      doc = rules.nlp.make_doc(text.lower())
+      if plain:
+        doc = generation.ruler(doc)
+    votes = Counter({label: 0 for label in labels})
+    for token in doc:
+      label = keywords.get(token.lower_)
+      if label in votes:
+        votes[label] += 1
+    for ent in doc.ents:
+      if ent.label_ in votes:
+        votes[ent.label_] += 1
+    ranked = votes.most_common(2) + [(None, 0)]
+    (label, first), (_, second) = ranked[0], ranked[1]
+    if first - second < margin:
+      self.count('model')
+      return None
+    self.count('keyword')
+    return label, first
+
+  def keywords(self, generation: Generation) -> Dict[str, str]:
+    """Index the keywords of a rules generation.
+
+    Args:
+      generation -- Rules generation.
+
+    Returns:
+      Mapping of keywords to the single label they belong to.
+    """
+    return self._index(generation)[0]
+
+  def _index(self, generation: Generation) -> Tuple[Dict[str, str], bool]:
+    """Get a generation's keywords, and whether its entity ruler runs on bare tokens."""
+    with self._lock:
+      if self._generation is not generation:
+        owners: Dict[str, set] = {}
+        for label, words in generation.patterns.items():
+          for word in words:
+            owners.setdefault(word.lower(), set()).add(label)
+        self._keywords = {w: next(iter(l)) for w, l in owners.items() if len(l) == 1}
+        self._plain = not any(self.annotations.intersection(k.upper() for k in token)
+                              for patterns in generation.ruler.token_patterns.values()
+                              for pattern in patterns for token in pattern)
+        self._generation = generation
+      return self._keywords, self._plain
+
+  def checking(self) -> bool:
+    """Whether a decided utterance should also go through the full model."""
+    return self.check > 0 and random.random() < self.check
+
+  def compare(self, label: str, model: str) -> None:
+    """Record whether the vote agreed with the full model.
+
+    Args:
+      label -- Label chosen by the vote.
+      model -- Label chosen by the full model.
+    """
+    with self._lock:
+      self.metrics['checked'] += 1
+      self.metrics['agreed'] += int(label == model)
+
+  def count(self, tier: str) -> None:
+    """Count an utterance decided by a tier ('keyword' or 'model')."""
+    with self._lock:
+      self.metrics[tier] += 1
+
+  def stats(self) -> Dict[str, Any]:
+    """Get tier counters.
+
+    Returns:
+      Dictionary with utterances decided by each tier, the keyword tier's
+      hit rate, and its agreement with the full model on checked ones.
+    """
+    with self._lock:
+      stats = dict(self.metrics, margin=self.margin)
+    total = stats['keyword'] + stats['model']
+    stats['hit_rate'] = stats['keyword'] / total if total else 0.0
+    stats['agreement'] = stats['agreed'] / stats['checked'] if stats['checked'] else 0.0
+    return stats
@@ -5,6 +5,7 @@
 
 from abc import ABC
 import tempfile
+from typing import Any, Set
 
 from .rules import *
 from .values import *
@@ -13,18 +14,22 @@ from .text import *
 class Command(ABC):
   """FWUnify command base class."""
   
-  def __init__(self, name: str=None, desc: str=None, values: Tuple[Value]=[]):
+  def __init__(self, name: str=None, desc: str=None, values: Tuple[Value]=[],
+               cues: Tuple[str]=()):
     """Initialize command.
     
     Args:
       name -- Name to be given to this command.
       desc -- Description of this command.
       values -- Tuple of possible values.
+      cues -- Words that must introduce this command's value in a sentence.
     """
     self.name = name
     self.desc = desc
     self.values = values
     self.value = 0
+    self.cues = cues
+    self.filled = False
     self.hint = None
     for v in self.values:
       if self.hint is None:
@@ -67,6 +72,29 @@ class Command(ABC):
       i += 1
     return [False, "Sorry, I don't understand."]
   
+  def choices(self) -> List[Tuple[int, str]]:
+    """Get the closed set of answers of this command's values.
+    
+    Returns:
+      List of (value index, answer) tuples.
+    """
+    return [(i, choice) for i, value in enumerate(self.values) for choice in value.choices()]
+
+  def choose(self, index: int, choice: str) -> Tuple[bool, str]:
+    """Set one of the answers given by `choices`, without parsing it.
+    
+    Args:
+      index -- Index of the value.
+      choice -- Chosen answer.
+    Returns:
+      Same as `verify`.
+    """
+    if not 0 <= index < len(self.values) or choice not in self.values[index].choices():
+      return [False, "Sorry, I don't understand."]
+    self.value = index
+    self.values[index].value = choice
+    return [True, 'I got it: {}'.format(self.values[index].generate())]
+
   def default(self) -> bool:
     """Sets default value.
     
@@ -74,18 +102,59 @@ class Command(ABC):
       True if default value was set, False otherwise (default value not available).
     """
     return False
+
+  def cued(self, doc: Any, start: int) -> bool:
+    """Check if a span is introduced by one of this command's cues.
+    
+    Args:
+      doc -- spaCy document the span belongs to.
+      start -- Offset of the span's first token.
+    
+    Returns:
+      True if the command has no cues, or if the span is preceded by (or
+      depends on) a cue word, False otherwise.
+    """
+    if not self.cues:
+      return True
+    prev = start - 1
+    while prev >= 0 and doc[prev].pos_ == 'DET':
+      prev -= 1
+    if prev >= 0 and doc[prev].lower_ in self.cues:
+      return True
+    return doc[start].head.lower_ in self.cues
+
+  def extract(self, doc: Any, taken: Set[int]) -> bool:
+    """Fill value from a whole utterance.
+    
+    Args:
+      doc -- spaCy document of the utterance.
+      taken -- Token offsets already used by other commands, updated in place.
+    
+    Returns:
+      True if a value was found (and set), False otherwise.
+    """
+    for i, value in enumerate(self.values):
+      for start, end, text in value.find(doc):
+        if taken.intersection(range(start, end)) or not self.cued(doc, start):
+          continue
+        taken.update(range(start, end))
+        value.value = text
+        self.value = i
+        self.filled = True
+        return True
+    return False
     
 class From(Command):
   """From derived command."""
 
   def __init__(self):
-    super().__init__('From', 'Source address/machine', [Endpoint(), Range()])
+    super().__init__('From', 'Source address/machine', [Endpoint(), Range()], ('from',))
 
 class To(Command):
   """To derived command."""
 
   def __init__(self):
-    super().__init__('To', 'Destination address/machine', [Endpoint(), Range()])
+    super().__init__('To', 'Destination address/machine', [Endpoint(), Range()], ('to',))
 
 class Block(Command):
   """Block derived command."""
@@ -97,7 +166,7 @@ class Name(Command):
   """Name derived command."""
 
   def __init__(self):
-    super().__init__('Name', 'Name to be used', [Raw()])
+    super().__init__('Name', 'Name to be used', [Raw()], ('named', 'called'))
 
   def default(self) -> bool:
     """Sets default value.
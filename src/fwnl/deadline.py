@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Time budget of a single turn."""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+import time
+from typing import Any, Dict, Iterator, Optional
+
+_active: ContextVar = ContextVar('deadline', default=None)
+
+class Deadline(object):
+  """Time budget checked between pipeline stages.
+
+  Checks are cooperative: a stage already running (e.g. the parser) is not
+  interrupted, the turn stops before the next one.
+  """
+  metrics = {'turns': 0, 'expired': 0, 'degraded': 0, 'reasked': 0, 'trimmed': 0}
+  _lock = Lock()
+
+  def __init__(self, budget: float):
+    """Initialize deadline.
+
+    Args:
+      budget -- Seconds the turn may take.
+    """
+    self.budget = budget
+    self.expires = time.monotonic() + budget
+    self.stage: Optional[str] = None
+
+  @staticmethod
+  def active() -> Optional['Deadline']:
+    """Get the deadline of the current turn, if it has one."""
+    return _active.get()
+
+  def remaining(self) -> float:
+    """Seconds left, negative once expired."""
+    return self.expires - time.monotonic()
+
+  def check(self, stage: str) -> None:
+    """Stop the turn if its budget ran out.
+
+    Args:
+      stage -- Stage about to run (e.g. a pipeline component).
+
+    Raises:
+      TimeoutError -- The budget ran out.
+    """
+    if self.stage is None and self.remaining() < 0:
+      self.stage = stage
+      Deadline.count('expired')
+    if self.stage is not None:
+      raise TimeoutError('Turn over its {:.1f}s budget before {}.'.format(self.budget, self.stage))
+
+  @contextmanager
+  def run(self) -> Iterator['Deadline']:
+    """Apply this deadline to everything run in this context.
+
+    Returns:
+      Context manager yielding this deadline.
+    """
+    Deadline.count('turns')
+    token = _active.set(self)
+    try:
+      yield self
+    finally:
+      _active.reset(token)
+
+  @contextmanager
+  def lifted(self) -> Iterator[None]:
+    """Run a fallback without this deadline (e.g. after it expired)."""
+    token = _active.set(None)
+    try:
+      yield
+    finally:
+      _active.reset(token)
+
+  @classmethod
+  def count(cls, name: str) -> None:
+    """Increment a counter (see `stats`)."""
+    with cls._lock:
+      cls.metrics[name] += 1
+
+  @classmethod
+  def stats(cls) -> Dict[str, Any]:
+    """Get deadline counters.
+
+    Returns:
+      Dictionary with turns run with a deadline, expired ones, those
+      classified by rules only (degraded) or asked again (reasked), and
+      trimmed inputs.
+    """
+    with cls._lock:
+      return dict(cls.metrics)
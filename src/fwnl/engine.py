@@ -0,0 +1,677 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Headless conversation engine."""
+
+from collections import defaultdict
+import os
+import re
+from threading import RLock
+import time
+from typing import Any, Callable, DefaultDict, Iterator, List, Tuple, Union
+
+from .text import *
+from .values import *
+from .intent import *
+from .analysis import *
+from .audit import *
+from .cascade import *
+from .deadline import *
+
+STALE = 'That choice is no longer available.'
+SLOW = 'Sorry, that took me too long to understand.'
+EDIT = re.compile(r'^\s*(?:edit|change)\s+(?:the\s+)?(\w+)', re.I)
+
+class Session(object):
+  """Conversation state of a single user."""
+  history_size = 5
+
+  def __init__(self):
+    """Initialize the session."""
+    self._lock: RLock = RLock()
+    self._data: DefaultDict[int, Any] = defaultdict(int)
+
+    self._rules = Rules()
+    self._intents = [ACL(), TrafficShaping()]
+    self._rules.setup()
+
+  def __getitem__(self, key: int) -> Any:
+    """Get session item.
+    
+    Args:
+      key -- Key number of the item.
+      
+    Returns:
+      Session item.
+    """
+    with self._lock:
+      return self._data.get(key, None)
+  
+  def __setitem__(self, key: int, value: Any) -> None:
+    """Set session item.
+    
+    Args:
+      key -- Key number of the item.
+      value -- New value for the item.
+    """
+    with self._lock:
+      self._data[key] = value
+
+  def __delitem__(self, key: int) -> None:
+    """Delete session item.
+    
+    Args:
+      key -- Key number of the item.
+    """
+    with self._lock:
+      del self._data[key]
+  
+  @property
+  def state(self) -> str:
+    """Get the current state of the user."""
+    return self[0]
+
+  @state.setter
+  def state(self, value: str) -> None:
+    """Set the current state of the user."""
+    self[0] = value
+
+  @state.deleter
+  def state(self) -> None:
+    """Delete the current state of the user."""
+    del self[0]
+
+  @property
+  def intents(self) -> List[Intent]:
+    """Get all available intents."""
+    with self._lock:
+      return self._intents
+  
+  @property
+  def intent(self) -> Intent:
+    """Get the current intent of the user."""
+    return self[1]
+
+  @intent.setter
+  def intent(self, value: Intent) -> None:
+    """Set the current intent of the user."""
+    self[1] = value
+  
+  @intent.deleter
+  def intent(self) -> None:
+    """Delete the current intent of the user."""
+    del self[1]
+
+  @property
+  def command(self) -> str:
+    """Get the current command of the user."""
+    return self[2]
+  
+  @command.setter
+  def command(self, value: str) -> None:
+    """Set the current command of the user."""
+    self[2] = value
+
+  @command.deleter
+  def command(self) -> None:
+    """Delete the current command of the user."""
+    del self[2]
+
+  @property
+  def counter(self) -> int:
+    """Get the current counter of the user."""
+    return self[3]
+  
+  @counter.setter
+  def counter(self, value: int) -> None:
+    """Set the current counter of the user."""
+    self[3] = value
+  
+  @counter.deleter
+  def counter(self) -> None:
+    """Delete the current counter of the user."""
+    del self[3]
+  
+  @property
+  def started(self) -> float:
+    """Get the time (epoch seconds) the current conversation started."""
+    return self[4]
+
+  @started.setter
+  def started(self, value: float) -> None:
+    """Set the time the current conversation started."""
+    self[4] = value
+
+  @property
+  def queue(self) -> List[Intent]:
+    """Get the intents waiting for their own conversation."""
+    return self[5] or []
+
+  @queue.setter
+  def queue(self, value: List[Intent]) -> None:
+    """Set the intents waiting for their own conversation."""
+    self[5] = value
+
+  @property
+  def history(self) -> List[Intent]:
+    """Get the last completed intents, oldest first."""
+    return self[6] or []
+
+  @history.setter
+  def history(self, value: List[Intent]) -> None:
+    """Set the last completed intents, keeping at most `history_size`."""
+    self[6] = value[-self.history_size:]
+
+  def restore(self, other: 'Session') -> None:
+    """Take over the state of other (e.g. spilled) session.
+
+    Args:
+      other -- Session to copy the state from.
+    """
+    with self._lock:
+      self._data.update(other._data)
+
+  def clear(self) -> None:
+    """Clear the session."""
+    del self.state
+    del self.intent
+    del self.command
+    del self.counter
+    self.queue = []
+
+class Reply(str):
+  """Response offering answers the user may pick instead of typing."""
+
+  def __new__(cls, text: str, choices: List[Tuple[str, str]]=()) -> 'Reply':
+    """Create reply.
+
+    Args:
+      text -- Response text.
+      choices -- List of (label, data) tuples, data is given to `Engine.choose`.
+    """
+    reply = super().__new__(cls, text)
+    reply.choices = list(choices)
+    return reply
+
+class Engine(object):
+  """Intent classification, slot filling and the conversation state machine.
+
+  The engine keeps no state of its own: conversations live in `Session`
+  objects, so a single engine can be shared by any number of threads. Each
+  call runs against a single rules generation.
+  """
+  max_length = int(os.environ.get('FWNL_MAX_LENGTH', 500))
+
+  def __init__(self, intents: Callable[[], List[Intent]]=None):
+    """Initialize engine.
+
+    Args:
+      intents -- Factory of fresh intents to choose from. (default: ACL and
+                 Traffic Shaping)
+    """
+    self.intents = intents or (lambda: [ACL(), TrafficShaping()])
+
+  def session(self) -> Session:
+    """Create a new, empty session."""
+    return Session()
+
+  def classify(self, text: str) -> Tuple[Intent, float]:
+    """Get the closest intent.
+
+    Args:
+      text -- Text to be analyzed.
+
+    Returns:
+      A new instance of the closest intent and its score.
+    """
+    with Rules().pinned():
+      return self._classify(text)
+
+  def _classify(self, text: str, doc: Any=None) -> Tuple[Intent, float]:
+    """Get the closest intent, by keyword vote if decisive (see `Cascade`).
+    See `classify` for more details; the score of a vote is its number of
+    votes, not a similarity."""
+    cascade = Cascade()
+    intents = self.intents()
+    voted = cascade.vote(text, [intent.label for intent in intents], doc=doc)
+    if voted is None:
+      return self._similarity(text, doc, intents)
+    label, votes = voted
+    intent = next(intent for intent in intents if intent.label == label)
+    if cascade.checking():
+      cascade.compare(label, self._similarity(text, doc, self.intents())[0].label)
+    return intent, float(votes)
+
+  def _similarity(self, text: str, doc: Any, intents: List[Intent]) -> Tuple[Intent, float]:
+    """Get the closest intent by vector similarity, keywords and entities."""
+    rules = Rules()
+    text = Text(text, doc)
+    closest = None
+    closest_sim = -1
+    for intent in intents:
+      kw = rules.patterns[intent.label]
+      similarity = text.similarity(Text(intent.desc)) + text.match(kw)
+      for ent in text.docp.ents:
+        if ent.label_ == intent.label:
+          similarity += 1
+      if similarity > closest_sim:
+        closest = intent
+        closest_sim = similarity
+    return closest, closest_sim
+
+  def segment(self, text: str) -> List[str]:
+    """Split an utterance into clauses, one per request.
+
+    Clauses are cut at coordinated verbs ("block telnet from the classroom
+    and limit http to 10mbps"), using the dependency parse.
+
+    Args:
+      text -- Utterance to be split.
+
+    Returns:
+      List of clause texts, the whole text if there's a single clause.
+    """
+    with Rules().pinned():
+      return [doc.text for doc in self._segment(text)]
+
+  def _segment(self, text: str) -> List[Any]:
+    """Split an utterance into clause documents, parsing it once.
+    See `segment` for more details."""
+    with Rules().acquire() as pipeline:
+      doc = pipeline(text)
+    cuts = []
+    for token in doc:
+      if token.dep_ == 'conj' and token.pos_ == 'VERB' and token.head.pos_ == 'VERB':
+        cc = [c for c in token.head.children if c.dep_ == 'cc' and token.head.i < c.i < token.i]
+        cuts.append((cc[-1].i, cc[-1].i + 1) if cc else (token.i, token.i))
+    if not cuts:
+      return [doc]
+    clauses, start = [], 0
+    for end, next_start in sorted(cuts) + [(len(doc), len(doc))]:
+      span = doc[start:end]
+      while len(span) > 0 and span[-1].is_punct:
+        span = span[:-1]
+      if len(span) > 0:
+        clauses.append(span.as_doc(copy_user_data=True))
+      start = next_start
+    return clauses
+
+  def _understand(self, text: str) -> List[Intent]:
+    """Classify and fill one intent per clause of an utterance."""
+    intents = []
+    for doc in self._segment(text):
+      intent, _ = self._classify(doc.text, doc)
+      intent.fill(doc.text, doc)
+      intents.append(intent)
+    return intents
+
+  def fill(self, intent: Union[str, Intent], text: str) -> Intent:
+    """Fill an intent's commands with values found in an utterance.
+
+    Args:
+      intent -- Intent, or label of a new intent, to be filled.
+      text -- Utterance to extract values from.
+
+    Returns:
+      The filled intent (see `Command.filled`).
+
+    Raises:
+      KeyError -- Unknown intent label.
+    """
+    if isinstance(intent, str):
+      intent = {i.label: i for i in self.intents()}[intent.upper()]
+    with Rules().pinned():
+      intent.fill(text)
+    return intent
+
+  def compile(self, utterance: str) -> str:
+    """Generate a configuration from a single utterance.
+
+    Each clause (see `segment`) becomes an intent, and commands not found
+    in it take their default value.
+
+    Args:
+      utterance -- Text describing the whole intent(s).
+
+    Returns:
+      FWUnify compatible intents string.
+
+    Raises:
+      ValueError -- Some command has neither a value nor a default.
+    """
+    with Rules().pinned():
+      intents = self._understand(utterance)
+    for intent in intents:
+      missing = [c.name for c in intent.commands if not c.filled and not c.default()]
+      if missing:
+        raise ValueError('Missing {} for {}.'.format(', '.join(missing), intent.label))
+    return ''.join(intent.generate() for intent in intents)
+
+  def classify_batch(self, texts: List[str]) -> List[Tuple[Intent, float]]:
+    """Classify several texts against the same rules generation.
+    See `classify` for more details."""
+    with Rules().pinned():
+      return [self._classify(text) for text in texts]
+
+  def compile_batch(self, utterances: List[str]) -> List[Union[str, ValueError]]:
+    """Compile several utterances against the same rules generation.
+    See `compile` for more details.
+
+    Returns:
+      Configuration string, or the `ValueError` raised, for each utterance.
+    """
+    results = []
+    with Rules().pinned():
+      for utterance in utterances:
+        try:
+          results.append(self.compile(utterance))
+        except ValueError as e:
+          results.append(e)
+    return results
+
+  def step(self, session: Session, text: str, channel: str=None, budget: float=None) -> List[str]:
+    """Advance a conversation with the user's text.
+
+    Turns of the same session are serialized, different sessions run
+    concurrently. Text beyond `max_length` characters is dropped.
+
+    Args:
+      session -- Conversation state, updated in place.
+      text -- Text to be processed.
+      channel -- Channel recorded in the audit trail. (default: None)
+      budget -- Seconds the turn may take before falling back to rule-only
+                classification or asking again (see `Deadline`). (default: None)
+
+    Returns:
+      Responses to be sent to the user, in order.
+    """
+    return list(self.iterate(session, text, channel, budget))
+
+  def iterate(self, session: Session, text: str, channel: str=None,
+              budget: float=None) -> Iterator[str]:
+    """Advance a conversation, yielding each response as soon as it is produced.
+    See `step` for more details; the session stays locked, and the rules
+    generation pinned, until the iterator is exhausted or closed.
+
+    Returns:
+      Iterator of responses.
+    """
+    text = self.trim(text)
+    with session._lock, Rules().pinned():
+      if budget is None:
+        yield from self._step(session, text, channel, time.perf_counter())
+        return
+      with Deadline(budget).run() as deadline:
+        for response in self._step(session, text, channel, time.perf_counter()):
+          paused = time.monotonic()
+          yield response
+          deadline.expires += time.monotonic() - paused  # sending doesn't count
+
+  def trim(self, text: str) -> str:
+    """Cut text to `max_length` characters, at a word boundary if possible.
+
+    Args:
+      text -- Text to be trimmed.
+
+    Returns:
+      Trimmed text.
+    """
+    if len(text) <= self.max_length:
+      return text
+    Deadline.count('trimmed')
+    cut = text[:self.max_length]
+    return cut.rsplit(None, 1)[0] if ' ' in cut.strip() else cut
+
+  def step_batch(self, turns: List[Tuple[Session, str]]) -> List[List[str]]:
+    """Advance several conversations against the same rules generation.
+    See `step` for more details."""
+    with Rules().pinned():
+      return [self.step(session, text) for session, text in turns]
+
+  def choose(self, session: Session, data: str, channel: str=None) -> List[str]:
+    """Advance a conversation with one of the choices of a previous reply.
+
+    Choices are applied without any language processing; choices of
+    questions already answered are refused.
+
+    Args:
+      session -- Conversation state, updated in place.
+      data -- Data of the chosen answer (see `Reply.choices`).
+      channel -- Channel recorded in the audit trail. (default: None)
+
+    Returns:
+      Responses to be sent to the user, in order.
+    """
+    with session._lock, Rules().pinned():
+      return list(self._step(session, '', channel, time.perf_counter(), data))
+
+  def intents_reply(self, text: str) -> Reply:
+    """Offer every intent as a choice.
+
+    Args:
+      text -- Reply text.
+
+    Returns:
+      Reply with one choice per intent.
+    """
+    return Reply(text, [(i.desc, 'intent:' + i.label) for i in self.intents()])
+
+  def _ask(self, session: Session) -> Reply:
+    """Ask the session's current question, with its closed set of answers."""
+    if isinstance(session.command, Confirm):
+      return Reply(session.command.question(), [('Yes', 'confirm:yes'), ('No', 'confirm:no')])
+    return Reply(session.command.question(), [
+      (choice, 'q{}:{}:{}'.format(session.counter, i, choice))
+      for i, choice in session.command.choices()])
+
+  def skip(self, session: Session, channel: str=None) -> List[str]:
+    """Skip the session's current question, using its default value.
+
+    Args:
+      session -- Conversation state, updated in place.
+      channel -- Channel recorded in the audit trail. (default: None)
+
+    Returns:
+      Responses to be sent to the user, in order.
+    """
+    with session._lock:
+      if session.state not in ('questions', 'edit'):
+        return []
+      if not session.command.default():
+        return ["You can't skip this question."]
+      if session.state == 'edit':
+        with Rules().pinned():
+          return list(self._finish(session, channel, time.perf_counter(), [session.counter]))
+      session.state = 'next_command'
+      return self.step(session, '', channel)
+
+  def _step(self, session: Session, text: str, channel: str, started: float,
+            choice: str=None) -> Iterator[str]:
+    """Run the conversation state machine.
+    See `step` and `choose` for more details."""
+    if session.state is None:
+      session.started = time.time()
+      edit = EDIT.match(text) if choice is None else None
+      # only the last intent's commands are edited, other "change ..." requests are new ones
+      if edit is not None and self._editable(session, edit.group(1)):
+        yield from self._edit(session, edit.group(1))
+        return
+      if choice is None:
+        try:
+          intents = self._understand(text)
+        except TimeoutError:
+          intents = self._fallback(text)
+        if not intents:
+          Deadline.count('reasked')
+          yield self.intents_reply(SLOW + ' Which of these do you want to do?')
+          return
+        session.intent, session.queue = intents[0], intents[1:]
+        if session.queue:
+          yield "I see {} requests in there, let's go through them one at a time.".format(len(intents))
+      else:
+        intents = {'intent:' + i.label: i for i in self.intents()}
+        if choice not in intents:
+          yield STALE
+          return
+        session.intent = intents[choice]
+        choice = 'confirm:yes'  # picking an intent confirms it
+      session.command = Confirm(session.intent.label, session.intent.desc)
+      session.state = 'confirm_intent'
+      if choice is None:
+        yield self._ask(session)
+        return
+    if session.state == 'confirm_intent':
+      if choice is not None and not choice.startswith('confirm:'):
+        yield STALE
+        return
+      try:
+        confirmed = choice == 'confirm:yes' or (choice is None and session.command.verify(text))
+      except TimeoutError:
+        yield from self._reask(session)
+        return
+      if confirmed:
+        yield session.intent.question()
+        filled = [c for c in session.intent.commands if c.filled]
+        if len(filled) > 0:
+          yield 'From what you said, I already got: {}'.format(', '.join(
+            '{} {}'.format(c.name, c.values[c.value].generate()) for c in filled))
+        session.state = 'next_command'
+        session.counter = -1
+      else:
+        yield "Ok, we will not do that."
+        session.state = None
+        yield from self._dequeue(session)
+        return
+    if session.state in ('questions', 'edit'):
+      if choice is None:
+        try:
+          success, msg = session.command.verify(text)
+        except TimeoutError:
+          yield from self._reask(session)
+          return
+      else:
+        question, _, answer = choice.partition(':')
+        index, _, answer = answer.partition(':')
+        if question != 'q{}'.format(session.counter) or not index.isdigit():
+          yield STALE
+          return
+        success, msg = session.command.choose(int(index), answer)
+      yield msg
+      if not success:
+        return
+      session.intent.commands[session.counter] = session.command
+      if session.state == 'edit':
+        yield from self._finish(session, channel, started, [session.counter])
+        return
+      session.state = 'next_command'
+    if session.state == 'next_command':
+      session.counter += 1
+      while (session.counter < len(session.intent.commands) and
+             session.intent.commands[session.counter].filled):
+        session.counter += 1
+      if session.counter < len(session.intent.commands):
+        session.command = session.intent.commands[session.counter]
+        yield self._ask(session)
+        session.state = 'questions'
+      else:
+        yield from self._finish(session, channel, started)
+
+  def _fallback(self, text: str) -> List[Intent]:
+    """Classify an utterance by keyword vote only, once its turn ran out of time.
+
+    Args:
+      text -- Utterance to be classified.
+
+    Returns:
+      List with the voted (unfilled) intent, or an empty list if no intent
+      leads the vote.
+    """
+    intents = self.intents()
+    with Deadline.active().lifted():
+      voted = Cascade().vote(text, [intent.label for intent in intents], margin=1)
+    if voted is None:
+      return []
+    Deadline.count('degraded')
+    return [intent for intent in intents if intent.label == voted[0]]
+
+  def _reask(self, session: Session) -> Iterator[str]:
+    """Ask the current question again, once its turn ran out of time."""
+    Deadline.count('reasked')
+    yield SLOW
+    yield self._ask(session)
+
+  def _finish(self, session: Session, channel: str, started: float,
+              changed: List[int]=None) -> Iterator[str]:
+    """Generate the configuration of a completed intent and keep it in the history.
+
+    Args:
+      session -- Conversation state, updated in place.
+      channel -- Channel recorded in the audit trail.
+      started -- Turn start (`time.perf_counter`).
+      changed -- Indexes of the commands edited, if editing a previous
+                 intent (see `Intent.generate`). (default: None)
+
+    Returns:
+      Iterator of responses.
+    """
+    config = session.intent.generate(changed)
+    yield "Here's your final configuration:"
+    yield config
+    findings = Ruleset().check(Rule.from_intent(session.intent, Ruleset().resolver))
+    for finding in findings:
+      yield 'Warning: {}.'.format(finding)
+    AuditLog().record({
+      'channel': channel,
+      'intent': session.intent.label,
+      'values': {c.name: c.values[c.value].generate() for c in session.intent.commands},
+      'config': config,
+      'findings': [finding.as_dict() for finding in findings],
+      'edited': [session.intent.commands[i].name for i in changed or ()],
+      'turn_ms': round((time.perf_counter() - started) * 1000, 1),
+      'conversation_s': round(time.time() - (session.started or time.time()), 1)})
+    history = session.history
+    session.history = (history[:-1] if changed is not None else history) + [session.intent]
+    session.state = None
+    yield from self._dequeue(session)
+
+  def _editable(self, session: Session, name: str) -> bool:
+    """Whether a word names a command of the last completed intent.
+
+    Args:
+      session -- Conversation state.
+      name -- Word following "edit" or "change" (e.g. 'to').
+
+    Returns:
+      True if the command can be edited.
+    """
+    history = session.history
+    return bool(history) and name.lower() in [c.name.lower() for c in history[-1].commands]
+
+  def _edit(self, session: Session, name: str) -> Iterator[str]:
+    """Ask again one command of the last completed intent (see `_editable`).
+
+    Args:
+      session -- Conversation state, updated in place.
+      name -- Name of the command to be edited (e.g. 'to').
+
+    Returns:
+      Iterator of responses.
+    """
+    intent = session.history[-1]
+    session.intent = intent
+    session.counter = [c.name.lower() for c in intent.commands].index(name.lower())
+    session.command = intent.commands[session.counter]
+    session.state = 'edit'
+    yield self._ask(session)
+
+  def _dequeue(self, session: Session) -> Iterator[str]:
+    """Start the conversation of the next queued intent, if any."""
+    queue = session.queue
+    if not queue:
+      return
+    session.intent, session.queue = queue[0], queue[1:]
+    session.started = time.time()
+    session.command = Confirm(session.intent.label, session.intent.desc)
+    session.state = 'confirm_intent'
+    yield 'Next request:'
+    yield self._ask(session)
@@ -25,21 +25,50 @@ class Intent(ABC):
     self.label = label
     self.desc = desc
     self.commands = commands
+    self.lines: List[str] = None
     r = Rules()
     r.add(rules)
 
-  def generate(self) -> str:
+  def generate(self, changed: List[int]=None) -> str:
     """Generate intent.
     
+    Args:
+      changed -- Indexes of the commands changed since the last call, only
+                 their lines are generated again. (default: None, all of them)
+
     Returns:
       FWUnify compatible intent string.
     """
+    if changed is None or self.lines is None or len(self.lines) != len(self.commands):
+      self.lines = [c.generate() for c in self.commands]
+    else:
+      for i in changed:
+        self.lines[i] = self.commands[i].generate()
     s = '\n\ndefine intent {}:\n'.format(self.label)
-    for c in self.commands:
-      s += c.generate()
+    s += ''.join(self.lines)
     s += "add{}middlebox('cisco-1','iptables-1','openflow-1')\n".format(IDENT_CHAR * IDENT_LEVEL)
     return s.lower()
 
+  def fill(self, text: str, doc: Any=None) -> List[Command]:
+    """Pre-fill commands with values found in a single utterance.
+    
+    Args:
+      text -- Utterance to extract values from.
+      doc -- spaCy document of the utterance, if already processed. (default: None)
+    
+    Returns:
+      List of commands that were filled.
+    """
+    if doc is None:
+      with Rules().acquire() as pipeline:
+        doc = pipeline(text)
+    taken = set()
+    for c in self.commands:
+      c.filled = False
+    # commands introduced by cue words go first, so they claim their spans
+    ordered = sorted(self.commands, key=lambda c: not c.cues)
+    return [c for c in ordered if c.extract(doc, taken)]
+
   def question(self) -> str:
     """Generate question.
     
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Host and group inventory."""
+
+import logging
+import os
+from threading import RLock
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from interfaces.singleton import *
+from .distance import *
+
+DEFAULT_HOSTS = ['any', 'laboratory', 'server', 'professor', 'secretary', 'classroom']
+
+class Index(object):
+  """Immutable lookup tables built from inventory entries."""
+
+  def __init__(self, entries: Dict[str, List[str]], margin: int=1):
+    """Build the index.
+
+    Args:
+      entries -- Mapping of (possibly multi-token) names to addresses.
+      margin -- Maximum edit distance tolerated per token. (default: 1)
+    """
+    self.entries = entries
+    self.margin = margin
+    # token trie of names, `None` key marks the end of a name
+    self.trie: Dict[str, dict] = {}
+    self.words: Set[str] = set()
+    for name in entries:
+      node = self.trie
+      for word in name.split():
+        self.words.add(word)
+        node = node.setdefault(word, {})
+      node[None] = name
+    # deletion neighbourhood of every word, for constant time typo lookup
+    self.deletes: Dict[str, Set[str]] = {}
+    for word in self.words:
+      for variant in self.variants(word, margin):
+        self.deletes.setdefault(variant, set()).add(word)
+
+  @staticmethod
+  def variants(word: str, margin: int) -> Set[str]:
+    """Every string obtained by deleting up to `margin` characters."""
+    found = {word}
+    frontier = {word}
+    for _ in range(margin):
+      frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w)) if len(w) > 1}
+      found |= frontier
+    return found
+
+  def correct(self, word: str) -> Optional[str]:
+    """Find the inventory word closest to a possibly misspelled one.
+
+    Args:
+      word -- Lower case word.
+
+    Returns:
+      Inventory word, or None if none is within the margin.
+    """
+    if word in self.words:
+      return word
+    if len(word) < 4:
+      return None
+    best, best_dist = None, self.margin + 1
+    candidates = set()
+    for variant in self.variants(word, self.margin):
+      candidates |= self.deletes.get(variant, set())
+    for candidate in sorted(candidates):
+      dist = distance(word, candidate, dl=True)
+      if dist < best_dist:
+        best, best_dist = candidate, dist
+    return best
+
+class Inventory(object, metaclass=SingletonMeta):
+  """Host and group aliases, reloaded whenever their file changes.
+
+  The file has one entry per line, `name = address [address ...]`, where the
+  name may have several words and addresses are optional. Lines starting
+  with '#' are ignored.
+  """
+  path: Optional[str] = os.environ.get('FWNL_INVENTORY')
+  interval = 5.0
+
+  def __init__(self):
+    self._lock = RLock()
+    self._mtime = None
+    self._checked = 0.0
+    self.index = Index({name: [] for name in DEFAULT_HOSTS})
+    self.reload()
+
+  def load(self, path: str) -> None:
+    """Use an inventory file.
+
+    Args:
+      path -- Path to the inventory file.
+    """
+    with self._lock:
+      self.path = path
+      self._mtime = None
+      self.reload()
+
+  def reload(self, force: bool=False) -> bool:
+    """Rebuild the index if the inventory file changed.
+
+    Args:
+      force -- Rebuild even if the file didn't change. (default: False)
+
+    Returns:
+      True if the index was rebuilt, False otherwise.
+    """
+    if self.path is None:
+      return False
+    with self._lock:
+      self._checked = time.monotonic()
+      try:
+        mtime = os.stat(self.path).st_mtime
+      except OSError as e:
+        logging.error('Could not read inventory %s: %s', self.path, e)
+        return False
+      if mtime == self._mtime and not force:
+        return False
+      with open(self.path) as f:
+        entries = self.parse(f.read().splitlines())
+      self.index = Index(entries)  # atomic swap, lookups in flight keep the old one
+      self._mtime = mtime
+      logging.info('Loaded %d inventory entries from %s.', len(entries), self.path)
+      return True
+
+  @staticmethod
+  def parse(lines: Iterable[str]) -> Dict[str, List[str]]:
+    """Parse inventory lines.
+
+    Args:
+      lines -- Lines of the inventory file.
+
+    Returns:
+      Mapping of lower case names to addresses.
+    """
+    entries = {'any': []}
+    for line in lines:
+      line = line.strip()
+      if not line or line.startswith('#'):
+        continue
+      name, _, addresses = line.partition('=')
+      name = ' '.join(name.lower().split())
+      if name:
+        entries[name] = addresses.split()
+    return entries
+
+  def _current(self) -> Index:
+    """Get the current index, checking the file at most every `interval` seconds."""
+    if self.path is not None and time.monotonic() - self._checked > self.interval:
+      self.reload()
+    return self.index
+
+  def find(self, words: List[str]) -> List[Tuple[int, int, str]]:
+    """Find inventory names in a sequence of words.
+
+    Longest names win, and each word may be at most `margin` edits away from
+    the inventory spelling.
+
+    Args:
+      words -- Lower case words (tokens) to search.
+
+    Returns:
+      List of (start, end, name) tuples.
+    """
+    index = self._current()
+    found = []
+    i = 0
+    while i < len(words):
+      node, match = index.trie, None
+      for j in range(i, len(words)):
+        word = index.correct(words[j])
+        if word is None or word not in node:
+          break
+        node = node[word]
+        if None in node:
+          match = (i, j + 1, node[None])
+      if match is not None:
+        found.append(match)
+        i = match[1]
+      else:
+        i += 1
+    return found
+
+  def resolve(self, name: str) -> Optional[str]:
+    """Get the first address of an inventory name.
+
+    Args:
+      name -- Inventory name.
+
+    Returns:
+      Address string, or None if the name has no address.
+    """
+    addresses = self._current().entries.get(name.lower(), [])
+    return addresses[0] if addresses else None
+
+  @property
+  def names(self) -> List[str]:
+    """All inventory names."""
+    return list(self._current().entries)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Runtime metrics registry."""
+
+import logging
+from threading import Lock
+from typing import Any, Callable, Dict
+
+from interfaces.singleton import *
+
+class Metrics(object, metaclass=SingletonMeta):
+  """Registry of components exporting numeric counters and gauges."""
+
+  def __init__(self):
+    self._providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+    self._lock = Lock()
+
+  def register(self, name: str, provider: Callable[[], Dict[str, Any]]) -> None:
+    """Register (or replace) a metrics provider.
+
+    Args:
+      name -- Component name, used as metric prefix.
+      provider -- Function returning a dictionary of numbers, or of
+                  dictionaries of numbers keyed by label value.
+    """
+    with self._lock:
+      self._providers[name] = provider
+
+  def collect(self) -> Dict[str, Dict[str, Any]]:
+    """Collect metrics of every registered component.
+
+    Returns:
+      Dictionary of component names to their metrics.
+    """
+    with self._lock:
+      providers = dict(self._providers)
+    collected = {}
+    for name, provider in providers.items():
+      try:
+        collected[name] = provider()
+      except Exception:
+        logging.exception('Could not collect %s metrics.', name)
+    return collected
+
+  def render(self) -> str:
+    """Render metrics in Prometheus text format.
+
+    Returns:
+      One `fwnl_<component>_<metric>` sample per line.
+    """
+    lines = []
+    for name, metrics in self.collect().items():
+      for key, value in metrics.items():
+        metric = 'fwnl_{}_{}'.format(name, key)
+        if isinstance(value, dict):
+          for label, v in value.items():
+            if isinstance(v, (int, float)):
+              lines.append('{}{{key="{}"}} {}'.format(metric, str(label).replace('"', "'"), v))
+        elif isinstance(value, (int, float)):
+          lines.append('{} {}'.format(metric, value))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Match counts and sampled cost of the entity ruler and matcher patterns."""
+
+from spacy.matcher import Matcher
+
+import argparse
+from collections import Counter, defaultdict
+import json
+import os
+import random
+import statistics
+import sys
+from threading import Lock
+import time
+from typing import Any, DefaultDict, Dict, Hashable, Iterable, List, Tuple
+
+from interfaces.singleton import *
+
+class PatternStats(object, metaclass=SingletonMeta):
+  """Matches per label, and cost of each pattern on a sample of documents.
+
+  Labels are counted on every document. On a `sample` fraction of them,
+  each pattern is also run alone with its own matcher and timed; only one
+  document is measured at a time, others are skipped meanwhile.
+  """
+  sample = float(os.environ.get('FWNL_PATTERN_SAMPLE', 0.01))
+
+  def __init__(self):
+    self.docs: Counter = Counter()
+    self.matches: Counter = Counter()
+    self.sampled: Counter = Counter()
+    self.costs: DefaultDict[Tuple[str, str, int], float] = defaultdict(float)
+    self.hits: Counter = Counter()
+    self.patterns: Dict[Tuple[str, str, int], Any] = {}
+    self._matchers: Dict[str, Tuple[Hashable, List[Tuple[str, int, Any]]]] = {}
+    self._lock = Lock()
+    self._measuring = Lock()
+
+  def sampling(self) -> bool:
+    """Whether the next document should be measured."""
+    return self.sample > 0 and random.random() < self.sample
+
+  def count(self, source: str, labels: Iterable[str]) -> None:
+    """Count the matches found in a document.
+
+    Args:
+      source -- Patterns matched ('ruler' or 'matcher').
+      labels -- Label of each match.
+    """
+    with self._lock:
+      self.docs[source] += 1
+      for label in labels:
+        self.matches[source, label] += 1
+
+  def measure(self, source: str, version: Hashable, specs: Dict[str, List[Any]],
+              vocab: Any, doc: Any) -> None:
+    """Time each pattern alone against a document.
+
+    Args:
+      source -- Patterns matched ('ruler' or 'matcher').
+      version -- Version of `specs`, single pattern matchers are rebuilt when it changes.
+      specs -- Mapping of labels to token patterns.
+      vocab -- Vocab of the document.
+      doc -- spaCy document.
+    """
+    if not self._measuring.acquire(blocking=False):
+      return
+    try:
+      matchers = self._single(source, version, specs, vocab)
+      results = []
+      for label, i, matcher in matchers:
+        start = time.perf_counter()
+        found = len(matcher(doc))
+        results.append(((source, label, i), time.perf_counter() - start, found))
+    finally:
+      self._measuring.release()
+    with self._lock:
+      self.sampled[source] += 1
+      for key, seconds, found in results:
+        self.costs[key] += seconds
+        self.hits[key] += found
+
+  def _single(self, source: str, version: Hashable, specs: Dict[str, List[Any]],
+              vocab: Any) -> List[Tuple[str, int, Any]]:
+    """Get one matcher per pattern, built again when the patterns change."""
+    cached = self._matchers.get(source)
+    if cached is not None and cached[0] == version:
+      return cached[1]
+    matchers, single = [], {}
+    for label, patterns in specs.items():
+      for i, pattern in enumerate(patterns):
+        matcher = Matcher(vocab)
+        matcher.add(label, [pattern])
+        matchers.append((label, i, matcher))
+        single[source, label, i] = pattern
+    with self._lock:
+      # costs of the previous patterns no longer apply
+      for key in [k for k in self.patterns if k[0] == source]:
+        del self.patterns[key]
+        self.costs.pop(key, None)
+        self.hits.pop(key, None)
+      self.patterns.update(single)
+      self.sampled[source] = 0
+    self._matchers[source] = (version, matchers)
+    return matchers
+
+  def report(self, factor: float=3.0) -> List[Dict[str, Any]]:
+    """List patterns with their matches and cost.
+
+    Args:
+      factor -- Patterns costing more than `factor` times the median are
+                expensive. (default: 3.0)
+
+    Returns:
+      List of dictionaries with source, label, pattern index and pattern,
+      label matches (all documents), pattern matches and mean cost (on the
+      sampled documents, us per document), and whether it is dead (never
+      matched a sampled document) or expensive; most expensive first.
+    """
+    with self._lock:
+      rows = []
+      for key, pattern in self.patterns.items():
+        source, label, i = key
+        sampled = self.sampled[source]
+        rows.append({
+          'source': source, 'label': label, 'index': i, 'pattern': pattern,
+          'label_matches': self.matches[source, label], 'matches': self.hits[key],
+          'sampled': sampled, 'cost_us': self.costs[key] / sampled * 1e6 if sampled else 0.0})
+    median = statistics.median(r['cost_us'] for r in rows) if rows else 0.0
+    for row in rows:
+      row['dead'] = row['sampled'] > 0 and row['matches'] == 0
+      row['expensive'] = median > 0 and row['cost_us'] > factor * median
+    return sorted(rows, key=lambda r: -r['cost_us'])
+
+  def stats(self) -> Dict[str, Any]:
+    """Get match counters.
+
+    Returns:
+      Dictionary with documents seen and measured per source, and matches
+      per 'source:label'.
+    """
+    with self._lock:
+      return {
+        'docs': dict(self.docs),
+        'sampled': dict(self.sampled),
+        'matches': {'{}:{}'.format(s, l): n for (s, l), n in self.matches.items()}}
+
+def main():
+  """Main function."""
+  parser = argparse.ArgumentParser(description='Find dead and expensive entity ruler and matcher patterns.')
+  parser.add_argument('texts', nargs='*',
+                      help='text files with one utterance per line (default: built-in samples)')
+  parser.add_argument('--factor', type=float, default=3.0,
+                      help='patterns costing this many times the median are expensive (default: 3.0)')
+  parser.add_argument('--all', action='store_true', help='list every pattern, not only dead and expensive ones')
+  parser.add_argument('--json', action='store_true', help='print patterns as JSON')
+  args = parser.parse_args()
+
+  from .engine import Engine, Rules
+  from .vectors import SAMPLES
+  texts = []
+  for path in args.texts:
+    with open(path) as f:
+      texts.extend(line.strip() for line in f if line.strip())
+  texts = texts or [text for _, text in SAMPLES]
+
+  PatternStats.sample = 1.0
+  rules = Rules()
+  rules.setup()
+  for intent in Engine().intents():
+    for command in intent.commands:
+      for value in command.values:
+        value.setup()
+  start = time.perf_counter()
+  for text in texts:
+    with rules.acquire() as pipeline:
+      pipeline.match(pipeline(text.lower()))
+  elapsed = time.perf_counter() - start
+
+  rows = PatternStats().report(args.factor)
+  if not args.all:
+    rows = [r for r in rows if r['dead'] or r['expensive']]
+  if args.json:
+    print(json.dumps(rows))
+  else:
+    for r in rows:
+      flags = ','.join(f for f in ('dead', 'expensive') if r[f]) or '-'
+      print('{:<9} {:<8} {:<12} #{:<3} {:>6} matches ({:>6} for label) {:>9.1f} us  {}'.format(
+        flags, r['source'], r['label'], r['index'], r['matches'], r['label_matches'], r['cost_us'],
+        json.dumps(r['pattern'])[:80]))
+  print('{} utterances in {:.2f}s'.format(len(texts), elapsed), file=sys.stderr)
+
+if __name__ == '__main__':
+  main()
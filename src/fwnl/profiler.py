@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""On-demand profiling of a single turn."""
+
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import cProfile
+import datetime
+import io
+import logging
+import os
+import pstats
+import re
+from threading import Lock
+import time
+import tracemalloc
+from typing import DefaultDict, Iterator, Optional
+
+_active: ContextVar = ContextVar('profile', default=None)
+_lock = Lock()
+
+class Profile(object):
+  """cProfile and tracemalloc capture of one turn, with pipeline component timings.
+
+  Only one profile runs at a time. cProfile follows the thread running the
+  turn, so other coroutines sharing its event loop show up too; component
+  timings only count the profiled turn.
+  """
+
+  def __init__(self, label: str='turn'):
+    """Initialize profile.
+
+    Args:
+      label -- Label of the profiled turn (e.g. its channel). (default: 'turn')
+    """
+    self.label = label
+    self.components: DefaultDict[str, float] = defaultdict(float)
+    self.calls: DefaultDict[str, int] = defaultdict(int)
+    self.elapsed = 0.0
+    self.profiler: Optional[cProfile.Profile] = None
+    self.snapshot: Optional[tracemalloc.Snapshot] = None
+    self.peak = 0
+
+  @staticmethod
+  def active() -> Optional['Profile']:
+    """Get the profile of the current turn, if it is being profiled."""
+    return _active.get()
+
+  def add(self, component: str, seconds: float) -> None:
+    """Account time spent in a pipeline component.
+
+    Args:
+      component -- Component name.
+      seconds -- Time spent, in seconds.
+    """
+    self.components[component] += seconds
+    self.calls[component] += 1
+
+  @contextmanager
+  def run(self) -> Iterator['Profile']:
+    """Profile everything run in this context.
+
+    Nothing is captured if another profile is running.
+
+    Returns:
+      Context manager yielding this profile.
+    """
+    if not _lock.acquire(blocking=False):
+      logging.warning('Another profile is running, not profiling %s.', self.label)
+      yield self
+      return
+    token = _active.set(self)
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+      tracemalloc.start()
+    if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+, the peak may predate the turn otherwise
+      tracemalloc.reset_peak()
+    self.profiler = cProfile.Profile()
+    start = time.perf_counter()
+    self.profiler.enable()
+    try:
+      yield self
+    finally:
+      self.profiler.disable()
+      self.elapsed = time.perf_counter() - start
+      self.snapshot = tracemalloc.take_snapshot()
+      _, self.peak = tracemalloc.get_traced_memory()
+      if not tracing:
+        tracemalloc.stop()
+      _active.reset(token)
+      _lock.release()
+
+  def report(self, limit: int=15) -> str:
+    """Format the profile as text.
+
+    Args:
+      limit -- Number of functions and allocation sites listed. (default: 15)
+
+    Returns:
+      Wall time, pipeline components, hottest functions and allocation sites.
+    """
+    if self.profiler is None:
+      return 'Profile of {}: not captured, another profile was running.'.format(self.label)
+    lines = ['Profile of {}: {:.1f} ms, peak traced memory {:.1f} KiB'.format(
+      self.label, self.elapsed * 1000, self.peak / 1024), '', 'Pipeline components:']
+    for name, seconds in sorted(self.components.items(), key=lambda c: -c[1]):
+      lines.append('  {:<20} {:>9.2f} ms {:>5} calls'.format(name, seconds * 1000, self.calls[name]))
+    stream = io.StringIO()
+    stats = pstats.Stats(self.profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(limit)
+    lines += ['', stream.getvalue().strip()]
+    if self.snapshot is not None:
+      lines += ['', 'Allocations:']
+      for stat in self.snapshot.statistics('lineno')[:limit]:
+        lines.append('  {}'.format(stat))
+    return '\n'.join(lines)
+
+  def save(self, directory: str) -> str:
+    """Save the report and the raw cProfile stats.
+
+    Args:
+      directory -- Directory to save `<time>-<label>.txt` and `.prof` files to.
+
+    Returns:
+      Path of the text report.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    base = os.path.join(directory, '{}-{}'.format(stamp, re.sub(r'[^\w.-]+', '_', self.label)))
+    if self.profiler is not None:
+      self.profiler.dump_stats(base + '.prof')
+    with open(base + '.txt', 'w') as f:
+      f.write(self.report() + '\n')
+    return base + '.txt'
@@ -3,22 +3,178 @@
 
 """Rule-based matching."""
 
+import numpy as np
 import spacy
+from spacy.language import Language
 from spacy.matcher import Matcher
-from rita.shortcuts import setup_spacy
+from spacy.pipeline import EntityRuler
+from spacy.tokens import Token
+from spacy.vectors import Vectors
+import rita
 
+from contextlib import contextmanager
+from contextvars import ContextVar
+import hashlib
+import json
 import logging
-from typing import List
+import os
+import queue
+from threading import RLock
+import time
+from typing import Any, Callable, Dict, Iterator, List, Tuple
 
 from interfaces.singleton import *
 
+from .__about__ import VERSION
+from .address import *
+from .deadline import *
+from .patterns import *
+from .profiler import *
+
 IDENT_CHAR = '\t'
 IDENT_LEVEL = 2
 
+MODEL = 'en_core_web_md'
+
+_pinned: ContextVar = ContextVar('generation', default=None)
+
+# never None, the matcher can't compare extension patterns against None values
+Token.set_extension('address', default='', force=True)
+
+@Language.component('fwnl_address')
+def tag_addresses(doc: Any) -> Any:
+  """Tag IP addresses and networks as `token._.address` (see `recognize`),
+  other tokens get an empty string."""
+  for token in doc:
+    token._.address = recognize(token.text) or ''
+  return doc
+
+class Generation(object):
+  """Compiled rules served to pipeline handles, swapped as a whole on reload."""
+
+  def __init__(self, number: int, ruler: Any, patterns: Dict[str, List[str]],
+               specs: Dict[str, List[Any]]=None):
+    """Initialize generation.
+
+    Args:
+      number -- Generation number, increasing with every reload.
+      ruler -- Entity ruler built from the Rita rules.
+      patterns -- Keywords of each entity label.
+      specs -- Mapping of matcher labels to token patterns. (default: None)
+    """
+    self.number = number
+    self.ruler = ruler
+    self.patterns = patterns
+    self.specs: Dict[str, List[Any]] = dict(specs or {})
+    self.version = 0
+    self.labels = set(ruler.labels)
+
+class Pipeline(object):
+  """Handle over the shared spaCy pipeline with its own matcher."""
+
+  def __init__(self, nlp: Any):
+    """Initialize handle.
+
+    Args:
+      nlp -- Shared spaCy pipeline (and its read-only vocab and vectors).
+    """
+    self.nlp = nlp
+    self.matcher = Matcher(nlp.vocab)
+    self.generation: Generation = None
+    self.specs: Dict[str, List[Any]] = {}
+    self.version = -1
+
+  def __call__(self, text: str) -> Any:
+    """Process text with the shared pipeline and the generation's entity ruler.
+
+    Components are run one by one to time them (see `Profile`) or to stop
+    between them once the turn's `Deadline` expired.
+
+    Args:
+      text -- Text to be processed.
+
+    Returns:
+      spaCy document.
+    """
+    profile = Profile.active()
+    deadline = Deadline.active()
+    generation = self.generation
+    stats = PatternStats()
+    if profile is None and deadline is None:
+      doc = self.nlp(text)
+      if stats.sampling():
+        stats.measure('ruler', generation.number, generation.ruler.token_patterns, self.nlp.vocab, doc)
+      doc = generation.ruler(doc)
+      stats.count('ruler', [ent.label_ for ent in doc.ents if ent.label_ in generation.labels])
+      return doc
+
+    if deadline is not None:
+      deadline.check('tokenizer')
+    start = time.perf_counter()
+    doc = self.nlp.make_doc(text)
+    if profile is not None:
+      profile.add('tokenizer', time.perf_counter() - start)
+    for name, proc in self.nlp.pipeline + [('entity_ruler', generation.ruler)]:
+      if deadline is not None:
+        deadline.check(name)
+      if name == 'entity_ruler' and stats.sampling():
+        stats.measure('ruler', generation.number, generation.ruler.token_patterns, self.nlp.vocab, doc)
+      start = time.perf_counter()
+      doc = proc(doc)
+      if profile is not None:
+        profile.add(name, time.perf_counter() - start)
+    stats.count('ruler', [ent.label_ for ent in doc.ents if ent.label_ in generation.labels])
+    return doc
+
+  def match(self, doc: Any) -> List[Tuple[int, int, int]]:
+    """Run the matcher, counting matches per label (see `PatternStats`).
+
+    Args:
+      doc -- spaCy document.
+
+    Returns:
+      List of (match id, start, end) tuples.
+    """
+    stats = PatternStats()
+    if stats.sampling():
+      stats.measure('matcher', (self.generation.number, self.version), self.specs, self.nlp.vocab, doc)
+    matches = self.matcher(doc)
+    stats.count('matcher', [self.nlp.vocab.strings[id] for id, _, _ in matches])
+    return matches
+
+  def sync(self, generation: Generation, specs: Dict[str, List[Any]], version: int) -> None:
+    """Bring matcher patterns up to date.
+
+    Args:
+      generation -- Generation to be served.
+      specs -- Mapping of labels to token patterns.
+      version -- Version number of `specs`.
+    """
+    if self.generation is not generation:
+      self.generation = generation
+      self.matcher = Matcher(self.nlp.vocab)
+      self.version = -1
+    if self.version == version:
+      return
+    for label, patterns in specs.items():
+      if label in self.matcher:
+        self.matcher.remove(label)
+      self.matcher.add(label, patterns)
+    self.specs = specs
+    self.version = version
+
 class Rules(object, metaclass=SingletonMeta):
   """Class to load Rita DSL rules and add them to spaCy pipeline."""
   rules = ''
   loaded = False
+  size = int(os.environ.get('FWNL_POOL_SIZE', 4))
+  cache = os.environ.get('FWNL_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'fwnl'))
+  extra: str = os.environ.get('FWNL_RULES')
+  vectors: str = os.environ.get('FWNL_VECTORS')
+  shared = os.environ.get('FWNL_SHARED_VECTORS', '').lower() in ('1', 'true', 'yes')
+  hooks: List[Callable[[], None]] = []
+  _setup_lock = RLock()
+  _reload_lock = RLock()
 
   def add(self, rules: str=None) -> None:
     """Add rules to pipeline.
@@ -26,32 +182,303 @@ class Rules(object, metaclass=SingletonMeta):
     Args:
       rules -- Rule string to be added to spaCy pipeline.
     """
-    if rules is not None:
-      self.rules += rules
+    with self._setup_lock:
+      if rules is not None and rules not in self.rules:
+        self.rules += rules
   
   def setup(self) -> None:
     """Setup matcher with patterns."""
-    if not self.loaded:
+    if self.loaded:
+      return
+    with self._setup_lock:
+      if self.loaded:
+        return
+      if self.vectors is None and not self.shared:
+        self.nlp = spacy.load(MODEL)
+      elif not self.shared:
+        # the model's own table is never loaded, see `fwnl.vectors`
+        self.nlp = spacy.load(MODEL, exclude=['vectors'])
+        self.nlp.vocab.vectors = Vectors(strings=self.nlp.vocab.strings).from_disk(self.vectors)
+        logging.info('Loaded %d pruned vectors from %s.', self.nlp.vocab.vectors.shape[0], self.vectors)
+      else:
+        self.nlp = spacy.load(MODEL, exclude=['vectors'])
+        self.nlp.vocab.vectors = self.__mapped()
+      # keep addresses whole (the tokenizer splits IPv6 on ':'), then tag them
+      token_match = self.nlp.tokenizer.token_match
+      self.nlp.tokenizer.token_match = lambda text: recognize(text) or (token_match and token_match(text))
+      self.nlp.add_pipe('fwnl_address', first=True)
+      self.generation = self.__compile(0)
+      self._next: Generation = None
+      self.pool: queue.LifoQueue = queue.LifoQueue()
+      self.created = 0
+      self.metrics = {'acquisitions': 0, 'waits': 0, 'wait_seconds': 0.0,
+                      'in_use': 0, 'max_in_use': 0, 'reloads': 0}
       self.loaded = True
-      self.nlp = spacy.load('en_core_web_md')
-      setup_spacy(self.nlp, rules_string=self.rules)
-      self.matcher = Matcher(self.nlp.vocab)
-      self.ruler = self.nlp.pipeline[-1]
-      self.patterns = dict([])
-      for label in self.ruler[1].labels:
-        self.patterns[label] = self.__keywords(label)
 
-  def __keywords(self, label: str) -> List[str]:
+  def reload(self) -> int:
+    """Rebuild entity ruler, keywords and matcher patterns, then swap them in.
+
+    The new generation is built against the already loaded model and vocab
+    while the current one keeps serving; turns pinned to the old generation
+    (see `pinned`) finish on it.
+
+    Returns:
+      The new generation number.
+    """
+    self.setup()
+    with self._reload_lock:
+      start = time.perf_counter()
+      generation = self.__compile(self.generation.number + 1)
+      with self._setup_lock:
+        generation.specs = dict(self.generation.specs)
+        self._next = generation
+      # hooks read the new keywords (e.g. PROTOCOL), other threads keep the old ones
+      token = _pinned.set(generation)
+      try:
+        for hook in self.hooks:
+          hook()
+      finally:
+        _pinned.reset(token)
+        with self._setup_lock:
+          self._next = None
+          self.generation = generation
+          self.metrics['reloads'] += 1
+      logging.info('Rules reloaded as generation %d in %.2fs.',
+                   generation.number, time.perf_counter() - start)
+      return generation.number
+
+  def current(self) -> Generation:
+    """Get the generation pinned to this turn, or the latest one."""
+    self.setup()
+    return _pinned.get() or self.generation
+
+  @contextmanager
+  def pinned(self) -> Iterator[Generation]:
+    """Serve every acquisition in this context from the same generation.
+
+    Returns:
+      Context manager yielding the pinned `Generation`.
+    """
+    token = _pinned.set(self.current())
+    try:
+      yield _pinned.get()
+    finally:
+      _pinned.reset(token)
+
+  @property
+  def patterns(self) -> Dict[str, List[str]]:
+    """Keywords of each entity label."""
+    return self.current().patterns
+
+  @property
+  def ruler(self) -> Any:
+    """Entity ruler built from the Rita rules."""
+    return self.current().ruler
+
+  def add_patterns(self, label: str, patterns: List[Any]) -> None:
+    """Add (or replace) matcher patterns in every pipeline handle.
+
+    Args:
+      label -- Label matched by the patterns.
+      patterns -- List of spaCy token patterns.
+    """
+    self.setup()
+    with self._setup_lock:
+      for generation in (self.generation, self._next):
+        if generation is not None:
+          generation.specs = dict(generation.specs, **{label: patterns})
+          generation.version += 1
+
+  @contextmanager
+  def acquire(self) -> Iterator[Pipeline]:
+    """Borrow a pipeline handle for the current thread.
+
+    Handles are created on demand up to `size`, then callers wait for one
+    to be released.
+
+    Returns:
+      Context manager yielding a `Pipeline`.
+    """
+    generation = self.current()
+    start = time.perf_counter()
+    waited = False
+    try:
+      handle = self.pool.get_nowait()
+    except queue.Empty:
+      with self._setup_lock:
+        create = self.created < self.size
+        if create:
+          self.created += 1
+      if create:
+        handle = Pipeline(self.nlp)
+      else:
+        waited = True
+        handle = self.pool.get()
+
+    with self._setup_lock:
+      self.metrics['acquisitions'] += 1
+      self.metrics['waits'] += int(waited)
+      self.metrics['wait_seconds'] += time.perf_counter() - start
+      self.metrics['in_use'] += 1
+      self.metrics['max_in_use'] = max(self.metrics['max_in_use'], self.metrics['in_use'])
+      specs, version = generation.specs, generation.version
+    try:
+      handle.sync(generation, specs, version)
+      yield handle
+    finally:
+      with self._setup_lock:
+        self.metrics['in_use'] -= 1
+      self.pool.put(handle)
+
+  def stats(self) -> Dict[str, Any]:
+    """Get pipeline pool contention metrics.
+
+    Returns:
+      Dictionary with pool size, created handles and acquisition counters.
+    """
+    if not self.loaded:
+      return {}
+    with self._setup_lock:
+      return dict(self.metrics, size=self.size, handles=self.created,
+                  generation=self.generation.number)
+
+  def __compile(self, number: int) -> Generation:
+    """Compile intents' rules (and the extra rules file) into a generation.
+
+    Args:
+      number -- Number of the new generation.
+
+    Returns:
+      New generation, without matcher patterns.
+    """
+    rules = self.rules
+    if self.extra is not None:
+      with open(self.extra) as f:
+        rules += '\n' + f.read()
+    path = os.path.join(self.cache, 'pipeline-{}.json'.format(self.__key(rules)))
+    artifact = self.__load(path)
+    if artifact is not None:
+      entities, patterns = artifact['entities'], artifact['keywords']
+      ruler = self.__ruler(entities)
+    else:
+      entities = list(rita.compile_string(rules, use_engine='spacy'))
+      ruler = self.__ruler(entities)
+      patterns = dict([])
+      for label in ruler.labels:
+        patterns[label] = self.__keywords(ruler, label)
+      self.__save(path, {'entities': entities, 'keywords': patterns})
+    return Generation(number, ruler, patterns)
+
+  def __mapped(self) -> Any:
+    """Map the vectors table (the model's, or the pruned one) from the cache.
+
+    The table is exported once as a raw NumPy file, then every process maps
+    it read-only, so they all share the same page cache pages.
+
+    Returns:
+      Vectors sharing the model's strings.
+    """
+    parts = [MODEL, self.nlp.meta.get('version', ''), spacy.__version__, self.vectors]
+    if self.vectors is not None:
+      # a table pruned again into the same directory is exported again
+      for name in sorted(os.listdir(self.vectors)):
+        stat = os.stat(os.path.join(self.vectors, name))
+        parts.append([name, stat.st_size, stat.st_mtime_ns])
+    key = hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:16]
+    data = os.path.join(self.cache, 'vectors-{}.npy'.format(key))
+    rows = os.path.join(self.cache, 'vectors-{}.key2row.npy'.format(key))
+    if not (os.path.exists(data) and os.path.exists(rows)):
+      if self.vectors is None:
+        source = spacy.load(MODEL, exclude=self.nlp.pipe_names).vocab.vectors
+      else:
+        source = Vectors(strings=self.nlp.vocab.strings).from_disk(self.vectors)
+      os.makedirs(self.cache, exist_ok=True)
+      for path, array in ((data, np.ascontiguousarray(source.data, dtype=np.float32)),
+                          (rows, np.array(list(source.key2row.items()), dtype=np.uint64).reshape(-1, 2))):
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+          np.save(f, array)
+        os.replace(tmp, path)
+      logging.info('Exported %d vectors to %s.', source.shape[0], data)
+      del source
+    vectors = Vectors(strings=self.nlp.vocab.strings, data=np.load(data, mmap_mode='r'))
+    for k, row in np.load(rows).tolist():
+      vectors.add(k, row=row)
+    logging.info('Mapped %d vectors from %s.', vectors.shape[0], data)
+    return vectors
+
+  def __ruler(self, entities: List[Dict[str, Any]]) -> Any:
+    """Build an entity ruler outside the model's pipeline.
+
+    Args:
+      entities -- Entity ruler patterns.
+
+    Returns:
+      Entity ruler sharing the model's vocab.
+    """
+    ruler = EntityRuler(self.nlp, 'entity_ruler', overwrite_ents=True)
+    ruler.add_patterns(entities)
+    return ruler
+
+  def __key(self, rules: str) -> str:
+    """Hash everything the compiled pipeline depends on.
+
+    Args:
+      rules -- Rita rules to be compiled.
+
+    Returns:
+      Hex digest of rules, model, spaCy, Rita and fwnl versions.
+    """
+    parts = [rules, MODEL, self.nlp.meta.get('version', ''),
+             spacy.__version__, getattr(rita, '__version__', ''), VERSION]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:16]
+
+  def __load(self, path: str) -> Dict[str, Any]:
+    """Load a compiled pipeline artifact.
+
+    Args:
+      path -- Artifact path.
+
+    Returns:
+      Artifact dictionary, or None if there's no usable artifact.
+    """
+    try:
+      with open(path) as f:
+        artifact = json.load(f)
+      logging.debug('Loaded compiled pipeline from %s.', path)
+      return artifact
+    except (OSError, ValueError):
+      return None
+
+  def __save(self, path: str, artifact: Dict[str, Any]) -> None:
+    """Save a compiled pipeline artifact, atomically.
+
+    Args:
+      path -- Artifact path.
+      artifact -- Artifact dictionary.
+    """
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with open(tmp, 'w') as f:
+        json.dump(artifact, f)
+      os.replace(tmp, path)
+      logging.debug('Saved compiled pipeline to %s.', path)
+    except OSError as e:
+      logging.warning('Could not save compiled pipeline to %s: %s', path, e)
+
+  def __keywords(self, ruler: Any, label: str) -> List[str]:
     """Parse list of keywords for given label.
 
     Args:
+      ruler -- Entity ruler to search patterns from.
       label -- Label string to search patters from.
 
     Returns:
       List of all keywords found in given label.
     """
     kw = []
-    for l, patterns in self.ruler[1].token_patterns.items():
+    for l, patterns in ruler.token_patterns.items():
       if l == label.upper():
         for ls in patterns:
           for d in ls:
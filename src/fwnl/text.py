@@ -3,7 +3,7 @@
 
 """Text processing."""
 
-from typing import List
+from typing import Any, List
 
 from .distance import *
 from .rules import *
@@ -11,22 +11,24 @@ from .rules import *
 class Text(object):
   """Text processing class."""
 
-  def __init__(self, text: str):
+  def __init__(self, text: str, doc: Any=None):
     """Initialize text.
     
     Args:
       text -- Text string to be processed.
+      doc -- spaCy document of the text, if already processed. (default: None)
     """
     rules = Rules()
-    self.doc = rules.nlp(text.lower())
-    processed = ""
-    for token in self.doc:
-      if (token.text in rules.nlp.Defaults.stop_words or
-          token.is_punct or
-          token.lemma_ == '-PRON-'):
-        continue
-      processed += ' ' + token.lemma_
-    self.docp = rules.nlp(processed)
+    with rules.acquire() as pipeline:
+      self.doc = doc if doc is not None else pipeline(text.lower())
+      processed = ""
+      for token in self.doc:
+        if (token.text in rules.nlp.Defaults.stop_words or
+            token.is_punct or
+            token.lemma_ == '-PRON-'):
+          continue
+        processed += ' ' + token.lemma_
+      self.docp = pipeline(processed)
 
   def similarity(self, compare: 'Text') -> float:
     """Find similarity between two texts.
@@ -50,6 +52,7 @@ class Text(object):
       Number of matched keywords.
     """
     score = 0
+    compare = list(compare)
     for token in self.docp:
       for key in compare:
         if distance(key, token.text, dl=True) <= margin:
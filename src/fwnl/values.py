@@ -4,9 +4,10 @@
 """Models for values"""
 
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, List, Tuple
 
 from .rules import *
+from .inventory import *
  
 class Value(ABC):
   """Value base class."""
@@ -49,6 +50,14 @@ class Value(ABC):
     """
     return "What's the value for {} (hint: {}).".format(self.name, self.hint)
     
+  def choices(self) -> List[str]:
+    """Get the closed set of answers accepted by this value.
+    
+    Returns:
+      List of answers, empty if any text may be an answer.
+    """
+    return []
+
   def verify(self, answer: str=None) -> bool:
     """Verify answer.
     
@@ -60,41 +69,72 @@ class Value(ABC):
     """
     self.setup()
     rules = Rules()
-    doc = rules.nlp(answer)
-    matches = rules.matcher(doc)
+    with rules.acquire() as pipeline:
+      doc = pipeline(answer)
+      matches = pipeline.match(doc)
     for id, start, end in matches:
       if rules.nlp.vocab.strings[id] in self.patterns:
         self.value = doc[start:end].text
         return True
     return False
 
+  def find(self, doc: Any) -> List[Tuple[int, int, str]]:
+    """Find every span of a document accepted by this value.
+    
+    Args:
+      doc -- spaCy document to be searched.
+    
+    Returns:
+      List of (start, end, value) tuples, where start and end are token
+      offsets and value is the text to be used as this value.
+    """
+    self.setup()
+    rules = Rules()
+    spans = []
+    with rules.acquire() as pipeline:
+      matches = pipeline.match(doc)
+    for id, start, end in matches:
+      if rules.nlp.vocab.strings[id] in self.patterns:
+        spans.append((start, end, doc[start:end].text))
+    return spans
+
 class Endpoint(Value):
   """Endpoint derived value."""
   loaded = False
 
   def __init__(self, name: str='Endpoint',
                desc: str='Value of address property.', value: str=None):
+    names = [n for n in Inventory().names if n != 'any']
     super().__init__(name, desc, value,
-                     'IPv4|IPV6|laboratory|server|professor|secretary|classroom')
-    self.patterns = ['IPV4', 'IPV6', 'HOSTNAME']
+                     '|'.join(['IPv4', 'IPV6'] + names[:5] + (['...'] if len(names) > 5 else [])))
+    self.patterns = ['IPV4', 'IPV6']
 
   def setup(self) -> None:
     """Setup address endpoint matching patterns."""
     if not Endpoint.loaded:
-      Endpoint.loaded = True
       rules = Rules()
 
-      octet_rx = r'(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)'
-      pattern = [{"TEXT": {"REGEX": r"^{0}(?:\.{0}){{3}}$".format(octet_rx)}}]
-      rules.matcher.add('IPV4', [pattern])
+      for label in self.patterns:
+        rules.add_patterns(label, [[{"_": {"address": label}}]])
+      Endpoint.loaded = True
 
-      # TODO: review IPV6 pattern
-      octet_rx = r'(([0-9a-fA-F]{1,4}:){7,7}[0-9a-fA-F]{1,4}|([0-9a-fA-F]{1,4}:){1,7}:|([0-9a-fA-F]{1,4}:){1,6}:[0-9a-fA-F]{1,4}|([0-9a-fA-F]{1,4}:){1,5}(:[0-9a-fA-F]{1,4}){1,2}|([0-9a-fA-F]{1,4}:){1,4}(:[0-9a-fA-F]{1,4}){1,3}|([0-9a-fA-F]{1,4}:){1,3}(:[0-9a-fA-F]{1,4}){1,4}|([0-9a-fA-F]{1,4}:){1,2}(:[0-9a-fA-F]{1,4}){1,5}|[0-9a-fA-F]{1,4}:((:[0-9a-fA-F]{1,4}){1,6})|:((:[0-9a-fA-F]{1,4}){1,7}|:)|fe80:(:[0-9a-fA-F]{0,4}){0,4}%[0-9a-zA-Z]{1,}|::(ffff(:0{1,4}){0,1}:){0,1}((25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])\.){3,3}(25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])|([0-9a-fA-F]{1,4}:){1,4}:((25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])\.){3,3}(25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9]))'
-      pattern = [{"TEXT": {"REGEX": r"^{0}(?:\.{0}){{3}}$".format(octet_rx)}}]
-      rules.matcher.add('IPV6', [pattern])
+  def verify(self, answer: str=None) -> bool:
+    """Verify address or inventory hostname.
+    See base class for more details.
+    """
+    if super().verify(answer):
+      return True
+    found = Inventory().find([w.strip('.,;:!?').lower() for w in answer.split()])
+    if len(found) > 0:
+      self.value = found[0][2]
+      return True
+    return False
 
-      pattern = [{"TEXT": {"REGEX": r"^(any|laboratory|server|professor|secretary|classroom)$"}}]
-      rules.matcher.add('HOSTNAME', [pattern])
+  def find(self, doc: Any) -> List[Tuple[int, int, str]]:
+    """Find addresses and inventory hostnames.
+    See base class for more details.
+    """
+    return super().find(doc) + Inventory().find([t.lower_ for t in doc])
 
   def generate(self) -> str:
     """Generate value.
@@ -114,14 +154,11 @@ class Range(Value):
   def setup(self) -> None:
     """Setup address range matching patterns."""
     if not Range.loaded:
-      Range.loaded = True
       rules = Rules()
 
-      # TODO: add IPv6 range
-      octet_rx = r'(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)'
-      # TODO: test IPv4 range
-      pattern = [{"TEXT": {"REGEX": r"^{0}(?:\.{0}){{3}}\/([1-9]|[12][0-9]|3[01])$".format(octet_rx)}}]
-      rules.matcher.add('IPV4_RANGE', [pattern])
+      for label in self.patterns:
+        rules.add_patterns(label, [[{"_": {"address": label}}]])
+      Range.loaded = True
  
   def generate(self) -> str:
     """Generate value.
@@ -140,13 +177,16 @@ class Protocol(Value):
     self.patterns = ['PROTOCOL']
 
   def setup(self) -> None:
-    """Setup protocol matching patterns."""
+    """Setup protocol matching patterns.
+    Protocols marked as PROTOCOL by the Rita rules are accepted as well.
+    """
     if not Protocol.loaded:
-      Protocol.loaded = True
       rules = Rules()
 
-      pattern = [{"LOWER": {"IN": self.protocols}}]
-      rules.matcher.add('PROTOCOL', [pattern])
+      extra = [p for p in rules.patterns.get('PROTOCOL', []) if p not in self.protocols]
+      pattern = [{"LOWER": {"IN": self.protocols + extra}}]
+      rules.add_patterns('PROTOCOL', [pattern])
+      Protocol.loaded = True
 
   def generate(self) -> str:
     """Generate value string.
@@ -154,6 +194,12 @@ class Protocol(Value):
     """
     return "traffic('{}')".format(self.value)
 
+  def choices(self) -> List[str]:
+    """Get protocols.
+    See base class for more details.
+    """
+    return list(self.protocols)
+
 class Confirm(Value):
   """Confirm derived value."""
   loaded = False
@@ -167,14 +213,14 @@ class Confirm(Value):
   def setup(self) -> None:
     """Setup confirm matching patterns."""
     if not Confirm.loaded:
-      Confirm.loaded = True
       rules = Rules()
 
       pattern = [{"LOWER": {"IN": ["yes", "confirm", "ok", "sure", "yep", "y"]}}]
-      rules.matcher.add('CONFIRM', [pattern])
+      rules.add_patterns('CONFIRM', [pattern])
 
       pattern = [{"LOWER": {"IN": ["no", "cancel", "nope", "n"]}}]
-      rules.matcher.add('CANCEL', [pattern])
+      rules.add_patterns('CANCEL', [pattern])
+      Confirm.loaded = True
 
   def question(self) -> str:
     """Return question.
@@ -188,8 +234,9 @@ class Confirm(Value):
     """
     self.setup()
     rules = Rules()
-    doc = rules.nlp(answer)
-    matches = rules.matcher(doc)
+    with rules.acquire() as pipeline:
+      doc = pipeline(answer)
+      matches = pipeline.match(doc)
 
     self.value = False
     for id, _, _ in matches:
@@ -220,11 +267,11 @@ class Raw(Value):
   def setup(self) -> None:
     """Setup text matching patterns."""
     if not Raw.loaded:
-      Raw.loaded = True
       rules = Rules()
 
       pattern = [{"TEXT": {"REGEX": r"([\w\-]+)"}}]
-      rules.matcher.add('RAW', [pattern])
+      rules.add_patterns('RAW', [pattern])
+      Raw.loaded = True
 
   def verify(self, answer: str=None) -> bool:
     """Verify raw value.
@@ -232,8 +279,9 @@ class Raw(Value):
     """
     self.setup()
     rules = Rules()
-    doc = rules.nlp(answer)
-    matches = rules.matcher(doc)
+    with rules.acquire() as pipeline:
+      doc = pipeline(answer)
+      matches = pipeline.match(doc)
 
     self.value = ''
     for id, start, end in matches:
@@ -259,11 +307,11 @@ class Throughput(Value):
   def setup(self) -> None:
     """Setup throughput matching patterns."""
     if not Throughput.loaded:
-      Throughput.loaded = True
       rules = Rules()
 
       pattern = [{"TEXT": {"REGEX": r"^([0-9]+[tgmk]?bps)$"}}]
-      rules.matcher.add('THROUGHPUT', [pattern])
+      rules.add_patterns('THROUGHPUT', [pattern])
+      Throughput.loaded = True
 
   def generate(self) -> str:
     """Generate value.
@@ -283,11 +331,11 @@ class Before(Value):
   def setup(self) -> None:
     """Setup before matching patterns."""
     if not Before.loaded:
-      Before.loaded = True
       rules = Rules()
 
       pattern = [{"LOWER": "before"}]
-      rules.matcher.add('BEFORE', [pattern])
+      rules.add_patterns('BEFORE', [pattern])
+      Before.loaded = True
 
   def generate(self) -> str:
     """Generate value.
@@ -295,6 +343,12 @@ class Before(Value):
     """
     return "before('all-intents')"
 
+  def choices(self) -> List[str]:
+    """Get answer.
+    See base class for more details.
+    """
+    return ['before']
+
 class After(Value):
   """After derived value."""
   loaded = False
@@ -307,14 +361,28 @@ class After(Value):
   def setup(self) -> None:
     """Setup after matching patterns."""
     if not After.loaded:
-      After.loaded = True
       rules = Rules()
 
       pattern = [{"LOWER": "after"}]
-      rules.matcher.add('AFTER', [pattern])
+      rules.add_patterns('AFTER', [pattern])
+      After.loaded = True
 
   def generate(self) -> str:
     """Generate value.
     See base class for more details.
     """
     return "after('all-intents')"
+
+  def choices(self) -> List[str]:
+    """Get answer.
+    See base class for more details.
+    """
+    return ['after']
+
+def reset() -> None:
+  """Register matcher patterns of every value again (see `Rules.reload`)."""
+  for cls in Value.__subclasses__():
+    cls.loaded = False
+    cls().setup()
+
+Rules.hooks.append(reset)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Vocabulary-pruned word vectors."""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from .engine import *
+
+SAMPLES: List[Tuple[str, str]] = [
+  ('ACL', 'i want to block access'),
+  ('ACL', 'block ssh access from the server to the laboratory'),
+  ('ACL', 'filter access to the classroom'),
+  ('ACL', 'manage access control for the secretary'),
+  ('ACL', 'deny telnet from any host'),
+  ('TS', 'i want to limit traffic'),
+  ('TS', 'shape http traffic to 10mbps'),
+  ('TS', 'reduce the bandwidth of the laboratory'),
+  ('TS', 'cap traffic from the professor'),
+  ('TS', 'slow down ftp downloads'),
+]
+
+def rss() -> int:
+  """Get the resident set size of this process.
+
+  Returns:
+    Size in bytes (peak size where the current one isn't available).
+  """
+  try:
+    with open('/proc/self/status') as f:
+      for line in f:
+        if line.startswith('VmRSS:'):
+          return int(line.split()[1]) * 1024
+  except OSError:
+    pass
+  import resource
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def loaded_rss(vectors: str=None) -> int:
+  """Get the resident set size of a fresh process once the model is loaded.
+
+  Args:
+    vectors -- Pruned vectors directory, or None for the model's own table.
+
+  Returns:
+    Size in bytes.
+  """
+  env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+  env.pop('FWNL_VECTORS', None)
+  env.pop('FWNL_SHARED_VECTORS', None)
+  if vectors is not None:
+    env['FWNL_VECTORS'] = os.path.abspath(vectors)
+  code = 'from fwnl.rules import Rules; from fwnl.vectors import rss; Rules().setup(); print(rss())'
+  result = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                          stdout=subprocess.PIPE, universal_newlines=True)
+  return int(result.stdout.split()[-1])
+
+def accuracy(engine: Engine, samples: List[Tuple[str, str]]) -> float:
+  """Intent classification accuracy.
+
+  Args:
+    engine -- Engine to classify with.
+    samples -- List of (label, utterance) tuples.
+
+  Returns:
+    Fraction of utterances classified with their label.
+  """
+  hits = sum(engine.classify(text)[0].label == label for label, text in samples)
+  return hits / len(samples) if samples else 0.0
+
+def vocabulary(texts: Iterable[str], engine: Engine) -> Set[str]:
+  """Words the bot needs vectors for.
+
+  Args:
+    texts -- Domain texts (e.g. user utterances).
+    engine -- Engine whose intents' descriptions and keywords are added.
+
+  Returns:
+    Set of lower case words.
+  """
+  rules = Rules()
+  rules.setup()
+  texts = list(texts) + [intent.desc for intent in engine.intents()]
+  for keywords in rules.patterns.values():
+    texts.extend(keywords)
+  return {token.lower_ for text in texts for token in rules.nlp.make_doc(text)}
+
+def prune(nlp: Any, words: Set[str], rows: int) -> Dict[str, Tuple[str, float]]:
+  """Shrink the vectors table, keeping the domain words' rows first.
+
+  Every other word is mapped to the row of its nearest kept neighbour.
+
+  Args:
+    nlp -- spaCy pipeline, pruned in place.
+    words -- Domain words to be kept.
+    rows -- Rows kept in the table (at least the number of domain words).
+
+  Returns:
+    Mapping of removed words to their (kept neighbour, similarity).
+  """
+  vectors = nlp.vocab.vectors
+  for word in words:
+    if nlp.vocab.strings.add(word) in vectors:
+      nlp.vocab[word].prob = 0.0  # prune_vectors keeps the most probable words
+  return nlp.vocab.prune_vectors(rows)
+
+def main():
+  """Main function."""
+  parser = argparse.ArgumentParser(description='Build vocabulary-pruned vectors for FWNL_VECTORS.')
+  parser.add_argument('output', help='directory to save the pruned vectors to')
+  parser.add_argument('--rows', type=int, default=2000, help='vectors kept (default: 2000)')
+  parser.add_argument('--vocab', action='append', default=[],
+                      help='text file with domain words or utterances (repeatable)')
+  parser.add_argument('--labeled', help='TSV file of label and utterance to measure accuracy with')
+  args = parser.parse_args()
+
+  samples = SAMPLES
+  if args.labeled is not None:
+    with open(args.labeled) as f:
+      samples = [tuple(line.rstrip('\n').split('\t', 1)) for line in f if '\t' in line]
+  texts = [text for _, text in samples]
+  for path in args.vocab:
+    with open(path) as f:
+      texts.extend(f.read().splitlines())
+
+  Cascade.margin = 0  # measure the vectors, not the keyword vote
+  Rules.shared = False  # pruned in place
+  engine = Engine()
+  rules = Rules()
+  rules.setup()
+  vectors = rules.nlp.vocab.vectors
+  shape, size = vectors.shape, vectors.data.nbytes
+  start = time.perf_counter()
+  before = accuracy(engine, samples)
+
+  words = vocabulary(texts, engine)
+  remap = prune(rules.nlp, words, max(args.rows, len(words)))
+  after = accuracy(engine, samples)
+  os.makedirs(args.output, exist_ok=True)
+  rules.nlp.vocab.vectors.to_disk(args.output)
+
+  vectors = rules.nlp.vocab.vectors
+  print('vectors: {} -> {} rows, {:.1f} -> {:.1f} MiB'.format(
+    shape[0], vectors.shape[0], size / 2 ** 20, vectors.data.nbytes / 2 ** 20))
+  # this process still holds the full table (and pruning's copies), so load each in a new one
+  print('rss after loading: {:.1f} -> {:.1f} MiB'.format(
+    loaded_rss() / 2 ** 20, loaded_rss(args.output) / 2 ** 20))
+  print('accuracy on {} utterances: {:.3f} -> {:.3f} ({:+.3f})'.format(
+    len(samples), before, after, after - before))
+  print('{} domain words, {} words remapped, saved to {} in {:.1f}s'.format(
+    len(words), len(remap), args.output, time.perf_counter() - start), file=sys.stderr)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Admission control and backpressure."""
+
+from collections import OrderedDict
+import math
+import os
+from threading import BoundedSemaphore, Lock
+import time
+from typing import Any, Dict, Optional, Tuple
+
+class TokenBucket(object):
+  """Token bucket rate limiter."""
+
+  def __init__(self, rate: float, burst: float):
+    """Initialize bucket, full.
+
+    Args:
+      rate -- Tokens added per second.
+      burst -- Bucket capacity.
+    """
+    self.rate = rate
+    self.burst = burst
+    self.tokens = burst
+    self.stamp = time.monotonic()
+
+  def take(self) -> float:
+    """Take one token.
+
+    Returns:
+      0 if a token was taken, otherwise seconds until one is available.
+    """
+    now = time.monotonic()
+    self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+    self.stamp = now
+    if self.tokens >= 1:
+      self.tokens -= 1
+      return 0.0
+    return (1 - self.tokens) / self.rate
+
+class Admission(object):
+  """Bounded in-flight requests and WebSocket connections per worker, with
+  per-client rate limiting."""
+
+  def __init__(self, limit: int=None, budget: float=None,
+               rate: float=None, burst: float=None, clients: int=10000,
+               sockets: int=None, idle: float=None):
+    """Initialize admission control.
+
+    Args:
+      limit -- Maximum requests processed at once. (default: FWNL_MAX_INFLIGHT or 4)
+      budget -- Maximum time a request may wait for a slot, in seconds.
+                (default: FWNL_QUEUE_BUDGET or 2)
+      rate -- Requests per second allowed per client, 0 disables rate
+              limiting. (default: FWNL_RATE or 5)
+      burst -- Requests a client may send at once. (default: FWNL_BURST or 20)
+      clients -- Maximum number of client buckets kept. (default: 10000)
+      sockets -- Maximum WebSocket connections held at once, each holds a
+                 worker thread. (default: FWNL_MAX_SOCKETS or 2)
+      idle -- Seconds a WebSocket connection may stay idle. (default:
+              FWNL_SOCKET_IDLE or 60)
+    """
+    env = os.environ.get
+    self.limit = limit or int(env('FWNL_MAX_INFLIGHT', env('FWNL_POOL_SIZE', 4)))
+    self.budget = budget if budget is not None else float(env('FWNL_QUEUE_BUDGET', 2))
+    self.rate = rate if rate is not None else float(env('FWNL_RATE', 5))
+    self.burst = burst if burst is not None else float(env('FWNL_BURST', 20))
+    self.clients = clients
+    self.sockets = sockets or int(env('FWNL_MAX_SOCKETS', 2))
+    self.idle = idle or float(env('FWNL_SOCKET_IDLE', 60))
+    self._slots = BoundedSemaphore(self.limit)
+    self._sockets = BoundedSemaphore(self.sockets)
+    self._buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+    self._lock = Lock()
+    self.metrics = {'admitted': 0, 'shed': 0, 'limited': 0,
+                    'in_flight': 0, 'queued': 0, 'max_queued': 0, 'queue_seconds': 0.0,
+                    'sockets_open': 0, 'sockets_refused': 0}
+
+  def _count(self, key: str, n: Any=1) -> None:
+    with self._lock:
+      self.metrics[key] += n
+
+  def throttle(self, client: str) -> float:
+    """Apply the client's rate limit.
+
+    Args:
+      client -- Client identifier (e.g. remote address).
+
+    Returns:
+      0 if allowed, otherwise seconds until the client may retry.
+    """
+    if self.rate <= 0:
+      return 0.0
+    with self._lock:
+      bucket = self._buckets.pop(client, None) or TokenBucket(self.rate, self.burst)
+      self._buckets[client] = bucket
+      while len(self._buckets) > self.clients:
+        self._buckets.popitem(last=False)
+      return bucket.take()
+
+  def enter(self, client: str) -> Optional[Tuple[int, int]]:
+    """Try to admit a request.
+
+    Args:
+      client -- Client identifier (e.g. remote address).
+
+    Returns:
+      None if admitted (call `leave` when done), otherwise a tuple of
+      (HTTP status, Retry-After seconds).
+    """
+    wait = self.throttle(client)
+    if wait > 0:
+      self._count('limited')
+      return 429, max(1, math.ceil(wait))
+
+    start = time.monotonic()
+    if not self._slots.acquire(blocking=False):
+      with self._lock:
+        self.metrics['queued'] += 1
+        self.metrics['max_queued'] = max(self.metrics['max_queued'], self.metrics['queued'])
+      admitted = self._slots.acquire(timeout=self.budget)
+      self._count('queued', -1)
+      if not admitted:
+        self._count('shed')
+        return 503, max(1, math.ceil(self.budget))
+    with self._lock:
+      self.metrics['admitted'] += 1
+      self.metrics['in_flight'] += 1
+      self.metrics['queue_seconds'] += time.monotonic() - start
+    return None
+
+  def leave(self) -> None:
+    """Release the slot of an admitted request."""
+    self._count('in_flight', -1)
+    self._slots.release()
+
+  def connect(self, client: str) -> Optional[Tuple[int, int]]:
+    """Try to admit a WebSocket connection, without waiting.
+
+    Args:
+      client -- Client identifier (e.g. remote address).
+
+    Returns:
+      None if admitted (call `disconnect` when closed), otherwise a tuple
+      of (HTTP status, Retry-After seconds).
+    """
+    wait = self.throttle(client)
+    if wait > 0:
+      self._count('limited')
+      return 429, max(1, math.ceil(wait))
+    if not self._sockets.acquire(blocking=False):
+      self._count('sockets_refused')
+      return 503, max(1, math.ceil(self.idle))
+    self._count('sockets_open')
+    return None
+
+  def disconnect(self) -> None:
+    """Release the slot of an admitted WebSocket connection."""
+    self._count('sockets_open', -1)
+    self._sockets.release()
+
+  def stats(self) -> Dict[str, Any]:
+    """Get admission counters and gauges.
+
+    Returns:
+      Dictionary with admitted, shed and limited counts, in-flight and
+      queued requests, open and refused WebSocket connections.
+    """
+    with self._lock:
+      return dict(self.metrics, limit=self.limit, sockets=self.sockets)
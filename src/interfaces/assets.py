@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Fingerprinted and precompressed static assets."""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import re
+import sys
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+STATIC = os.path.join(os.path.dirname(__file__), 'web', 'static')
+DIST = os.path.join(os.path.dirname(__file__), 'web', 'dist')
+MANIFEST = 'manifest.json'
+# sources and formats that are already compressed are skipped
+SKIP = ('scss/',)
+COMPRESS = ('.css', '.js', '.map', '.svg', '.ttf', '.eot', '.ico', '.json', '.txt', '.html')
+URL = re.compile(r'''url\(\s*(['"]?)([^'")]+?)\1\s*\)|(sourceMappingURL=)(\S+)''')
+
+def fingerprint(name: str, data: bytes) -> str:
+  """Add a content hash to a file name.
+
+  Args:
+    name -- Relative file name (e.g. 'css/theme.css').
+    data -- File content.
+
+  Returns:
+    File name with the hash before its extension (e.g. 'css/theme.1a2b3c4d5e.css').
+  """
+  root, ext = posixpath.splitext(name)
+  return '{}.{}{}'.format(root, hashlib.sha256(data).hexdigest()[:10], ext)
+
+def rewrite(name: str, text: str, files: Dict[str, str]) -> str:
+  """Point a stylesheet's relative references to fingerprinted files.
+
+  Query strings (old cache busters) are dropped, fragments are kept.
+
+  Args:
+    name -- Relative name of the stylesheet.
+    text -- Stylesheet content.
+    files -- Mapping of relative names to fingerprinted ones.
+
+  Returns:
+    Rewritten stylesheet.
+  """
+  base = posixpath.dirname(name)
+
+  def replace(match: Any) -> str:
+    ref = match.group(2) or match.group(4)
+    if re.match(r'^(?:[a-z]+:|/|#)', ref, re.I):
+      return match.group(0)
+    path, _, fragment = ref.partition('#')
+    path = path.partition('?')[0]
+    target = posixpath.normpath(posixpath.join(base, path))
+    if target not in files:
+      return match.group(0)
+    url = posixpath.relpath(files[target], base or '.') + ('#' + fragment if fragment else '')
+    if match.group(3):
+      return match.group(3) + url
+    return 'url({0}{1}{0})'.format(match.group(1), url)
+  return URL.sub(replace, text)
+
+def compress(data: bytes) -> Dict[str, bytes]:
+  """Compress a file with every available encoding.
+
+  Args:
+    data -- File content.
+
+  Returns:
+    Mapping of content encodings ('br', 'gzip') to compressed content,
+    without the encodings that don't save at least 10%.
+  """
+  encoded = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+  if brotli is not None:
+    encoded['br'] = brotli.compress(data, quality=11)
+  return {k: v for k, v in encoded.items() if len(v) < len(data) * 0.9}
+
+def build(source: str=STATIC, output: str=DIST) -> Dict[str, Any]:
+  """Fingerprint and precompress static assets.
+
+  Stylesheets are handled last, so their references to fonts and images
+  can be rewritten (and included in their own hash). Files from previous
+  builds are kept, so pages already loaded can still fetch them.
+
+  Args:
+    source -- Static files directory. (default: web/static)
+    output -- Directory to write assets and manifest to. (default: web/dist)
+
+  Returns:
+    Manifest with fingerprinted names and available encodings of each file.
+  """
+  names = []
+  for root, _, filenames in os.walk(source):
+    for filename in filenames:
+      name = os.path.relpath(os.path.join(root, filename), source).replace(os.sep, '/')
+      if not name.startswith(SKIP):
+        names.append(name)
+  names.sort(key=lambda n: (n.endswith('.css'), n))
+
+  manifest: Dict[str, Any] = {'files': {}, 'encodings': {}}
+  for name in names:
+    with open(os.path.join(source, name), 'rb') as f:
+      data = f.read()
+    if name.endswith('.css'):
+      data = rewrite(name, data.decode('utf-8'), manifest['files']).encode('utf-8')
+    hashed = fingerprint(name, data)
+    variants = {'identity': data}
+    if name.endswith(COMPRESS):
+      variants.update(compress(data))
+    for encoding, content in variants.items():
+      path = os.path.join(output, hashed) + {'identity': '', 'gzip': '.gz', 'br': '.br'}[encoding]
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with open(path, 'wb') as f:
+        f.write(content)
+    manifest['files'][name] = hashed
+    manifest['encodings'][hashed] = sorted(variants, key=['br', 'gzip', 'identity'].index)
+  with open(os.path.join(output, MANIFEST + '.tmp'), 'w') as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+  os.replace(os.path.join(output, MANIFEST + '.tmp'), os.path.join(output, MANIFEST))
+  return manifest
+
+def accepted(header: Optional[str]) -> List[str]:
+  """Parse an Accept-Encoding header.
+
+  Args:
+    header -- Header value.
+
+  Returns:
+    Accepted encodings, without those with q=0.
+  """
+  encodings = []
+  for part in (header or '').split(','):
+    encoding, _, params = part.strip().partition(';')
+    q = re.search(r'q\s*=\s*([0-9.]+)', params)
+    try:
+      if encoding and (q is None or float(q.group(1)) > 0):
+        encodings.append(encoding.strip().lower())
+    except ValueError:
+      pass
+  return encodings
+
+class Assets(object):
+  """Built assets, served in the smallest encoding a client accepts."""
+  prefix = '/dist/'
+
+  def __init__(self, directory: str=None):
+    """Load the manifest of a build.
+
+    Args:
+      directory -- Directory given to `build`. (default: FWNL_ASSETS or web/dist)
+    """
+    self.directory = directory or os.environ.get('FWNL_ASSETS') or DIST
+    self.files: Dict[str, str] = {}
+    self.encodings: Dict[str, List[str]] = {}
+    self.metrics = {'br': 0, 'gzip': 0, 'identity': 0, 'missing': 0}
+    self._lock = Lock()
+    try:
+      with open(os.path.join(self.directory, MANIFEST)) as f:
+        manifest = json.load(f)
+      self.files, self.encodings = manifest['files'], manifest['encodings']
+    except FileNotFoundError:
+      logging.info('No built assets in %s, serving static files as they are.', self.directory)
+    except (OSError, KeyError, ValueError) as e:
+      logging.warning('Could not load built assets: %s', e)
+
+  def url(self, name: str) -> Optional[str]:
+    """Get the fingerprinted URL of a static file.
+
+    Args:
+      name -- Relative name (e.g. 'css/theme.css').
+
+    Returns:
+      URL path, or None if the file wasn't built.
+    """
+    hashed = self.files.get(name)
+    return self.prefix + hashed if hashed is not None else None
+
+  def lookup(self, hashed: str, accept_encoding: str=None) -> Optional[Tuple[str, Optional[str], str]]:
+    """Choose the variant of a built file to send.
+
+    Args:
+      hashed -- Fingerprinted name (as in the URL, without the prefix).
+      accept_encoding -- Request's Accept-Encoding header.
+
+    Returns:
+      Tuple of (file path, content encoding or None, ETag), or None if
+      there's no such file.
+    """
+    encodings = self.encodings.get(hashed)
+    if encodings is None:
+      with self._lock:
+        self.metrics['missing'] += 1
+      return None
+    accept = accepted(accept_encoding)
+    encoding = next((e for e in encodings if e in accept or (e != 'identity' and '*' in accept)),
+                    'identity')
+    with self._lock:
+      self.metrics[encoding] += 1
+    path = os.path.join(self.directory, *hashed.split('/'))
+    if encoding == 'identity':
+      return path, None, posixpath.basename(hashed)
+    return path + {'gzip': '.gz', 'br': '.br'}[encoding], encoding, \
+      '{}-{}'.format(posixpath.basename(hashed), encoding)
+
+  def stats(self) -> Dict[str, Any]:
+    """Get asset counters.
+
+    Returns:
+      Dictionary with built files and responses sent by encoding.
+    """
+    with self._lock:
+      return dict(self.metrics, files=len(self.files))
+
+def main():
+  """Main function."""
+  parser = argparse.ArgumentParser(description='Fingerprint and precompress the web interface assets.')
+  parser.add_argument('--source', default=STATIC, help='static files directory (default: %(default)s)')
+  parser.add_argument('--output', default=os.environ.get('FWNL_ASSETS') or DIST,
+                      help='output directory, FWNL_ASSETS of the web interface (default: %(default)s)')
+  args = parser.parse_args()
+
+  manifest = build(args.source, args.output)
+  size = {'identity': 0, 'gzip': 0, 'br': 0}
+  for hashed, encodings in manifest['encodings'].items():
+    for encoding in encodings:
+      path = os.path.join(args.output, hashed) + {'identity': '', 'gzip': '.gz', 'br': '.br'}[encoding]
+      size[encoding] += os.path.getsize(path)
+  print('{} files built to {} ({:.1f} KiB, {:.1f} KiB gzip, {:.1f} KiB brotli)'.format(
+    len(manifest['files']), args.output, size['identity'] / 1024, size['gzip'] / 1024,
+    size['br'] / 1024))
+  if brotli is None:
+    print('brotli is not installed, only gzip variants were built', file=sys.stderr)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Local Telegram Bot API stand-in."""
+
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Thread
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import parse_qsl
+from urllib.request import Request, urlopen
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'FwBot', 'username': 'fwnl_bot'}
+
+class FakeBotAPI(object):
+  """In-process Bot API server serving `getUpdates` and `sendMessage`.
+
+  Point a bot at `url` (e.g. `fwnl-telegram --api-url`) and use `push` to
+  deliver user messages; every message the bot sends is kept per chat and
+  can be waited for with `wait_replies`. Once the bot calls `setWebhook`,
+  updates are POSTed to its webhook instead of being served by `getUpdates`.
+  """
+
+  def __init__(self, host: str='127.0.0.1', port: int=0):
+    """Initialize the server.
+
+    Args:
+      host -- Address to listen on. (default: 127.0.0.1)
+      port -- Port to listen on, 0 picks a free one. (default: 0)
+    """
+    self._cond = Condition()
+    self._updates: List[Dict[str, Any]] = []
+    self._replies: Dict[int, List[Tuple[float, str]]] = {}
+    self._update_id = 0
+    self._message_id = 0
+    self.calls: Dict[str, int] = {}
+    self.webhook: Optional[str] = None
+    self.secret: Optional[str] = None
+    self.deliveries: Dict[int, int] = {}
+
+    api = self
+    class Handler(BaseHTTPRequestHandler):
+      def do_POST(self):
+        api._handle(self)
+      do_GET = do_POST
+      def log_message(self, *args):
+        pass
+
+    self.server = ThreadingHTTPServer((host, port), Handler)
+    self.server.daemon_threads = True
+    self._thread: Optional[Thread] = None
+
+  @property
+  def url(self) -> str:
+    """Base URL to be given to the bot (token is appended by the client)."""
+    host, port = self.server.server_address[:2]
+    return 'http://{}:{}/bot'.format(host, port)
+
+  def start(self) -> 'FakeBotAPI':
+    """Start serving in a background thread."""
+    self._thread = Thread(target=self.server.serve_forever, daemon=True)
+    self._thread.start()
+    logging.info('Fake Bot API listening on %s', self.url)
+    return self
+
+  def stop(self) -> None:
+    """Stop serving."""
+    self.server.shutdown()
+    self.server.server_close()
+    with self._cond:
+      self._cond.notify_all()
+
+  def update(self, chat_id: int, text: str) -> Dict[str, Any]:
+    """Build an update carrying a text message.
+
+    Args:
+      chat_id -- Private chat (and user) id of the sender.
+      text -- Message text.
+
+    Returns:
+      Update dictionary as served by the Bot API.
+    """
+    with self._cond:
+      self._update_id += 1
+      self._message_id += 1
+      message = {
+        'message_id': self._message_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User{}'.format(chat_id)},
+        'text': text}
+      if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+      return {'update_id': self._update_id, 'message': message}
+
+  def push(self, chat_id: int, text: str) -> float:
+    """Queue a user message to be delivered through `getUpdates`.
+
+    Args:
+      chat_id -- Private chat (and user) id of the sender.
+      text -- Message text.
+
+    Returns:
+      Timestamp (`time.perf_counter`) of when the update was queued.
+    """
+    update = self.update(chat_id, text)
+    start = time.perf_counter()
+    if self.webhook is not None:
+      Thread(target=self.deliver, args=(update,), daemon=True).start()
+      return start
+    with self._cond:
+      self._updates.append(update)
+      self._cond.notify_all()
+    return start
+
+  def deliver(self, update: Dict[str, Any], secret: Optional[str]=None) -> int:
+    """POST an update to the bot's webhook.
+
+    Args:
+      update -- Update dictionary.
+      secret -- Secret token header, defaults to the one set by the bot.
+
+    Returns:
+      HTTP status code of the webhook response.
+    """
+    headers = {'Content-Type': 'application/json'}
+    secret = self.secret if secret is None else secret
+    if secret:
+      headers['X-Telegram-Bot-Api-Secret-Token'] = secret
+    request = Request(self.webhook, data=json.dumps(update).encode(), headers=headers)
+    try:
+      with urlopen(request, timeout=30) as response:
+        status = response.status
+    except HTTPError as e:
+      status = e.code
+    except (URLError, OSError) as e:
+      logging.error('Webhook delivery failed: %s', e)
+      status = 0
+    with self._cond:
+      self.deliveries[status] = self.deliveries.get(status, 0) + 1
+    return status
+
+  def replies(self, chat_id: int) -> List[Tuple[float, str]]:
+    """Get every message sent by the bot to a chat.
+
+    Args:
+      chat_id -- Chat id to get messages from.
+
+    Returns:
+      List of (timestamp, text) tuples.
+    """
+    with self._cond:
+      return list(self._replies.get(chat_id, []))
+
+  def wait_replies(self, chat_id: int, since: int=0, settle: float=0.5,
+                   timeout: float=30.0) -> List[Tuple[float, str]]:
+    """Wait for the bot to answer a chat.
+
+    A turn is considered complete once at least one new message arrived and
+    no other message followed it for `settle` seconds.
+
+    Args:
+      chat_id -- Chat id to wait messages from.
+      since -- Number of messages already seen in this chat. (default: 0)
+      settle -- Quiet period ending the turn, in seconds. (default: 0.5)
+      timeout -- Maximum time to wait, in seconds. (default: 30.0)
+
+    Returns:
+      List of (timestamp, text) tuples sent after `since`, empty on timeout.
+    """
+    deadline = time.perf_counter() + timeout
+    with self._cond:
+      while True:
+        replies = self._replies.get(chat_id, [])[since:]
+        now = time.perf_counter()
+        if replies and now - replies[-1][0] >= settle:
+          return list(replies)
+        if now >= deadline:
+          return list(replies)
+        wait = deadline - now
+        if replies:
+          wait = min(wait, settle - (now - replies[-1][0]))
+        self._cond.wait(wait)
+
+  def _handle(self, request: BaseHTTPRequestHandler) -> None:
+    """Dispatch one Bot API call."""
+    method = request.path.rstrip('/').rsplit('/', 1)[-1]
+    params = self._params(request)
+    with self._cond:
+      self.calls[method] = self.calls.get(method, 0) + 1
+
+    handler = getattr(self, '_api_' + method.lower(), None)
+    result = handler(params) if handler is not None else True
+    body = json.dumps({'ok': True, 'result': result}).encode()
+    request.send_response(200)
+    request.send_header('Content-Type', 'application/json')
+    request.send_header('Content-Length', str(len(body)))
+    request.end_headers()
+    request.wfile.write(body)
+
+  def _params(self, request: BaseHTTPRequestHandler) -> Dict[str, Any]:
+    """Parse call parameters from either a JSON or a form encoded body."""
+    length = int(request.headers.get('Content-Length') or 0)
+    raw = request.rfile.read(length).decode() if length else ''
+    if not raw:
+      return {}
+    if 'json' in (request.headers.get('Content-Type') or ''):
+      return json.loads(raw)
+    params = {}
+    for k, v in parse_qsl(raw, keep_blank_values=True):
+      try:
+        params[k] = v if k == 'text' else json.loads(v)
+      except ValueError:
+        params[k] = v
+    return params
+
+  def _api_getme(self, _: Dict[str, Any]) -> Dict[str, Any]:
+    return BOT_USER
+
+  def _api_setwebhook(self, params: Dict[str, Any]) -> bool:
+    self.secret = params.get('secret_token')
+    self.webhook = params.get('url') or None
+    return True
+
+  def _api_deletewebhook(self, _: Dict[str, Any]) -> bool:
+    self.webhook = None
+    self.secret = None
+    return True
+
+  def _api_getupdates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    offset = int(params.get('offset') or 0)
+    timeout = float(params.get('timeout') or 0)
+    deadline = time.perf_counter() + timeout
+    with self._cond:
+      self._updates = [u for u in self._updates if u['update_id'] >= offset]
+      while not self._updates and time.perf_counter() < deadline:
+        self._cond.wait(deadline - time.perf_counter())
+      return list(self._updates)
+
+  def _api_sendmessage(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    chat_id = int(params['chat_id'])
+    with self._cond:
+      self._message_id += 1
+      self._replies.setdefault(chat_id, []).append((time.perf_counter(), params.get('text', '')))
+      self._cond.notify_all()
+      return {
+        'message_id': self._message_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': BOT_USER,
+        'text': params.get('text', '')}
@@ -4,17 +4,20 @@
 """Base interface."""
 
 import argparse
-from collections import defaultdict
 from json import JSONEncoder
 import logging
 import os
-from threading import Lock
-from typing import Any, DefaultDict, Dict
+import signal
+import threading
+from typing import Any, Dict
  
 from .singleton import *
 from fwnl.text import *
 from fwnl.values import *
 from fwnl.intent import *
+from fwnl.analysis import *
+from fwnl.audit import *
+from fwnl.engine import *
 
 DEFAULT_LOG_LEVEL = logging.INFO
 TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
@@ -37,7 +40,33 @@ class Interface(object, metaclass=SingletonABCMeta):
     help_msg = "verbosity logging level (INFO=%d DEBUG=%d)" % (logging.INFO, logging.DEBUG)
     parser.add_argument("--verbosity", "-v", help=help_msg, default=DEFAULT_LOG_LEVEL, type=int)
     parser.add_argument('-t', '--token', help='token for interface', default=os.environ.get('FWNL_TOKEN'))
+    parser.add_argument('--inventory', help='file with host and group aliases',
+                        default=os.environ.get('FWNL_INVENTORY'))
+    parser.add_argument('--rules', help='file with extra Rita rules, re-read on reload (SIGHUP)',
+                        default=os.environ.get('FWNL_RULES'))
+    parser.add_argument('--vectors', help='directory with pruned word vectors (see fwnl-vectors)',
+                        default=os.environ.get('FWNL_VECTORS'))
+    parser.add_argument('--cascade-margin', type=int, default=Cascade.margin,
+                        help='keyword votes an intent must lead by to skip similarity, 0 disables '
+                             '(default: FWNL_CASCADE_MARGIN or 1)')
+    parser.add_argument('--shared-vectors', action='store_true', default=Rules.shared,
+                        help='map the vectors read-only from the cache, shared by every process '
+                             '(default: FWNL_SHARED_VECTORS)')
+    parser.add_argument('--turn-budget', type=float, default=float(os.environ.get('FWNL_TURN_BUDGET', 10)),
+                        help='seconds a turn may take before degrading, 0 disables '
+                             '(default: FWNL_TURN_BUDGET or 10)')
+    parser.add_argument('--audit', help='JSONL file to keep an audit trail of generated configurations',
+                        default=os.environ.get('FWNL_AUDIT'))
+    parser.add_argument('--profile', metavar='DIR', default=os.environ.get('FWNL_PROFILE'),
+                        help='allow profiling turns on demand, saving profiles to DIR')
+    parser.add_argument('--session-ttl', type=float, help='seconds before idle sessions are evicted')
+    parser.add_argument('--max-sessions', type=int, help='maximum live sessions per process')
+    parser.add_argument('--spill', metavar='DIR', help='save evicted conversations to DIR to resume them')
+    parser.add_argument('--ruleset', help='deployed FWUnify configuration to check new intents against',
+                        default=os.environ.get('FWNL_RULESET'))
+    self.arguments(parser)
     self.args, unknown = parser.parse_known_args()
+    self.validate(parser)
 
     if self.args.verbosity == logging.DEBUG:
       logging.basicConfig(format='%(asctime)s %(levelname)s {%(module)s} [%(funcName)s] %(message)s',
@@ -45,8 +74,48 @@ class Interface(object, metaclass=SingletonABCMeta):
     else:
       logging.basicConfig(format='%(message)s',
                           datefmt=TIME_FORMAT, level=self.args.verbosity)
+    Rules.extra = self.args.rules
+    Rules.vectors = self.args.vectors
+    Rules.shared = self.args.shared_vectors
+    Cascade.margin = self.args.cascade_margin
+    Context.budget = self.args.turn_budget or None
+    if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+      signal.signal(signal.SIGHUP, lambda *_: threading.Thread(target=reload, daemon=True).start())
+    if self.args.audit is not None:
+      AuditLog().open(self.args.audit)
+    if self.args.inventory is not None:
+      Inventory().load(self.args.inventory)
+    Ruleset().resolver = Inventory().resolve
+    if self.args.ruleset is not None:
+      with open(self.args.ruleset) as f:
+        count = Ruleset().load(f.read())
+      logging.info("Loaded %d deployed rules from %s.", count, self.args.ruleset)
     logging.info("Bot %s interface has initialized!", self.nickname)
 
+  def arguments(self, parser: argparse.ArgumentParser) -> None:
+    """Add interface specific command line arguments.
+    
+    Args:
+      parser -- Argument parser shared by all interfaces.
+    """
+    pass
+
+  def validate(self, parser: argparse.ArgumentParser) -> None:
+    """Check interface specific arguments, exiting with `parser.error` if invalid.
+    
+    Args:
+      parser -- Argument parser the arguments were parsed with.
+    """
+    pass
+
+def reload() -> None:
+  """Reload intents' rules, matcher patterns and inventory without restarting."""
+  try:
+    Inventory().reload(force=True)
+    Rules().reload()
+  except Exception:
+    logging.exception('Reload failed, keeping the current rules.')
+
 class UserDataEncoder(JSONEncoder):
   """Custom JSON encoder for UserData class."""
   def default(self, obj: Any) -> Any:
@@ -67,6 +136,7 @@ class UserDataDecoder(object):
         elif d['label'] == 'TS':
           intent = TrafficShaping()
         intent.commands = d['commands']
+        intent.lines = d.get('lines')
         return intent
       else:
         if d.get('_data') is not None:
@@ -75,6 +145,9 @@ class UserDataDecoder(object):
           ud.intent = d['_data'].get('1')
           ud.command = d['_data'].get('2')
           ud.counter = d['_data'].get('3')
+          ud.started = d['_data'].get('4')
+          ud.queue = d['_data'].get('5')
+          ud.history = d['_data'].get('6') or []
           return ud
         else:
           return d
@@ -117,149 +190,19 @@ class UserDataDecoder(object):
       cmd = For()
     cmd.value = d['value']
     cmd.values = d['values']
+    cmd.filled = d.get('filled', False)
     return cmd
 
-class UserData(object):
+class UserData(Session):
   """User data for interface."""
-
-  def __init__(self):
-    """Initialize the user data."""
-    self._lock: RLock = RLock()
-    self._data: DefaultDict[int, Any] = defaultdict(int)
-
-    self._rules = Rules()
-    self._intents = [ACL(), TrafficShaping()]
-    self._rules.setup()
-
-  def __getitem__(self, key: int) -> Any:
-    """Get user data item.
-    
-    Args:
-      key -- Key number of the item.
-      
-    Returns:
-      User data item.
-    """
-    with self._lock:
-      return self._data.get(key, None)
-  
-  def __setitem__(self, key: int, value: Any) -> None:
-    """Set user data item.
-    
-    Args:
-      key -- Key number of the item.
-      value -- New value for the item.
-    """
-    with self._lock:
-      self._data[key] = value
-
-  def __delitem__(self, key: int) -> None:
-    """Delete user data item.
-    
-    Args:
-      key -- Key number of the item.
-    """
-    with self._lock:
-      del self._data[key]
-  
-  @property
-  def state(self) -> str:
-    """Get the current state of the user."""
-    return self[0]
-
-  @state.setter
-  def state(self, value: str) -> None:
-    """Set the current state of the user."""
-    self[0] = value
-
-  @state.deleter
-  def state(self) -> None:
-    """Delete the current state of the user."""
-    del self[0]
-
-  @property
-  def intents(self) -> List[Intent]:
-    """Get all available intents."""
-    with self._lock:
-      return self._intents
-  
-  @property
-  def intent(self) -> Intent:
-    """Get the current intent of the user."""
-    return self[1]
-
-  @intent.setter
-  def intent(self, value: Intent) -> None:
-    """Set the current intent of the user."""
-    self[1] = value
-  
-  @intent.deleter
-  def intent(self) -> None:
-    """Delete the current intent of the user."""
-    del self[1]
-
-  @property
-  def command(self) -> str:
-    """Get the current command of the user."""
-    return self[2]
-  
-  @command.setter
-  def command(self, value: str) -> None:
-    """Set the current command of the user."""
-    self[2] = value
-
-  @command.deleter
-  def command(self) -> None:
-    """Delete the current command of the user."""
-    del self[2]
-
-  @property
-  def counter(self) -> int:
-    """Get the current counter of the user."""
-    return self[3]
-  
-  @counter.setter
-  def counter(self, value: int) -> None:
-    """Set the current counter of the user."""
-    self[3] = value
-  
-  @counter.deleter
-  def counter(self) -> None:
-    """Delete the current counter of the user."""
-    del self[3]
-  
-  def closest(self, text: str) -> Tuple[Intent, float]:
-    """Get the closest intent.
-    
-    Args:
-      text -- Text to be analyzed.
-    
-    Returns:
-      The closest intent and its score.
-    """
-    text = Text(text)
-    closest = None
-    closest_sim = -1
-    for intent in self.intents:
-      kw = self._rules.patterns[intent.label]
-      similarity = text.similarity(Text(intent.desc)) + text.match(kw)
-      for ent in text.docp.ents:
-        if ent.label_ == intent.label:
-          similarity += 1
-      if similarity > closest_sim:
-        closest = intent
-        closest_sim = similarity
-    return closest, closest_sim
-  
-  def clear(self) -> None:
-    """Clear the user data."""
-    del self.state
-    del self.intent
-    del self.command
-    del self.counter
+  pass
 
 class Context(object, metaclass=ABCMeta):
   """Context model for each user instance."""
+  channel: str = None
+  profile: Profile = None
+  budget: float = None
+  engine: Engine = Engine()
 
   @abstractmethod
   async def say(self, text: str) -> None:
@@ -277,43 +220,28 @@ class Context(object, metaclass=ABCMeta):
     Args:
       text -- Text to be processed.
       user_data -- User data class with current states.
+
+    The turn is profiled if `profile` is set (see `fwnl.profiler.Profile`),
+    and degrades once it takes longer than `budget` seconds (see `Engine.step`).
     """
-    if user_data.state is None:
-      user_data.intent, _ = user_data.closest(text)
-      user_data.command = Confirm(user_data.intent.label, user_data.intent.desc)
-      await self.say(user_data.command.question())
-      user_data.state = 'confirm_intent'
-      return
-    if user_data.state == 'confirm_intent':
-      if user_data.command.verify(text):
-        await self.say(user_data.intent.question())
-        user_data.state = 'questions'
-        user_data.counter = 0
-        user_data.command = user_data.intent.commands[user_data.counter]
-        await self.say(user_data.command.question())
-      else:
-        await self.say("Ok, we will not do that.")
-        user_data.state = None
-      return
-    if user_data.state == 'questions':
-      success, msg = user_data.command.verify(text)
-      await self.say(msg)
-      if success:
-        user_data.state = 'next_command'
-        user_data.intent.commands[user_data.counter] = user_data.command
-      else:
-        return
-    if user_data.state == 'next_command':
-      user_data.counter += 1
-      if user_data.counter < len(user_data.intent.commands):
-        user_data.command = user_data.intent.commands[user_data.counter]
-        await self.say(user_data.command.question())
-        user_data.state = 'questions'
-      else:
-        await self.say("Here's your final configuration:")
-        await self.say(user_data.intent.generate())
-        user_data.state = None
+    if self.profile is None:
+      for response in self.engine.iterate(user_data, text, self.channel, self.budget):
+        await self.say(response)
+    else:
+      with self.profile.run():
+        for response in self.engine.iterate(user_data, text, self.channel, self.budget):
+          await self.say(response)
   
+  async def choose(self, data: str, user_data: UserData) -> None:
+    """Answer with one of the choices offered by a previous `Reply`.
+    
+    Args:
+      data -- Data of the chosen answer.
+      user_data -- User data class with current states.
+    """
+    for response in self.engine.choose(user_data, data, self.channel):
+      await self.say(response)
+
   @abstractmethod
   async def skip(self, user_data: UserData) -> None:
     """Skip user's current state.
@@ -321,9 +249,5 @@ class Context(object, metaclass=ABCMeta):
     Args:
       user_data -- User data class with current states.
     """
-    if user_data.state == 'questions':
-      if user_data.command.default():
-        user_data.state = 'next_command'
-        await self.process('') # NOTE: calling derived class method
-      else:
-        await self.say("You can't skip this question.")
+    for response in self.engine.skip(user_data, self.channel):
+      await self.say(response)
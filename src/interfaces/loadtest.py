@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Load-testing harness for the bot interfaces."""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import json
+import logging
+import math
+import os
+import socket
+import subprocess
+import sys
+from threading import Lock
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from .botapi import *
+
+# each message with a text one of the bot's replies must contain, or the conversation derailed
+SCRIPTS: Dict[str, List[Tuple[str, str]]] = {
+  'acl': [
+    ('i want to block access', 'make ACL'),
+    ('yes', 'property Name'),
+    ('webfilter', 'property From'),
+    ('10.0.0.5', 'property To'),
+    ('server', 'property Block'),
+    ('ssh', 'property Order'),
+    ('before', 'final configuration')],
+  'ts': [
+    ('i want to limit traffic', 'make TS'),
+    ('yes', 'property Name'),
+    ('shaper', 'property From'),
+    ('laboratory', 'property To'),
+    ('any', 'property Order'),
+    ('after', 'property For'),
+    ('http', 'property With'),
+    ('10mbps', 'final configuration')],
+}
+
+def answered(replies: List[str], expected: str) -> bool:
+  """Check if a turn went as scripted.
+
+  Args:
+    replies -- Replies to the turn.
+    expected -- Text one of them must contain (case insensitive).
+
+  Returns:
+    True if some reply contains the expected text.
+  """
+  return any(expected.lower() in reply.lower() for reply in replies)
+
+def percentile(samples: List[float], p: float) -> float:
+  """Nearest-rank percentile.
+
+  Args:
+    samples -- Sorted list of samples.
+    p -- Percentile between 0 and 100.
+
+  Returns:
+    The percentile value, or 0.0 if there are no samples.
+  """
+  if not samples:
+    return 0.0
+  rank = max(1, math.ceil(p / 100 * len(samples)))
+  return samples[min(rank, len(samples)) - 1]
+
+class Report(object):
+  """Thread-safe collector of turn latencies and errors."""
+
+  def __init__(self, target: str, concurrency: int):
+    """Initialize the report.
+
+    Args:
+      target -- Name of the interface under test.
+      concurrency -- Number of simultaneous conversations.
+    """
+    self.target = target
+    self.concurrency = concurrency
+    self.latencies: List[float] = []
+    self.errors: Dict[str, int] = {}
+    self.conversations = 0
+    self.started = time.perf_counter()
+    self.finished = self.started
+    self._lock = Lock()
+
+  def turn(self, latency: float) -> None:
+    """Record a successful turn.
+
+    Args:
+      latency -- Turn latency, in seconds.
+    """
+    with self._lock:
+      self.latencies.append(latency)
+
+  def error(self, kind: str) -> None:
+    """Record a failed turn.
+
+    Args:
+      kind -- Short description of the failure.
+    """
+    with self._lock:
+      self.errors[kind] = self.errors.get(kind, 0) + 1
+
+  def done(self) -> None:
+    """Record a finished conversation."""
+    with self._lock:
+      self.conversations += 1
+      self.finished = time.perf_counter()
+
+  def summary(self) -> Dict[str, Any]:
+    """Summarize collected samples.
+
+    Returns:
+      Dictionary with throughput, latency percentiles (ms) and error rate.
+    """
+    with self._lock:
+      latencies = sorted(self.latencies)
+      errors = sum(self.errors.values())
+      elapsed = max(self.finished - self.started, 1e-9)
+      turns = len(latencies) + errors
+      return {
+        'target': self.target,
+        'concurrency': self.concurrency,
+        'conversations': self.conversations,
+        'turns': turns,
+        'elapsed_s': round(elapsed, 3),
+        'turns_per_s': round(len(latencies) / elapsed, 2),
+        'conversations_per_s': round(self.conversations / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'error_rate': round(errors / turns, 4) if turns else 0.0,
+        'errors': dict(self.errors)}
+
+  def __str__(self) -> str:
+    s = self.summary()
+    msg = '{target}: {conversations} conversations, {turns} turns in {elapsed_s}s ' + \
+          '(concurrency {concurrency})\n'
+    msg += '  throughput: {turns_per_s} turns/s, {conversations_per_s} conversations/s\n'
+    msg += '  latency: p50 {p50_ms}ms, p95 {p95_ms}ms, p99 {p99_ms}ms\n'
+    msg += '  error rate: {error_rate}'
+    msg = msg.format(**s)
+    for kind, count in s['errors'].items():
+      msg += '\n    {}: {}'.format(kind, count)
+    return msg
+
+class WebDriver(object):
+  """Replays conversations against the web interface `/bot` endpoint."""
+
+  def __init__(self, url: str, timeout: float=30.0):
+    """Initialize the driver.
+
+    Args:
+      url -- Base URL of the web interface.
+      timeout -- Per request timeout, in seconds. (default: 30.0)
+    """
+    self.url = url.rstrip('/') + '/bot'
+    self.timeout = timeout
+
+  def converse(self, user: int, script: List[Tuple[str, str]], report: Report) -> None:
+    """Run one scripted conversation.
+
+    A turn whose replies don't contain the expected text (e.g. "Sorry, I
+    don't understand.") is an error, and ends the conversation.
+
+    Args:
+      user -- Virtual user number.
+      script -- Messages to be sent in order, with their expected reply (see `SCRIPTS`).
+      report -- Report to record results into.
+    """
+    user_data = None
+    for text, expected in script:
+      body = json.dumps({'user_data': user_data, 'text': text}).encode()
+      request = Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+      start = time.perf_counter()
+      try:
+        with urlopen(request, timeout=self.timeout) as response:
+          data = json.loads(response.read())
+      except HTTPError as e:
+        report.error('http {}'.format(e.code))
+        return
+      except (URLError, OSError, ValueError) as e:
+        report.error(type(e).__name__)
+        return
+      latency = time.perf_counter() - start
+      if not answered(data.get('responses', []), expected):
+        report.error('unexpected reply')
+        logging.debug('Expected %r after %r, got %r.', expected, text, data.get('responses'))
+        return
+      report.turn(latency)
+      user_data = data.get('user_data')
+    report.done()
+
+class TelegramDriver(object):
+  """Replays conversations against the Telegram interface through `FakeBotAPI`."""
+
+  def __init__(self, api: FakeBotAPI, settle: float=0.5, timeout: float=30.0):
+    """Initialize the driver.
+
+    Args:
+      api -- Running Bot API stand-in the bot is connected to.
+      settle -- Quiet period ending a turn, in seconds. (default: 0.5)
+      timeout -- Maximum time to wait for an answer, in seconds. (default: 30.0)
+    """
+    self.api = api
+    self.settle = settle
+    self.timeout = timeout
+    self._chats = itertools.count(1000)
+
+  def converse(self, user: int, script: List[Tuple[str, str]], report: Report) -> None:
+    """Run one scripted conversation.
+    See `WebDriver.converse` for more details."""
+    chat_id = next(self._chats)
+    seen = 0
+    for text, expected in script:
+      start = self.api.push(chat_id, text)
+      replies = self.api.wait_replies(chat_id, seen, self.settle, self.timeout)
+      if not replies:
+        report.error('timeout')
+        return
+      seen += len(replies)
+      if not answered([reply for _, reply in replies], expected):
+        report.error('unexpected reply')
+        logging.debug('Expected %r after %r, got %r.', expected, text, replies)
+        return
+      report.turn(replies[-1][0] - start)
+    report.done()
+
+def run(driver: Any, target: str, scripts: List[str],
+        conversations: int, concurrency: int) -> Report:
+  """Replay conversations at the given concurrency.
+
+  Args:
+    driver -- Interface driver with a `converse` method.
+    target -- Name of the interface under test.
+    scripts -- Names of the scripts to cycle through.
+    conversations -- Total number of conversations.
+    concurrency -- Number of simultaneous virtual users.
+
+  Returns:
+    Report with all collected samples.
+  """
+  report = Report(target, concurrency)
+  queue = itertools.cycle(scripts)
+  jobs = [SCRIPTS[next(queue)] for _ in range(conversations)]
+  lock = Lock()
+
+  def user(n: int) -> None:
+    while True:
+      with lock:
+        if not jobs:
+          return
+        script = jobs.pop()
+      driver.converse(n, script, report)
+
+  with ThreadPoolExecutor(max_workers=concurrency) as pool:
+    for future in [pool.submit(user, n) for n in range(concurrency)]:
+      future.result()
+  return report
+
+def connected(api: FakeBotAPI) -> bool:
+  """Check if a bot is polling the stand-in or has set a webhook on it."""
+  return api.calls.get('getUpdates', 0) > 0 or api.webhook is not None
+
+def spawn_bot(api: FakeBotAPI, token: str, webhook: bool=False) -> subprocess.Popen:
+  """Start a Telegram interface process connected to the stand-in.
+
+  Args:
+    api -- Running Bot API stand-in.
+    token -- Bot token to be used (any value is accepted by the stand-in).
+    webhook -- Run the bot in webhook mode on a free local port. (default: False)
+
+  Returns:
+    Bot process handle.
+  """
+  cmd = [sys.executable, '-m', 'interfaces.telegram', '-t', token, '--api-url', api.url]
+  if webhook:
+    with socket.socket() as s:
+      s.bind(('127.0.0.1', 0))
+      port = s.getsockname()[1]
+    cmd += ['--webhook', '--listen', '127.0.0.1:{}'.format(port)]
+  process = subprocess.Popen(cmd, env=os.environ.copy())
+  deadline = time.perf_counter() + 300
+  while not connected(api):
+    if process.poll() is not None or time.perf_counter() > deadline:
+      raise RuntimeError('Telegram interface did not connect to the stand-in.')
+    time.sleep(0.2)
+  return process
+
+def main():
+  """Main function."""
+  parser = argparse.ArgumentParser(description='Replay scripted conversations against fwnl interfaces.')
+  parser.add_argument('target', choices=['web', 'telegram'], help='interface under test')
+  parser.add_argument('--url', default='http://127.0.0.1:80', help='web interface base URL')
+  parser.add_argument('--scripts', default='acl,ts', help='comma separated scripts to replay (acl, ts)')
+  parser.add_argument('-n', '--conversations', type=int, default=100, help='total conversations')
+  parser.add_argument('-c', '--concurrency', type=int, default=10, help='simultaneous conversations')
+  parser.add_argument('--timeout', type=float, default=30.0, help='per turn timeout in seconds')
+  parser.add_argument('--settle', type=float, default=0.5,
+                      help='quiet period ending a Telegram turn in seconds')
+  parser.add_argument('--no-spawn', action='store_true',
+                      help="don't start the Telegram interface, wait for one to connect")
+  parser.add_argument('--webhook', action='store_true',
+                      help='start the Telegram interface in webhook mode')
+  parser.add_argument('--json', action='store_true', help='print report as JSON')
+  args = parser.parse_args()
+  logging.basicConfig(format='%(message)s', level=logging.INFO)
+
+  scripts = [s.strip() for s in args.scripts.split(',') if s.strip()]
+  for s in scripts:
+    if s not in SCRIPTS:
+      parser.error('unknown script: {}'.format(s))
+
+  process: Optional[subprocess.Popen] = None
+  api: Optional[FakeBotAPI] = None
+  try:
+    if args.target == 'web':
+      driver = WebDriver(args.url, args.timeout)
+    else:
+      api = FakeBotAPI().start()
+      if args.no_spawn:
+        logging.info('Start the bot with: fwnl-telegram -t 0:loadtest --api-url %s', api.url)
+        while not connected(api):
+          time.sleep(0.2)
+      else:
+        process = spawn_bot(api, '0:loadtest', args.webhook)
+      driver = TelegramDriver(api, args.settle, args.timeout)
+    report = run(driver, args.target, scripts, args.conversations, args.concurrency)
+  except KeyboardInterrupt:
+    sys.exit(1)
+  finally:
+    if process is not None:
+      process.terminate()
+      process.wait()
+    if api is not None:
+      api.stop()
+
+  print(json.dumps(report.summary()) if args.json else report)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Idle session eviction and accounting."""
+
+from collections import OrderedDict
+import json
+import logging
+import os
+import re
+import sys
+from threading import Lock
+import time
+from types import FunctionType, ModuleType
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from .interface import *
+
+def footprint(obj: Any) -> int:
+  """Approximate the memory held by an object graph.
+
+  Singletons (the shared rules and model), classes, modules and functions
+  are not counted.
+
+  Args:
+    obj -- Root object.
+
+  Returns:
+    Size in bytes.
+  """
+  seen = set()
+  stack = [obj]
+  size = 0
+  while stack:
+    o = stack.pop()
+    if id(o) in seen or isinstance(o, (type, ModuleType, FunctionType)) or \
+        isinstance(type(o), SingletonMeta):
+      continue
+    seen.add(id(o))
+    size += sys.getsizeof(o)
+    if isinstance(o, dict):
+      stack.extend(o.keys())
+      stack.extend(o.values())
+    elif isinstance(o, (list, tuple, set, frozenset)):
+      stack.extend(o)
+    if hasattr(o, '__dict__'):
+      stack.append(o.__dict__)
+  return size
+
+class Sessions(object):
+  """Last access of live sessions, to evict idle (TTL) and least recently used ones.
+
+  Evicted sessions in the middle of a conversation are spilled to disk, if
+  a spill directory is set, and restored on their next message.
+  """
+  interval = float(os.environ.get('FWNL_SWEEP_INTERVAL', 60))
+  report_interval = 900.0
+
+  def __init__(self, ttl: float=None, capacity: int=None, spill: str=None):
+    """Initialize session tracking.
+
+    Args:
+      ttl -- Seconds a session may stay idle. (default: FWNL_SESSION_TTL or 1 day)
+      capacity -- Maximum live sessions. (default: FWNL_MAX_SESSIONS or 10000)
+      spill -- Directory to save evicted sessions to. (default: FWNL_SPILL)
+    """
+    self.ttl = ttl or float(os.environ.get('FWNL_SESSION_TTL', 86400))
+    self.capacity = capacity or int(os.environ.get('FWNL_MAX_SESSIONS', 10000))
+    self.spill = spill if spill is not None else os.environ.get('FWNL_SPILL')
+    self._seen: 'OrderedDict[Hashable, Tuple[float, UserData]]' = OrderedDict()
+    self._lock = Lock()
+    self.metrics = {'evicted': 0, 'spilled': 0, 'restored': 0}
+
+  def __len__(self) -> int:
+    return len(self._seen)
+
+  def __contains__(self, key: Hashable) -> bool:
+    return key in self._seen
+
+  def touch(self, key: Hashable, user_data: UserData) -> None:
+    """Mark a session as used now.
+
+    Args:
+      key -- Session key (e.g. Telegram user id).
+      user_data -- User data of the session.
+    """
+    with self._lock:
+      self._seen.pop(key, None)
+      self._seen[key] = (time.monotonic(), user_data)
+
+  def forget(self, key: Hashable) -> None:
+    """Stop tracking a session.
+
+    Args:
+      key -- Session key.
+    """
+    with self._lock:
+      self._seen.pop(key, None)
+
+  def expired(self) -> List[Tuple[Hashable, UserData]]:
+    """Remove idle and least recently used sessions beyond capacity.
+
+    Sessions in the middle of a conversation are spilled to disk (if
+    enabled) before being returned.
+
+    Returns:
+      List of (key, user data) tuples to be dropped by the caller.
+    """
+    evicted = []
+    deadline = time.monotonic() - self.ttl
+    with self._lock:
+      while self._seen:
+        key, (seen, user_data) = next(iter(self._seen.items()))
+        if seen > deadline and len(self._seen) <= self.capacity:
+          break
+        del self._seen[key]
+        evicted.append((key, user_data))
+      self.metrics['evicted'] += len(evicted)
+    for key, user_data in evicted:
+      if self.spill is not None and user_data.state is not None:
+        self.save(key, user_data)
+    return evicted
+
+  def _path(self, key: Hashable) -> str:
+    return os.path.join(self.spill, '{}.json'.format(re.sub(r'[^\w.-]+', '_', str(key))))
+
+  def save(self, key: Hashable, user_data: UserData) -> None:
+    """Spill a session to disk.
+
+    Args:
+      key -- Session key.
+      user_data -- User data to be saved.
+    """
+    path = self._path(key)
+    try:
+      os.makedirs(self.spill, exist_ok=True)
+      with open(path + '.tmp', 'w') as f:
+        json.dump(user_data, f, cls=UserDataEncoder)
+      os.replace(path + '.tmp', path)
+      self.metrics['spilled'] += 1
+    except (OSError, TypeError, ValueError) as e:
+      logging.warning('Could not spill session %s: %s', key, e)
+
+  def load(self, key: Hashable) -> Optional[UserData]:
+    """Take a spilled session back from disk.
+
+    Args:
+      key -- Session key.
+
+    Returns:
+      Restored user data, or None if the session wasn't spilled.
+    """
+    if self.spill is None:
+      return None
+    path = self._path(key)
+    try:
+      with open(path) as f:
+        user_data = json.load(f, object_hook=UserDataDecoder.default)
+      os.remove(path)
+    except FileNotFoundError:
+      return None
+    except (OSError, KeyError, TypeError, ValueError) as e:
+      logging.warning('Could not restore session %s: %s', key, e)
+      return None
+    self.metrics['restored'] += 1
+    return user_data
+
+  def stats(self, sample: int=100) -> Dict[str, Any]:
+    """Get session counters and approximate memory.
+
+    Args:
+      sample -- Sessions measured to estimate bytes per session. (default: 100)
+
+    Returns:
+      Dictionary with live, evicted, spilled and restored sessions, and
+      approximate bytes per session.
+    """
+    with self._lock:
+      sessions = [user_data for _, user_data in list(self._seen.values())[-sample:]]
+      stats = dict(self.metrics, live=len(self._seen))
+    stats['session_bytes'] = sum(map(footprint, sessions)) // len(sessions) if sessions else 0
+    return stats
+
+  def report(self) -> None:
+    """Log live sessions and their approximate memory."""
+    stats = self.stats()
+    logging.info('Sessions: %d live (~%d bytes each), %d evicted, %d spilled, %d restored.',
+                 stats['live'], stats['session_bytes'], stats['evicted'],
+                 stats['spilled'], stats['restored'])
@@ -12,10 +12,11 @@ class SingletonMeta(type):
 
   def __call__(cls, *args, **kwargs) -> object:
     try:
-      return cls.__instance
-    except AttributeError:
+      return cls.__dict__['_SingletonMeta__instance']
+    except KeyError:
       with cls._lock:
-        cls.__instance = super().__call__(*args, **kwargs)
+        if '_SingletonMeta__instance' not in cls.__dict__:
+          cls.__instance = super().__call__(*args, **kwargs)
       return cls.__instance
 
 class SingletonABCMeta(SingletonMeta, ABCMeta):
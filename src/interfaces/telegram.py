@@ -3,20 +3,27 @@
 
 """Telegram interface."""
 
+import asyncio
+import queue
+import secrets
 import sys
-from telegram import Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import (
   Application,
   ApplicationBuilder,
   CallbackContext,
+  CallbackQueryHandler,
   CommandHandler,
   ContextTypes,
   ExtBot,
   filters,
   MessageHandler,
+  TypeHandler,
 )
 
 from .interface import *
+from .sessions import *
+from .workers import *
 
 class TelegramContext(CallbackContext[ExtBot, UserData, dict, dict], Context):
   """Custom class for context."""
@@ -25,11 +32,13 @@ class TelegramContext(CallbackContext[ExtBot, UserData, dict, dict], Context):
     super().__init__(application=application, chat_id=chat_id, user_id=user_id)
     self._chat_id = chat_id
     self._user_id = user_id
+    self.channel = 'telegram:{}'.format(chat_id)
 
   async def say(self, message: str) -> None:
-    """Say something to the user.
+    """Say something to the user, with a keyboard for replies offering choices.
     See `Context.say` for more details."""
-    await self.bot.send_message(chat_id=self._chat_id, text=message)
+    await self.bot.send_message(chat_id=self._chat_id, text=message,
+                                reply_markup=keyboard(getattr(message, 'choices', None)))
 
   async def process(self, text: str) -> None:
     """Process user's text.
@@ -41,16 +50,77 @@ class TelegramContext(CallbackContext[ExtBot, UserData, dict, dict], Context):
     See `Context.skip` for more details."""
     await super().skip(self.user_data)
 
+  async def choose(self, data: str) -> None:
+    """Answer with a keyboard choice.
+    See `Context.choose` for more details."""
+    await super().choose(data, self.user_data)
+
+def keyboard(choices: List[Tuple[str, str]], columns: int=3) -> Optional[InlineKeyboardMarkup]:
+  """Build an inline keyboard.
+
+  Args:
+    choices -- List of (label, callback data) tuples.
+    columns -- Buttons per row. (default: 3)
+
+  Returns:
+    Keyboard, or None if there are no choices.
+  """
+  if not choices:
+    return None
+  buttons = [InlineKeyboardButton(label, callback_data=data) for label, data in choices]
+  return InlineKeyboardMarkup([buttons[i:i + columns] for i in range(0, len(buttons), columns)])
+
+async def touch(update: Update, context: TelegramContext) -> None:
+  """Track the user's session, restoring it if it was spilled to disk."""
+  user = update.effective_user
+  if user is None:
+    return
+  sessions: Sessions = context.bot_data['sessions']
+  if user.id not in sessions:
+    spilled = sessions.load(user.id)
+    if spilled is not None:
+      context.user_data.restore(spilled)
+  sessions.touch(user.id, context.user_data)
+
+async def sweep(app: Application) -> None:
+  """Evict idle sessions and report live ones, periodically."""
+  sessions: Sessions = app.bot_data['sessions']
+  reported = time.monotonic()
+  while True:
+    await asyncio.sleep(Sessions.interval)
+    for key, _ in sessions.expired():
+      app.drop_user_data(key)
+    if time.monotonic() - reported >= Sessions.report_interval:
+      sessions.report()
+      reported = time.monotonic()
+
+async def post_init(app: Application) -> None:
+  """Start the session sweeper."""
+  app.bot_data['sweeper'] = asyncio.get_running_loop().create_task(sweep(app))
+
+async def post_shutdown(app: Application) -> None:
+  """Stop the session sweeper."""
+  sweeper = app.bot_data.get('sweeper')
+  if sweeper is not None:
+    sweeper.cancel()
+
 async def handler(update: Update, context: TelegramContext) -> None:
   """Handle all non-command messages."""
   await context.process(update.message.text.lower())
 
 async def start(update: Update, context: TelegramContext) -> None:
   """Start the bot."""
-  await context.bot.send_message(chat_id=update.effective_chat.id, text='''
+  await context.say(context.engine.intents_reply('''
     Welcome to the FWNL chat bot!\n
     Please, say what you want to do, or '/help' to see the commands list.
-  '''.strip())
+  '''.strip()))
+
+async def choose(update: Update, context: TelegramContext) -> None:
+  """Handle keyboard answers, removing the keyboard so it's used once."""
+  query = update.callback_query
+  await query.answer()
+  await query.edit_message_reply_markup(None)
+  await context.choose(query.data)
 
 async def help(update: Update, context: TelegramContext) -> None:
   """Help command."""
@@ -58,6 +128,7 @@ async def help(update: Update, context: TelegramContext) -> None:
   msg += '/help - show the command list\n'
   for intent in context.user_data.intents:
     msg += '/{} - create {}\n'.format(intent.label.lower(), intent.desc)
+  msg += 'edit <property> - change a property of your last configuration\n'
   await context.bot.send_message(chat_id=update.effective_chat.id, text=msg)
 
 async def cancel(_: Update, context: TelegramContext) -> None:
@@ -74,33 +145,162 @@ async def skip(_: Update, context: TelegramContext) -> None:
   """Skip the current state."""
   await context.skip()
 
+async def profile(update: Update, context: TelegramContext) -> None:
+  """Process the command's text with profiling, and send the profile to admins."""
+  directory = context.bot_data.get('profile')
+  user = update.effective_user
+  if directory is None or user is None or user.id not in context.bot_data.get('admins', ()):
+    return
+  context.profile = Profile(context.channel)
+  await context.process(' '.join(context.args).lower())
+  path = await asyncio.get_running_loop().run_in_executor(None, context.profile.save, directory)
+  await context.say('{}\n\nSaved to {}'.format(context.profile.report(limit=5)[:3500], path))
+
+async def dispatch(update: Update, context: TelegramContext) -> None:
+  """Hand an update over to the worker owning its chat."""
+  if update.effective_chat is not None:
+    key = update.effective_chat.id
+  elif update.effective_user is not None:
+    key = update.effective_user.id
+  else:
+    key = 0
+  context.bot_data['supervisor'].submit(key, update.to_dict())
+
+async def stop_workers(app: Application) -> None:
+  """Stop the worker processes."""
+  await asyncio.get_running_loop().run_in_executor(None, app.bot_data['supervisor'].stop)
+
+def serve(index: int, updates: Any, heartbeat: Any) -> None:
+  """Worker process entry point.
+  See `Supervisor` for more details."""
+  interface = TelegramInterface(worker=index)
+  try:
+    asyncio.run(interface.work(updates, heartbeat))
+  except KeyboardInterrupt:
+    pass
+
 class TelegramInterface(Interface):
   """Telegram interface."""
 
-  def __init__(self):
+  def __init__(self, worker: int=None):
+    """Initialize the interface.
+
+    With `--workers`, this process only reads updates and dispatches them
+    by chat id to worker processes, which handle them.
+
+    Args:
+      worker -- Index of this worker process. (default: None)
+    """
     super().__init__('Telegram')
+    self.worker = worker
+    self.reader = worker is None and self.args.workers > 0
     context_types = ContextTypes(context=TelegramContext, user_data=UserData)
 
     try:
-      self.app = ApplicationBuilder().token(self.args.token).context_types(context_types).build()
+      builder = ApplicationBuilder().token(self.args.token).context_types(context_types)
+      if self.reader:
+        builder = builder.post_shutdown(stop_workers)
+      else:
+        builder = builder.post_init(post_init).post_shutdown(post_shutdown)
+      if worker is not None:
+        builder = builder.updater(None)
+      if self.args.api_url is not None:
+        builder = builder.base_url(self.args.api_url)
+      self.app = builder.build()
     except AttributeError:
       logging.error('No token provided. Exiting.')
       sys.exit(1)
 
+    if self.reader:
+      self.app.bot_data['supervisor'] = Supervisor(serve, self.args.workers)
+      self.app.add_handler(TypeHandler(Update, dispatch))
+      return
+    if worker is not None and self.args.audit is not None:
+      AuditLog().open('{}.{}'.format(self.args.audit, worker))
+
+    self.app.bot_data['sessions'] = Sessions(self.args.session_ttl, self.args.max_sessions, self.args.spill)
+    self.app.add_handler(TypeHandler(Update, touch), group=-1)
     msg_handler = MessageHandler(filters.TEXT & (~filters.COMMAND), handler)
     self.app.add_handler(msg_handler)
     self.app.add_handler(CommandHandler('start', start))
     self.app.add_handler(CommandHandler('help', help))
     self.app.add_handler(CommandHandler('cancel', cancel))
     self.app.add_handler(CommandHandler('skip', skip))
+    self.app.add_handler(CommandHandler('profile', profile))
+    self.app.add_handler(CallbackQueryHandler(choose))
+    self.app.bot_data['profile'] = self.args.profile
+    self.app.bot_data['admins'] = {int(i) for i in self.args.admins.split(',') if i.strip()}
     
     temp_data = UserData()
     for intent in temp_data.intents:
       self.app.add_handler(CommandHandler(intent.label.lower(), commands))
 
+  def arguments(self, parser: argparse.ArgumentParser) -> None:
+    """Add Telegram arguments.
+    See base class for more details."""
+    parser.add_argument('--admins', default=os.environ.get('FWNL_ADMINS', ''),
+                        help='comma separated Telegram user ids allowed to /profile')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('FWNL_WORKERS', 0)),
+                        help='worker processes handling updates, sharded by chat (default: 0, handle them here)')
+    parser.add_argument('--api-url', help='Bot API base URL (e.g. a local stand-in)',
+                        default=os.environ.get('FWNL_API_URL'))
+    parser.add_argument('--webhook', action='store_true', help='receive updates through a webhook')
+    parser.add_argument('--listen', default=os.environ.get('FWNL_LISTEN', '0.0.0.0:8443'),
+                        help='webhook listen address (host:port)')
+    parser.add_argument('--url-path', default='telegram', help='webhook URL path')
+    parser.add_argument('--webhook-url', default=os.environ.get('FWNL_WEBHOOK_URL'),
+                        help='public HTTPS webhook URL given to Telegram (required with --webhook, '
+                             'unless --api-url is set)')
+    parser.add_argument('--secret', default=os.environ.get('FWNL_WEBHOOK_SECRET'),
+                        help='webhook secret token (default: random)')
+
+  def validate(self, parser: argparse.ArgumentParser) -> None:
+    """Require a public webhook URL, Telegram can't reach the listen address.
+    See base class for more details."""
+    if self.args.webhook and self.args.webhook_url is None and self.args.api_url is None:
+      parser.error('--webhook requires --webhook-url (or FWNL_WEBHOOK_URL), '
+                   'the public HTTPS URL Telegram delivers updates to')
+
+  async def work(self, updates: Any, heartbeat: Any) -> None:
+    """Handle updates from the reader process until it sends None.
+
+    Args:
+      updates -- Queue of updates (as dictionaries).
+      heartbeat -- Shared timestamp, updated at least every second while idle.
+    """
+    loop = asyncio.get_running_loop()
+    async with self.app:
+      await post_init(self.app)
+      await self.app.start()
+      logging.info('Worker %d is ready.', self.worker)
+      while True:
+        heartbeat.value = time.time()
+        try:
+          data = await loop.run_in_executor(None, updates.get, True, 1.0)
+        except queue.Empty:
+          continue
+        if data is None:
+          break
+        await self.app.process_update(Update.de_json(data, self.app.bot))
+      await self.app.stop()
+      await post_shutdown(self.app)
+
   def start(self) -> None:
     """Start the interface."""
-    self.app.run_polling()
+    if self.reader:
+      self.app.bot_data['supervisor'].start()
+    if not self.args.webhook:
+      self.app.run_polling()
+      return
+
+    host, _, port = self.args.listen.rpartition(':')
+    url = self.args.webhook_url
+    if url is None:  # only with a local --api-url stand-in
+      url = 'http://{}/{}'.format(self.args.listen, self.args.url_path)
+    secret = self.args.secret or secrets.token_urlsafe(32)
+    logging.info('Listening for webhook updates on %s.', self.args.listen)
+    self.app.run_webhook(listen=host or '0.0.0.0', port=int(port), url_path=self.args.url_path,
+                         webhook_url=url, secret_token=secret)
 
 def main():
   """Main function."""
@@ -16,6 +16,7 @@ class TerminalContext(Context):
   def __init__(self, nickname: str=None, user: str='User'):
     self.nickname = nickname
     self.user = user
+    self.channel = 'terminal:{}'.format(user)
     self.user_data = UserData()
 
   async def say(self, message: str) -> None:
@@ -77,7 +78,12 @@ class TerminalInterface(Interface):
     try:
       while True:
         text = await context.listen()
+        if self.args.profile is not None:
+          context.profile = Profile(context.channel)
         await context.process(text)
+        if context.profile is not None:
+          logging.debug(context.profile.report())
+          logging.info('Profile saved to %s.', context.profile.save(self.args.profile))
         # TODO: add cancel command
         # TODO: add skip command
     except KeyboardInterrupt:
@@ -3,20 +3,32 @@
 
 """Web interface."""
 
+import argparse
 import asyncio
+import hmac
 import json
+import mimetypes
 import sys
 
 from werkzeug.exceptions import HTTPException
-from flask import Flask, jsonify, render_template, request, send_from_directory
-
+from werkzeug.middleware.proxy_fix import ProxyFix
+from flask import Flask, Response, abort, jsonify, render_template, request, send_file, send_from_directory, \
+  url_for
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
+
+from fwnl.metrics import *
+from .admission import *
+from .assets import *
 from .interface import *
+from .sessions import *
 
 class WebContext(Context):
   """Custom class for web context."""
 
-  def __init__(self, nickname: str=None, user_data: UserData=None):
+  def __init__(self, nickname: str=None, user_data: UserData=None, channel: str='web'):
     self.nickname = nickname
+    self.channel = channel
     if user_data is None or type(user_data) is not UserData:
       self.user_data = UserData()
     else:
@@ -38,6 +50,18 @@ class WebContext(Context):
     See base class for more details."""
     await super().skip(self.user_data)
 
+class SocketContext(WebContext):
+  """Web context kept alive for the whole life of a WebSocket connection."""
+
+  def __init__(self, ws: Any, nickname: str=None, channel: str='ws'):
+    super().__init__(nickname, channel=channel)
+    self.ws = ws
+
+  async def say(self, message: str) -> None:
+    """Push a message to the client as soon as it is produced.
+    See base class for more details."""
+    self.ws.send(json.dumps({'response': message}))
+
 class WebInterface(Interface):
   """Web interface."""
 
@@ -48,6 +72,41 @@ class WebInterface(Interface):
       static_url_path='', 
       static_folder='web/static',
       template_folder='web/templates')
+    if self.args.proxies > 0:
+      # client addresses (rate limits, audit channels) come from the proxies' headers
+      self.web.wsgi_app = ProxyFix(self.web.wsgi_app, x_for=self.args.proxies, x_proto=self.args.proxies)
+    if self.args.audit is not None:
+      # each Gunicorn worker is a process of its own, rotating its own file
+      AuditLog().open('{}.{}'.format(self.args.audit, os.getpid()))
+    self.admission = Admission()
+    Metrics().register('admission', self.admission.stats)
+    Metrics().register('rules', lambda: Rules().stats())
+    Metrics().register('classifier', lambda: Cascade().stats())
+    Metrics().register('deadline', Deadline.stats)
+    Metrics().register('patterns', lambda: PatternStats().stats())
+    Metrics().register('audit', lambda: AuditLog().stats())
+    self.sessions = Sessions(self.args.session_ttl, self.args.max_sessions)
+    Metrics().register('sessions', self.sessions.stats)
+    self.assets = Assets()
+    Metrics().register('assets', self.assets.stats)
+
+    @self.web.template_global()
+    def asset(filename: str) -> str:
+      return self.assets.url(filename) or url_for('static', filename=filename)
+
+    @self.web.route(Assets.prefix + '<path:filename>')
+    def dist(filename):
+      found = self.assets.lookup(filename, request.headers.get('Accept-Encoding'))
+      if found is None:
+        abort(404)
+      path, encoding, etag = found
+      response = send_file(path, mimetype=mimetypes.guess_type(filename)[0], etag=etag,
+                           max_age=365 * 86400, conditional=True)
+      if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+      response.vary.add('Accept-Encoding')
+      response.cache_control.immutable = True
+      return response
 
     @self.web.route('/')
     def index():
@@ -64,13 +123,100 @@ class WebInterface(Interface):
 
     @self.web.route('/bot', methods=['POST'])
     def bot():
+      refused = self.admission.enter(request.remote_addr)
+      if refused is not None:
+        status, retry = refused
+        response = jsonify({'error': 'Too many requests, retry later.'})
+        response.status_code = status
+        response.headers['Retry-After'] = str(retry)
+        return response
+      try:
+        return answer()
+      finally:
+        self.admission.leave()
+
+    def answer():
       data: Dict[str, Any] = json.loads(json.dumps(request.json), object_hook=UserDataDecoder.default)
-      context = WebContext(user_data=data['user_data'])
+      context = WebContext(user_data=data['user_data'], channel='web:{}'.format(request.remote_addr))
+      if self.args.profile is not None and admin(request.headers.get('X-FWNL-Profile')):
+        context.profile = Profile(context.channel)
       asyncio.run(context.process(data['text'].lower()))
-      return jsonify({
+      result = {
         'user_data': json.loads(json.dumps(context.user_data, cls=UserDataEncoder)),
-        'responses': context.responses})
-   
+        'responses': context.responses}
+      if context.profile is not None:
+        context.profile.save(self.args.profile)
+        result['profile'] = context.profile.report()
+      return jsonify(result)
+
+    def admin(token: str) -> bool:
+      expected = os.environ.get('FWNL_ADMIN_TOKEN')
+      return bool(expected) and hmac.compare_digest(token or '', expected)
+
+    @self.web.route('/admin/reload', methods=['POST'])
+    def admin_reload():
+      if not admin(request.headers.get('X-FWNL-Token')):
+        abort(404)
+      reload()
+      return jsonify({'generation': Rules().stats().get('generation')})
+
+    @self.web.route('/metrics')
+    def metrics():
+      return Response(Metrics().render(), mimetype='text/plain; version=0.0.4')
+
+    sock = Sock(self.web)
+
+    @sock.route('/ws')
+    def ws(ws):
+      # each connection holds a worker thread until it closes, so they are bounded
+      client = request.remote_addr
+      if self.admission.connect(client) is not None:
+        ws.close(reason=1013, message='Too many connections, retry later.')
+        return
+      context = SocketContext(ws, channel='ws:{}'.format(client))
+      loop = asyncio.new_event_loop()
+      try:
+        if len(self.sessions) >= self.sessions.capacity:
+          ws.close(reason=1013, message='Too many sessions, retry later.')
+          return
+        while True:
+          self.sessions.touch(id(context), context.user_data)
+          message = ws.receive(timeout=self.admission.idle)
+          if message is None:
+            ws.close(message='Idle connection closed.')
+            break
+          try:
+            data = json.loads(message, object_hook=UserDataDecoder.default)
+            text = data['text']
+          except (ValueError, KeyError, TypeError):
+            continue
+          # a conversation started over POST /bot (or a closed socket) goes on
+          if type(data.get('user_data')) is UserData:
+            context.user_data = data['user_data']
+          refused = self.admission.enter(client)
+          if refused is not None:
+            ws.send(json.dumps({'response': 'Too many requests, retry later.'}))
+          else:
+            try:
+              loop.run_until_complete(context.process(text.lower()))
+            finally:
+              self.admission.leave()
+          # the client keeps the state, to fall back to POST /bot once the socket closes
+          ws.send(json.dumps({'user_data': json.loads(json.dumps(context.user_data, cls=UserDataEncoder))}))
+      except ConnectionClosed:
+        pass
+      finally:
+        self.sessions.forget(id(context))
+        self.admission.disconnect()
+        loop.close()
+
+  def arguments(self, parser: argparse.ArgumentParser) -> None:
+    """Add web arguments.
+    See base class for more details."""
+    parser.add_argument('--proxies', type=int, default=int(os.environ.get('FWNL_PROXIES', 0)),
+                        help='number of reverse proxies whose X-Forwarded-For and X-Forwarded-Proto '
+                             'headers are trusted (default: FWNL_PROXIES or 0)')
+
 def create_interface():
   i = WebInterface()
   return i.web
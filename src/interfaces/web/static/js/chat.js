@@ -1,6 +1,11 @@
 let messageInput = $('.messageinput')
 let textArea = $('.textarea')
 let screen = $('.screen')
+// the socket is opened on the first message, and given up on if it's refused or unreachable
+let socket = null
+let sockets = 'WebSocket' in window
+// messages sent (or waiting to be sent) over the socket, until the server sends back their state
+let unanswered = []
 
 messageInput.on('submit', (e) => {
   e.preventDefault()
@@ -35,8 +40,56 @@ function updateScreen(message, type) {
   screen.scrollTop(screen.prop('scrollHeight'))
 }
 
+function openSocket() {
+  let scheme = window.location.protocol === 'https:' ? 'wss://' : 'ws://'
+  let ws = new WebSocket(scheme + window.location.host + '/ws')
+  let answered = false
+  ws.onopen = () => {
+    unanswered.forEach((message, i) => sendSocketMessage(ws, message, i === 0))
+  }
+  ws.onmessage = (e) => {
+    let data = JSON.parse(e.data)
+    if (data.user_data !== undefined) {
+      answered = true
+      window.localStorage.setItem('ud', JSON.stringify(data.user_data))
+      unanswered.shift()
+    } else {
+      updateScreen(data.response, 'bot')
+    }
+  }
+  ws.onclose = () => {
+    socket = null
+    sockets = sockets && answered
+    // one after the other, each one needs the state left by the previous one
+    unanswered.splice(0).reduce((sent, message) => sent.then(() => postChatMessage(message)), $.when())
+  }
+  return ws
+}
+
+function sendSocketMessage(ws, message, first) {
+  let data = {text: message}
+  if (first) {
+    // the conversation may have gone on over HTTP (or another socket) meanwhile
+    data.user_data = JSON.parse(window.localStorage.getItem('ud'))
+  }
+  ws.send(JSON.stringify(data))
+}
+
 function sendChatMessage(message) {
-  $.ajax({
+  if (!sockets) {
+    postChatMessage(message)
+    return
+  }
+  unanswered.push(message)
+  if (socket === null) {
+    socket = openSocket()
+  } else if (socket.readyState === WebSocket.OPEN) {
+    sendSocketMessage(socket, message, false)
+  }
+}
+
+function postChatMessage(message) {
+  return $.ajax({
     type: 'POST',
     url: '/bot',
     data: JSON.stringify({user_data: JSON.parse(window.localStorage.getItem('ud')), text: message}),
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Sharded worker processes."""
+
+import logging
+import multiprocessing
+import queue
+from threading import Event, Thread
+import time
+from typing import Any, Callable, Dict, List
+
+class Supervisor(object):
+  """Pool of worker processes, each fed by its own queue.
+
+  Jobs with the same key always go to the same worker, so they are handled
+  in order and next to that worker's in-memory state. Workers beat a shared
+  timestamp; dead workers, and workers without a beat for `timeout` seconds
+  (or `startup` seconds after being spawned), are restarted with a new
+  queue: a killed process may hold the old queue's lock, so the jobs it
+  had queued (and the one it was handling) are lost.
+  """
+  interval = 5.0
+  timeout = 120.0
+  startup = 300.0
+
+  def __init__(self, target: Callable[[int, Any, Any], None], count: int, capacity: int=10000):
+    """Initialize supervisor.
+
+    Args:
+      target -- Picklable worker entry point, called with the worker index,
+                its job queue and its heartbeat (`multiprocessing.Value`).
+      count -- Number of worker processes.
+      capacity -- Maximum jobs queued per worker. (default: 10000)
+    """
+    self._mp = multiprocessing.get_context('spawn')
+    self.target = target
+    self.capacity = capacity
+    self.queues = [self._mp.Queue(capacity) for _ in range(count)]
+    self.beats = [self._mp.Value('d', 0.0, lock=False) for _ in range(count)]
+    self.processes: List[Any] = [None] * count
+    self.spawned = [0.0] * count
+    self.metrics = {'submitted': 0, 'dropped': 0, 'lost': 0, 'restarts': 0}
+    self._stopped = Event()
+    self._monitor: Thread = None
+
+  def start(self) -> None:
+    """Spawn every worker and start monitoring them."""
+    for i in range(len(self.queues)):
+      self._spawn(i)
+    self._monitor = Thread(target=self._watch, name='fwnl-supervisor', daemon=True)
+    self._monitor.start()
+
+  def submit(self, key: int, job: Any) -> bool:
+    """Queue a job for the worker owning a key.
+
+    Args:
+      key -- Shard key (e.g. chat id).
+      job -- Picklable job.
+
+    Returns:
+      True if queued, False if the worker's queue is full.
+    """
+    try:
+      self.queues[key % len(self.queues)].put_nowait(job)
+    except queue.Full:
+      self.metrics['dropped'] += 1
+      logging.warning('Worker %d is full, dropping job.', key % len(self.queues))
+      return False
+    self.metrics['submitted'] += 1
+    return True
+
+  def stop(self, timeout: float=10.0) -> None:
+    """Ask workers to finish their queues, killing those that don't in time.
+
+    Args:
+      timeout -- Seconds to wait for workers. (default: 10.0)
+    """
+    self._stopped.set()
+    for q in self.queues:
+      try:
+        q.put_nowait(None)
+      except queue.Full:
+        pass
+    deadline = time.monotonic() + timeout
+    for p in self.processes:
+      if p is None:
+        continue
+      p.join(max(0, deadline - time.monotonic()))
+      if p.is_alive():
+        p.kill()
+
+  def stats(self) -> Dict[str, Any]:
+    """Get worker counters.
+
+    Returns:
+      Dictionary with submitted, dropped and lost jobs, restarts and live workers.
+    """
+    return dict(self.metrics, workers=sum(p is not None and p.is_alive() for p in self.processes))
+
+  def _spawn(self, i: int) -> None:
+    """Start worker `i`, leaving its slot empty if it can't be started."""
+    self.beats[i].value = 0.0
+    self.spawned[i] = time.time()
+    self.processes[i] = None
+    process = self._mp.Process(target=self.target, args=(i, self.queues[i], self.beats[i]),
+                               name='fwnl-worker-{}'.format(i), daemon=True)
+    try:
+      process.start()
+    except OSError as e:
+      logging.error('Could not start worker %d: %s', i, e)
+      return
+    self.processes[i] = process
+    logging.info('Started worker %d (pid %d).', i, process.pid)
+
+  def _watch(self) -> None:
+    """Restart dead or stuck workers until stopped."""
+    while not self._stopped.wait(self.interval):
+      now = time.time()
+      for i, p in enumerate(self.processes):
+        beat = self.beats[i].value
+        if p is None:
+          logging.error('Worker %d is not running, starting it.', i)
+        elif not p.is_alive():
+          logging.error('Worker %d died (exit code %s), restarting.', i, p.exitcode)
+        elif (beat and now - beat > self.timeout) or (not beat and now - self.spawned[i] > self.startup):
+          logging.error('Worker %d is stuck, restarting.', i)
+          p.kill()
+          p.join()
+        else:
+          continue
+        if self._stopped.is_set():
+          return
+        lost = self.queues[i].qsize()
+        if lost:
+          logging.warning('Worker %d lost %d queued jobs.', i, lost)
+        self.queues[i] = self._mp.Queue(self.capacity)
+        self.metrics['lost'] += lost
+        self.metrics['restarts'] += 1
+        self._spawn(i)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+import time
+
+from fwnl.address import *
+
+class TestAddress(object):
+  # addresses and networks of both versions are tagged
+  def test_recognize(self):
+    assert recognize('10.0.0.5') == 'IPV4'
+    assert recognize('010.0.0.5') == 'IPV4'
+    assert recognize('192.168.1.0/24') == 'IPV4_RANGE'
+    assert recognize('2001:db8::1') == 'IPV6'
+    assert recognize('::ffff:10.0.0.1') == 'IPV6'
+    assert recognize('fe80::/10') == 'IPV6_RANGE'
+    assert recognize('2001:DB8::/32') == 'IPV6_RANGE'
+
+  # everything else is rejected
+  def test_reject(self):
+    for token in ['server', 'deadbeef', '10mbps', '2.5', '256.0.0.1', '10.0.0.1/33',
+                  '10.0.0.0/a', '1:2:3:4:5:6:7:8:9', 'fe80::g', '10.0.0.1.', '']:
+      assert recognize(token) is None, token
+
+  # near-miss tokens take about as long as ordinary words
+  def test_adversarial(self):
+    tokens = ['1:1:1:1:1:1:1::.' * 3 + 'x', '1:2:3:4::.' * 4 + 'x', '1::.' * 40, 'a:' * 5000]
+    start = time.perf_counter()
+    for _ in range(100):
+      recognize.cache_clear()
+      for token in tokens:
+        assert recognize(token) is None
+    assert time.perf_counter() - start < 1.0
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+from interfaces.admission import *
+
+class TestAdmission(object):
+  # clients over their burst are rate limited, others are not
+  def test_rate_limit(self):
+    admission = Admission(limit=10, budget=0, rate=1, burst=2)
+    for _ in range(2):
+      assert admission.enter('a') is None
+      admission.leave()
+    assert admission.enter('a') == (429, 1)
+    assert admission.enter('b') is None
+    admission.leave()
+    assert admission.stats()['limited'] == 1
+
+  # requests beyond the in-flight limit are shed once the budget runs out
+  def test_shed(self):
+    admission = Admission(limit=1, budget=0.01, rate=0)
+    assert admission.enter('a') is None
+    assert admission.enter('b') == (503, 1)
+    admission.leave()
+    assert admission.enter('b') is None
+    admission.leave()
+    stats = admission.stats()
+    assert stats['shed'] == 1 and stats['admitted'] == 2
+    assert stats['in_flight'] == 0 and stats['queued'] == 0
+
+  # WebSocket connections are bounded apart from requests, and refused at once
+  def test_sockets(self):
+    admission = Admission(limit=1, rate=0, sockets=1, idle=30)
+    assert admission.connect('a') is None
+    assert admission.connect('b') == (503, 30)
+    assert admission.enter('b') is None
+    admission.leave()
+    admission.disconnect()
+    assert admission.connect('b') is None
+    admission.disconnect()
+    stats = admission.stats()
+    assert stats['sockets_open'] == 0 and stats['sockets_refused'] == 1
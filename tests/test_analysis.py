@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+from fwnl.analysis import *
+
+def intent(name, src, dst, protocol, order='after', label='acl'):
+  return ("\n\ndefine intent {}:\nname\t\ttext('{}')\nfrom\t\tendpoint('{}')\nto\t\tendpoint('{}')\n" +
+          "block\t\ttraffic('{}')\norder\t\t{}('all-intents')\n" +
+          "add\t\tmiddlebox('cisco-1','iptables-1','openflow-1')\n").format(label, name, src, dst, protocol, order)
+
+class TestAnalysis(object):
+  # address parsing cases
+  def test_parse_address(self):
+    assert parse_address('any') == (ANY, 0, 0)
+    assert parse_address('10.0.0.1') == ('4', 167772161, 167772161)
+    assert parse_address('10.0.0.0/24') == ('4', 167772160, 167772415)
+    assert parse_address('2001:db8::/127') == ('6', 0x20010db8 << 96, (0x20010db8 << 96) + 1)
+    assert parse_address('server') == ('host:server', 0, 0)
+    assert parse_address('server', {'server': '10.0.0.2'}.get) == ('4', 167772162, 167772162)
+
+  # interval tree overlap queries
+  def test_interval_tree(self):
+    tree = IntervalTree()
+    for i, (lo, hi) in enumerate([(1, 5), (3, 4), (10, 20), (6, 9), (15, 15)]):
+      tree.add(lo, hi, i)
+    assert sorted(tree.search(4, 6)) == [0, 1, 3]
+    assert sorted(tree.search(16, 100)) == [2]
+    assert sorted(tree.search(21, 30)) == []
+    tree.add(0, 100, 5)
+    assert sorted(tree.search(21, 30)) == [5]
+
+  # configuration parsing
+  def test_parse(self):
+    rules = parse(intent('a', '10.0.0.0/8', 'server', 'ssh', 'before') + intent('b', 'any', 'any', 'http'))
+    assert [r.name for r in rules] == ['a', 'b']
+    assert rules[0].protocol == 'ssh' and rules[0].before and rules[0].action == 'block'
+    assert rules[1].src == (ANY, 0, 0) and not rules[1].before
+
+  # relations between rules
+  def test_analyze(self):
+    analyzer = Analyzer()
+    analyzer.load(intent('wide', '10.0.0.0/8', 'server', 'ssh') +
+                  intent('narrow', '10.1.0.0/16', 'server', 'ssh') +
+                  intent('copy', '10.0.0.0/8', 'server', 'ssh') +
+                  intent('other', '10.0.0.0/8', 'server', 'http') +
+                  intent('elsewhere', '192.168.0.0/16', 'server', 'ssh'))
+    found = sorted((f.kind, f.rule.name, f.other.name) for f in analyzer.analyze())
+    assert found == [
+      ('duplicate', 'copy', 'wide'),
+      ('redundancy', 'copy', 'narrow'),
+      ('redundancy', 'narrow', 'wide')]
+
+  # new intents checked against a deployed ruleset
+  def test_check(self):
+    analyzer = Analyzer()
+    analyzer.load(intent('deny', 'any', 'server', 'ssh'))
+    shaped = Rule.from_fields('TS', {'name': 'slow', 'from': '10.0.0.1', 'to': 'server',
+                                     'for': 'ssh', 'with': '10mbps'})
+    assert [(f.kind, f.rule.name) for f in analyzer.check(shaped)] == [('shadowing', 'slow')]
+    shaped.before = True
+    assert [(f.kind, f.rule.name) for f in analyzer.check(shaped)] == [('generalization', 'deny')]
+    assert analyzer.check(Rule('x', parse_address('any'), parse_address('server'), 'http')) == []
+
+  # wildcard sources are looked up by destination instead of matching every rule
+  def test_wildcard_sources(self):
+    analyzer = Analyzer()
+    for i in range(200):
+      analyzer.add(Rule(str(i), parse_address('any'), parse_address('10.0.{}.1'.format(i)), 'ssh'))
+    analyzer.add(Rule('wide', parse_address('10.0.0.0/8'), parse_address('10.0.5.0/24'), 'ssh'))
+    analyzer.add(Rule('all', parse_address('any'), parse_address('any'), 'http'))
+    assert analyzer._cost(analyzer.rules[3], ['ssh', ANY], 'dst') == 0
+    assert [r.name for r in analyzer.candidates(analyzer.rules[3])] == []
+    assert [r.name for r in analyzer.candidates(analyzer.rules[5])] == ['wide']
+    assert [r.name for r in analyzer.candidates(analyzer.rules[200])] == ['5']
+    assert len(list(analyzer.candidates(analyzer.rules[201]))) == 0
+    found = sorted((f.kind, f.rule.name, f.other.name) for f in analyzer.analyze())
+    assert found == [('overlap', 'wide', '5')]
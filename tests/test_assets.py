@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import gzip
+
+from interfaces.assets import *
+
+class TestAssets(object):
+  # stylesheets point to the fingerprinted fonts, and text gets a gzip variant
+  def test_build(self, tmp_path):
+    source, output = tmp_path / 'static', tmp_path / 'dist'
+    (source / 'css').mkdir(parents=True)
+    (source / 'font').mkdir()
+    (source / 'font' / 'icons.woff2').write_bytes(b'\x00' * 64)
+    (source / 'css' / 'theme.css').write_text(
+      'a { background: url("../font/icons.woff2?123#x"); }\n' * 50)
+    manifest = build(str(source), str(output))
+    font, css = manifest['files']['font/icons.woff2'], manifest['files']['css/theme.css']
+    assert manifest['encodings'][font] == ['identity']
+    assert 'gzip' in manifest['encodings'][css]
+    text = gzip.decompress((output / (css + '.gz')).read_bytes()).decode()
+    assert 'url("../{}#x")'.format(font) in text
+
+  # the smallest accepted variant is chosen, q=0 excludes an encoding
+  def test_lookup(self, tmp_path):
+    (tmp_path / 'static').mkdir()
+    (tmp_path / 'static' / 'app.js').write_text('console.log(1);\n' * 100)
+    build(str(tmp_path / 'static'), str(tmp_path / 'dist'))
+    assets = Assets(str(tmp_path / 'dist'))
+    name = assets.url('app.js')[len(Assets.prefix):]
+    path, encoding, etag = assets.lookup(name, 'gzip, deflate')
+    assert encoding == 'gzip' and path.endswith('.gz') and etag.endswith('-gzip')
+    assert assets.lookup(name, 'gzip;q=0')[1] is None
+    assert assets.lookup('app.0000000000.js', 'gzip') is None
+    assert assets.stats()['missing'] == 1
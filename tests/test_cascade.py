@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import pytest
+
+spacy = pytest.importorskip('spacy')
+pytest.importorskip('rita')
+
+from spacy.pipeline import EntityRuler
+
+from fwnl.cascade import *
+
+KEYWORDS = {'ACL': ['block', 'filter', 'access'], 'TS': ['limit', 'shape', 'access']}
+
+# rules served from a blank pipeline, with the given entity ruler patterns
+@pytest.fixture
+def serve(monkeypatch):
+  rules = Rules()
+  nlp = spacy.blank('en')
+  monkeypatch.setattr(rules, 'loaded', True, raising=False)
+  monkeypatch.setattr(rules, 'nlp', nlp, raising=False)
+
+  def serve(entities):
+    ruler = EntityRuler(nlp, 'entity_ruler', overwrite_ents=True)
+    ruler.add_patterns(entities)
+    monkeypatch.setattr(rules, 'generation', Generation(0, ruler, KEYWORDS), raising=False)
+  return serve
+
+class TestCascade(object):
+  # keywords of a single intent vote, shared ones don't
+  def test_vote(self, serve):
+    serve([])
+    cascade = Cascade()
+    assert cascade.vote('Block ssh', ['ACL', 'TS'], margin=1) == ('ACL', 1)
+    assert cascade.vote('access', ['ACL', 'TS'], margin=1) is None
+    assert cascade.vote('block and limit', ['ACL', 'TS'], margin=1) is None
+    assert cascade.vote('block ssh', ['ACL', 'TS'], margin=2) is None
+    assert cascade.vote('block ssh', ['ACL', 'TS'], margin=0) is None
+
+  # entities vote too, when the entity ruler can run on bare tokens
+  def test_vote_entities(self, serve):
+    serve([{'label': 'ACL', 'pattern': [{'LOWER': 'firewall'}]}])
+    assert Cascade().vote('block it at the firewall', ['ACL', 'TS'], margin=1) == ('ACL', 2)
+
+  # patterns needing the tagger or parser skip the entity ruler instead of failing
+  def test_vote_annotated(self, serve):
+    serve([{'label': 'ACL', 'pattern': [{'LOWER': 'firewall'}]},
+           {'label': 'TS', 'pattern': [{'POS': 'NOUN', 'LOWER': 'bandwidth'}]}])
+    assert Cascade().vote('block it at the firewall', ['ACL', 'TS'], margin=1) == ('ACL', 1)
+
+  # decided and undecided utterances are counted per tier
+  def test_stats(self, serve):
+    serve([])
+    cascade = Cascade()
+    before = cascade.stats()
+    cascade.vote('block ssh', ['ACL', 'TS'], margin=1)
+    cascade.vote('access', ['ACL', 'TS'], margin=1)
+    stats = cascade.stats()
+    assert stats['keyword'] - before['keyword'] == 1 and stats['model'] - before['model'] == 1
+    assert 0.0 < stats['hit_rate'] < 1.0
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+
+import pytest
+
+from fwnl.deadline import *
+
+class TestDeadline(object):
+  # checks pass within budget, then stop every later stage once expired
+  def test_check(self):
+    expired = Deadline.stats()['expired']
+    with Deadline(60).run() as deadline:
+      assert Deadline.active() is deadline
+      deadline.check('parser')
+      deadline.expires = 0
+      with pytest.raises(TimeoutError):
+        deadline.check('ner')
+      with pytest.raises(TimeoutError):
+        deadline.check('entity_ruler')
+      assert deadline.stage == 'ner'
+      with deadline.lifted():
+        assert Deadline.active() is None
+    assert Deadline.active() is None
+    assert Deadline.stats()['expired'] == expired + 1
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip('spacy')
+pytest.importorskip('rita')
+pytest.importorskip('en_core_web_md')
+
+from fwnl.engine import *
+
+ACL_TURNS = ['i want to block access', 'yes', 'labrule', '10.0.0.1', '192.168.0.0/24', 'ssh', 'after']
+
+# loading the model once is enough, the engine keeps no state of its own
+@pytest.fixture(scope='module')
+def engine():
+  return Engine()
+
+def converse(engine, session, texts):
+  for text in texts:
+    responses = engine.step(session, text)
+  return responses
+
+def configuration(responses):
+  return responses[responses.index("Here's your final configuration:") + 1]
+
+class TestConversation(object):
+  # a whole ACL conversation, with the address patterns registered in the matcher
+  def test_acl(self, engine):
+    session = engine.session()
+    responses = engine.step(session, 'i want to block access')
+    assert responses[-1].startswith('Do you want to make ACL')
+    responses = engine.step(session, 'yes')
+    assert responses[-1].startswith('Regarding the property Name')
+    for text, value in (('labrule', "text('labrule')"), ('10.0.0.1', "endpoint('10.0.0.1')"),
+                        ('192.168.0.0/24', "range('192.168.0.0/24')"), ('ssh', "traffic('ssh')")):
+      responses = engine.step(session, text)
+      assert responses[0] == 'I got it: {}'.format(value)
+    responses = engine.step(session, 'after')
+    assert "Here's your final configuration:" in responses
+    assert "block\t\t traffic('ssh')" in configuration(responses)
+    assert session.state is None and session.history[-1].label == 'ACL'
+
+  # "edit <command>" asks that command of the last configuration again
+  def test_edit(self, engine):
+    session = engine.session()
+    converse(engine, session, ACL_TURNS)
+    responses = engine.step(session, 'edit to')
+    assert responses[-1].startswith('Regarding the property To') and session.state == 'edit'
+    responses = engine.step(session, '10.0.0.2')
+    assert "to\t\t endpoint('10.0.0.2')" in configuration(responses)
+    assert "from\t\t endpoint('10.0.0.1')" in configuration(responses)
+    assert session.state is None and len(session.history) == 1
+
+  # other messages starting with "change" are new requests
+  def test_change_is_new_request(self, engine):
+    session = engine.session()
+    converse(engine, session, ACL_TURNS)
+    responses = engine.step(session, 'change the traffic limit for http')
+    assert session.state == 'confirm_intent' and session.intent.label == 'TS'
+    assert responses[-1].startswith('Do you want to make TS')
+
+class TestFill(object):
+  # values introduced by their cue words are taken from the opening utterance
+  def test_fill(self, engine):
+    intent = engine.fill('acl', 'block ssh from 10.0.0.1 to 192.168.0.0/24')
+    filled = {c.name: c.values[c.value].generate() for c in intent.commands if c.filled}
+    assert filled == {'From': "endpoint('10.0.0.1')", 'To': "range('192.168.0.0/24')",
+                      'Block': "traffic('ssh')"}
+
+  # addresses without their cue word are left to be asked
+  def test_uncued(self, engine):
+    intent = engine.fill('acl', 'block ssh on 10.0.0.1')
+    assert [c.name for c in intent.commands if c.filled] == ['Block']
+
+  # only the missing commands are asked
+  def test_conversation(self, engine):
+    session = engine.session()
+    responses = engine.step(session, 'i want to block access for ssh from 10.0.0.1 to 192.168.0.0/24')
+    assert responses[-1].startswith('Do you want to make ACL')
+    responses = engine.step(session, 'yes')
+    assert 'From what you said, I already got: ' + \
+      "From endpoint('10.0.0.1'), To range('192.168.0.0/24'), Block traffic('ssh')" in responses
+    assert responses[-1].startswith('Regarding the property Name')
+    responses = engine.step(session, 'labrule')
+    assert responses[-1].startswith('Regarding the property Order')
+    responses = engine.step(session, 'after')
+    assert "from\t\t endpoint('10.0.0.1')" in configuration(responses)
+
+  # a single utterance compiles if every missing command has a default
+  def test_compile(self, engine):
+    config = engine.compile('i want to block access for ssh from 10.0.0.1 to 192.168.0.0/24')
+    assert "block\t\t traffic('ssh')" in config
+    with pytest.raises(ValueError, match='Missing From, To for ACL'):
+      engine.compile('i want to block access for ssh')
+
+class TestSession(object):
+  # declining the intent ends the conversation without a configuration
+  def test_decline(self, engine):
+    session = engine.session()
+    engine.step(session, 'i want to block access')
+    assert engine.step(session, 'no') == ['Ok, we will not do that.']
+    assert session.state is None and session.history == []
+
+  # questions with a default can be skipped, the others can't
+  def test_skip(self, engine):
+    session = engine.session()
+    converse(engine, session, ACL_TURNS[:2])
+    responses = engine.skip(session)
+    assert responses[-1].startswith('Regarding the property From')
+    assert engine.skip(session) == ["You can't skip this question."]
+
+  # sessions advanced from several threads don't see each other's state
+  def test_concurrent(self, engine):
+    sessions = [engine.session() for _ in range(4)]
+    with ThreadPoolExecutor(4) as pool:
+      configs = list(pool.map(lambda s: configuration(converse(engine, s, ACL_TURNS)), sessions))
+    assert len(set(configs)) == 1
+    assert all(s.state is None and len(s.history) == 1 for s in sessions)
+
+class TestChoices(object):
+  # closed-set answers are offered as choices, and applied without parsing
+  def test_choose(self, engine):
+    session = engine.session()
+    reply = engine.intents_reply('What do you want to do?')
+    assert reply.choices == [('Access Control List', 'intent:ACL'), ('Traffic Shaping', 'intent:TS')]
+    responses = engine.choose(session, 'intent:ACL')
+    assert responses[-1].startswith('Regarding the property Name')
+    responses = converse(engine, session, ACL_TURNS[2:5])
+    assert ('ssh', 'q3:0:ssh') in responses[-1].choices
+    responses = engine.choose(session, 'q3:0:ssh')
+    assert responses[0] == "I got it: traffic('ssh')"
+    assert responses[-1].choices == [('before', 'q4:0:before'), ('after', 'q4:1:after')]
+    assert engine.choose(session, 'q3:0:ssh') == [STALE]
+    responses = engine.choose(session, 'q4:1:after')
+    assert "block\t\t traffic('ssh')" in configuration(responses)
+
+  # answers the question doesn't offer are refused
+  def test_choose_unknown(self, engine):
+    session = engine.session()
+    engine.choose(session, 'intent:ACL')
+    assert engine.choose(session, 'intent:TS') == [STALE]
+    assert engine.choose(session, 'q0:0:labrule') == ["Sorry, I don't understand."]
+    assert session.state == 'questions' and session.counter == 0
+
+SPLIT = 'block telnet from classroom to server and limit http to 10mbps'
+
+class TestSegment(object):
+  # utterances are cut at coordinated verbs, dropping the conjunction
+  def test_segment(self, engine):
+    assert engine.segment(SPLIT) == ['block telnet from classroom to server', 'limit http to 10mbps']
+    assert engine.segment('i want to block access') == ['i want to block access']
+
+  # each clause gets its own conversation, queued until the previous one ends
+  def test_queue(self, engine):
+    session = engine.session()
+    responses = engine.step(session, SPLIT)
+    assert responses[0] == "I see 2 requests in there, let's go through them one at a time."
+    assert session.intent.label == 'ACL' and [i.label for i in session.queue] == ['TS']
+    responses = engine.step(session, 'no')
+    assert responses[:2] == ['Ok, we will not do that.', 'Next request:']
+    assert responses[-1].startswith('Do you want to make TS')
+    assert session.intent.label == 'TS' and session.queue == []
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import os
+import time
+
+import pytest
+
+from fwnl.inventory import *
+
+# the singleton is shared by every test, so its path and index are put back
+@pytest.fixture
+def inventory():
+  inventory = Inventory()
+  saved = dict(inventory.__dict__)
+  yield inventory
+  inventory.__dict__.clear()
+  inventory.__dict__.update(saved)
+
+class TestInventory(object):
+  # inventory file parsing
+  def test_parse(self):
+    entries = Inventory.parse(['# comment', '', 'Main  Server = 10.0.0.2 10.0.0.3', 'lab'])
+    assert entries == {'any': [], 'main server': ['10.0.0.2', '10.0.0.3'], 'lab': []}
+
+  # typo correction through the deletion index
+  def test_correct(self):
+    index = Index({'server': [], 'laboratory': [], 'any': []})
+    assert index.correct('server') == 'server'
+    assert index.correct('sevrer') == 'server'
+    assert index.correct('servers') == 'server'
+    assert index.correct('laboratry') == 'laboratory'
+    assert index.correct('and') is None
+    assert index.correct('printer') is None
+
+  # longest multi-token names are found in word sequences
+  def test_find_and_reload(self, tmp_path, inventory):
+    path = tmp_path / 'hosts'
+    path.write_text('main server = 10.0.0.2\nmain = 10.0.0.1\nlab room\n')
+    inventory.load(str(path))
+    assert inventory.find('block the main sever from lab room'.split()) == [
+      (2, 4, 'main server'), (5, 7, 'lab room')]
+    assert inventory.find(['main']) == [(0, 1, 'main')]
+    assert inventory.resolve('main server') == '10.0.0.2'
+    assert inventory.resolve('lab room') is None
+
+    path.write_text('printer = 10.0.0.9\n')
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    assert inventory.reload()
+    assert inventory.find(['main']) == []
+    assert inventory.resolve('printer') == '10.0.0.9'
+
+  # the inventory used by the previous test was put back
+  def test_restored(self):
+    assert Inventory().path == Inventory.path
+    assert Inventory().resolve('printer') is None
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from interfaces.botapi import *
+from interfaces.loadtest import *
+
+class TestLoadTest(object):
+  # nearest-rank percentile cases
+  def test_percentile(self):
+    samples = list(range(1, 101))
+    assert percentile([], 50) == 0.0
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 95) == 95
+    assert percentile(samples, 99) == 99
+    assert percentile(samples, 100) == 100
+    assert percentile([7], 99) == 7
+
+  # stand-in delivers updates and collects replies
+  def test_fake_bot_api(self):
+    api = FakeBotAPI().start()
+
+    def echo():
+      offset = 0
+      for _ in range(4):
+        data = urlencode({'offset': offset, 'timeout': 1}).encode()
+        updates = json.loads(urlopen(api.url + 'TOKEN/getUpdates', data=data).read())['result']
+        for u in updates:
+          offset = u['update_id'] + 1
+          data = urlencode({'chat_id': u['message']['chat']['id'], 'text': u['message']['text'] * 2})
+          urlopen(api.url + 'TOKEN/sendMessage', data=data.encode())
+
+    try:
+      Thread(target=echo, daemon=True).start()
+      SCRIPTS['echo'] = [('ab', 'ABAB'), ('10', '1010')]
+      report = run(TelegramDriver(api, settle=0.05, timeout=5), 'telegram', ['echo'], 2, 2)
+      summary = report.summary()
+      assert summary['conversations'] == 2
+      assert summary['turns'] == 4
+      assert summary['error_rate'] == 0.0
+      assert [t for _, t in api.replies(1000)] == ['abab', '1010']
+    finally:
+      del SCRIPTS['echo']
+      api.stop()
+
+  # replies other than the scripted ones are errors, ending the conversation
+  def test_derailed(self):
+    api = FakeBotAPI().start()
+
+    def confused():
+      offset = 0
+      for _ in range(4):
+        data = urlencode({'offset': offset, 'timeout': 1}).encode()
+        updates = json.loads(urlopen(api.url + 'TOKEN/getUpdates', data=data).read())['result']
+        for u in updates:
+          offset = u['update_id'] + 1
+          data = urlencode({'chat_id': u['message']['chat']['id'], 'text': "Sorry, I don't understand."})
+          urlopen(api.url + 'TOKEN/sendMessage', data=data.encode())
+
+    try:
+      Thread(target=confused, daemon=True).start()
+      SCRIPTS['derail'] = [('ab', 'abab'), ('10', '1010')]
+      summary = run(TelegramDriver(api, settle=0.05, timeout=5), 'telegram', ['derail'], 1, 1).summary()
+      assert summary['conversations'] == 0
+      assert summary['turns'] == 1
+      assert summary['errors'] == {'unexpected reply': 1}
+      assert summary['error_rate'] == 1.0
+    finally:
+      del SCRIPTS['derail']
+      api.stop()
+
+  # stand-in posts updates to a webhook with the secret token
+  def test_fake_bot_api_webhook(self):
+    api = FakeBotAPI().start()
+    received = []
+
+    class Hook(BaseHTTPRequestHandler):
+      def do_POST(self):
+        if self.headers.get('X-Telegram-Bot-Api-Secret-Token') != 's3cret':
+          self.send_response(403)
+        else:
+          body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+          received.append(body['message']['text'])
+          self.send_response(200)
+        self.end_headers()
+      def log_message(self, *args):
+        pass
+
+    hook = HTTPServer(('127.0.0.1', 0), Hook)
+    Thread(target=hook.serve_forever, daemon=True).start()
+    try:
+      url = 'http://127.0.0.1:{}/telegram'.format(hook.server_address[1])
+      data = urlencode({'url': url, 'secret_token': 's3cret'}).encode()
+      assert json.loads(urlopen(api.url + 'TOKEN/setWebhook', data=data).read())['result']
+      assert api.deliver(api.update(1, 'hello')) == 200
+      assert api.deliver(api.update(1, 'intruder'), secret='wrong') == 403
+      assert received == ['hello']
+    finally:
+      hook.shutdown()
+      api.stop()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import pytest
+
+spacy = pytest.importorskip('spacy')
+
+from fwnl.patterns import *
+
+class TestPatternStats(object):
+  # labels are counted on every document, patterns on sampled ones
+  def test_count_measure_report(self):
+    stats = PatternStats.__new__(PatternStats)  # not the shared instance
+    stats.__init__()
+    nlp = spacy.blank('en')
+    specs = {'PROTOCOL': [[{'LOWER': 'ssh'}], [{'LOWER': 'gopher'}]], 'CONFIRM': [[{'LOWER': 'yes'}]]}
+    for text in ('block ssh', 'yes', 'ssh and ssh'):
+      doc = nlp(text)
+      stats.measure('matcher', 1, specs, nlp.vocab, doc)
+      stats.count('matcher', [label for label, patterns in specs.items() for pattern in patterns
+                              if pattern[0]['LOWER'] in text.split()])
+    assert stats.stats()['docs'] == {'matcher': 3}
+    assert stats.stats()['sampled'] == {'matcher': 3}
+    assert stats.stats()['matches'] == {'matcher:PROTOCOL': 2, 'matcher:CONFIRM': 1}
+    rows = {(r['label'], r['index']): r for r in stats.report()}
+    assert rows['PROTOCOL', 0]['matches'] == 3 and not rows['PROTOCOL', 0]['dead']
+    # dead even though other patterns of its label match
+    assert rows['PROTOCOL', 1]['matches'] == 0 and rows['PROTOCOL', 1]['dead']
+    assert rows['PROTOCOL', 1]['label_matches'] == 2
+    assert rows['CONFIRM', 0]['matches'] == 1 and not rows['CONFIRM', 0]['dead']
+
+    # new patterns drop the previous costs
+    stats.measure('matcher', 2, {'CONFIRM': [[{'LOWER': 'yes'}]]}, nlp.vocab, nlp('no'))
+    rows = stats.report()
+    assert [(r['label'], r['index'], r['dead']) for r in rows] == [('CONFIRM', 0, True)]
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import queue
+from threading import Thread
+import time
+from types import SimpleNamespace
+
+import pytest
+
+spacy = pytest.importorskip('spacy')
+rita = pytest.importorskip('rita')
+
+import numpy as np
+
+from fwnl.rules import *
+
+# loaded rules with a blank pipeline and a pool of two handles
+@pytest.fixture
+def pool(monkeypatch):
+  rules = Rules()
+  state = {
+    'loaded': True, 'nlp': spacy.blank('en'), 'size': 2, 'created': 0, 'pool': queue.LifoQueue(),
+    'generation': Generation(0, SimpleNamespace(labels=[]), {}), '_next': None,
+    'metrics': {'acquisitions': 0, 'waits': 0, 'wait_seconds': 0.0, 'in_use': 0, 'max_in_use': 0,
+                'reloads': 0}}
+  for name, value in state.items():
+    monkeypatch.setattr(rules, name, value, raising=False)
+  return rules
+
+def borrow(pool, borrowed):
+  with pool.acquire() as handle:
+    borrowed.append(handle)
+
+class TestRules(object):
+  # reload hooks see the keywords of the generation being built, not the old ones
+  def test_hooks_see_new_generation(self, monkeypatch):
+    ruler = SimpleNamespace(labels=[])
+    rules = Rules()
+    monkeypatch.setattr(rules, 'loaded', True, raising=False)
+    monkeypatch.setattr(rules, 'generation', Generation(0, ruler, {'PROTOCOL': []}), raising=False)
+    monkeypatch.setattr(rules, 'metrics', {'reloads': 0}, raising=False)
+    monkeypatch.setattr(Rules, '_Rules__compile',
+                        lambda self, number: Generation(number, ruler, {'PROTOCOL': ['gopher']}))
+    seen = []
+    monkeypatch.setattr(Rules, 'hooks', [lambda: seen.append(Rules().patterns['PROTOCOL'])])
+    assert rules.reload() == 1
+    assert seen == [['gopher']]
+    assert rules.patterns['PROTOCOL'] == ['gopher']
+
+  # handles are created up to the pool size, then borrowers wait for one
+  def test_acquire_bounded(self, pool):
+    borrowed = []
+    with pool.acquire() as a, pool.acquire() as b:
+      assert a is not b
+      waiting = Thread(target=borrow, args=(pool, borrowed))
+      waiting.start()
+      time.sleep(0.1)
+      assert borrowed == []
+    waiting.join(1)
+    assert borrowed[0] in (a, b)
+    stats = pool.stats()
+    assert stats['handles'] == 2 and stats['acquisitions'] == 3 and stats['waits'] == 1
+    assert stats['max_in_use'] == 2 and stats['in_use'] == 0
+
+  # patterns added after a handle was created reach it on its next acquisition
+  def test_acquire_syncs_patterns(self, pool):
+    with pool.acquire() as handle:
+      assert handle.matcher(pool.nlp('hello world')) == []
+    pool.add_patterns('GREETING', [[{'LOWER': 'hello'}]])
+    with pool.acquire() as again:
+      assert again is handle
+      assert [(s, e) for _, s, e in again.matcher(pool.nlp('hello world'))] == [(0, 1)]
+
+  # compiled rules are loaded back from the cache, until the rules change
+  def test_compile_cached(self, pool, monkeypatch, tmp_path):
+    compiled = []
+
+    def compile_string(rules, use_engine):
+      compiled.append(rules)
+      return [{'label': 'PROTOCOL', 'pattern': [{'LOWER': {'IN': ['ssh', 'http']}}]}]
+
+    monkeypatch.setattr(rita, 'compile_string', compile_string)
+    monkeypatch.setattr(pool, 'cache', str(tmp_path), raising=False)
+    monkeypatch.setattr(pool, 'extra', None, raising=False)
+    monkeypatch.setattr(pool, 'rules', 'protocols = {"ssh", "http"}', raising=False)
+    assert pool._Rules__compile(1).patterns == {'PROTOCOL': ['ssh', 'http']}
+    generation = pool._Rules__compile(2)
+    assert compiled == ['protocols = {"ssh", "http"}'] and len(list(tmp_path.iterdir())) == 1
+    assert generation.number == 2 and generation.patterns == {'PROTOCOL': ['ssh', 'http']}
+    assert generation.ruler.labels == ('PROTOCOL',)
+    monkeypatch.setattr(pool, 'rules', 'protocols = {"ssh"}', raising=False)
+    pool._Rules__compile(3)
+    assert len(compiled) == 2 and len(list(tmp_path.iterdir())) == 2
+
+  # vectors are exported to the cache once, then mapped read-only by every process
+  def test_mapped_vectors(self, pool, monkeypatch, tmp_path):
+    source = Vectors(strings=pool.nlp.vocab.strings, shape=(2, 3))
+    source.add('ssh', vector=np.array([1, 2, 3], dtype=np.float32))
+    source.add('http', vector=np.array([4, 5, 6], dtype=np.float32))
+    source.to_disk(tmp_path / 'pruned')
+    monkeypatch.setattr(pool, 'vectors', str(tmp_path / 'pruned'), raising=False)
+    monkeypatch.setattr(pool, 'cache', str(tmp_path / 'cache'), raising=False)
+    vectors = pool._Rules__mapped()
+    exported = sorted(p.name for p in (tmp_path / 'cache').iterdir())
+    assert len(exported) == 2 and not vectors.data.flags.writeable
+    assert vectors[pool.nlp.vocab.strings['http']].tolist() == [4, 5, 6]
+    monkeypatch.setattr(Vectors, 'from_disk', lambda *args: pytest.fail('exported again'))
+    again = pool._Rules__mapped()
+    assert sorted(p.name for p in (tmp_path / 'cache').iterdir()) == exported
+    assert again[pool.nlp.vocab.strings['ssh']].tolist() == [1, 2, 3]
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import time
+
+import pytest
+
+pytest.importorskip('spacy')
+pytest.importorskip('rita')
+
+from interfaces.sessions import *
+
+class TestSessions(object):
+  # the sweeper's periods are defined
+  def test_intervals(self):
+    assert Sessions.interval > 0 and Sessions.report_interval >= Sessions.interval
+
+  # idle and over capacity sessions expire, least recently used first
+  def test_expired(self, monkeypatch):
+    sessions = Sessions(ttl=60, capacity=2)
+    sessions.spill = None  # whatever FWNL_SPILL says
+    for key in ('a', 'b', 'c'):
+      sessions.touch(key, UserData())
+    assert [key for key, _ in sessions.expired()] == ['a']
+    assert 'a' not in sessions and len(sessions) == 2
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 61)
+    assert sorted(key for key, _ in sessions.expired()) == ['b', 'c']
+    assert sessions.stats()['evicted'] == 3
+
+  # conversations evicted halfway are spilled and restored once
+  def test_spill(self, tmp_path):
+    sessions = Sessions(ttl=60, capacity=1, spill=str(tmp_path))
+    idle, busy = UserData(), UserData()
+    busy.state, busy.counter = 'questions', 2
+    sessions.touch('idle', idle)
+    sessions.touch(42, busy)
+    sessions.touch('last', UserData())
+    assert len(sessions.expired()) == 2
+    assert [p.name for p in tmp_path.iterdir()] == ['42.json']
+    restored = sessions.load(42)
+    assert restored.state == 'questions' and restored.counter == 2
+    assert sessions.load(42) is None and sessions.load('idle') is None
+    assert sessions.stats()['spilled'] == 1 and sessions.stats()['restored'] == 1
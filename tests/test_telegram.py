@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+
+import pytest
+
+pytest.importorskip('telegram')
+pytest.importorskip('spacy')
+pytest.importorskip('rita')
+
+from interfaces.telegram import *
+
+class TestKeyboard(object):
+  # choices are laid out in rows of up to three buttons
+  def test_keyboard(self):
+    assert keyboard([]) is None
+    assert keyboard(None) is None
+    markup = keyboard([(str(i), 'q0:0:{}'.format(i)) for i in range(4)])
+    rows = markup.inline_keyboard
+    assert [len(row) for row in rows] == [3, 1]
+    assert rows[1][0].text == '3' and rows[1][0].callback_data == 'q0:0:3'
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+from threading import Thread
+
+import pytest
+
+pytest.importorskip('flask_sock')
+pytest.importorskip('spacy')
+pytest.importorskip('rita')
+pytest.importorskip('en_core_web_md')
+
+from simple_websocket import Client
+from werkzeug.serving import make_server
+
+from interfaces.web import *
+
+# one interface (it's a singleton), served on a free local port for WebSockets
+@pytest.fixture(scope='module')
+def app():
+  argv, sys.argv = sys.argv, ['fwnl-web']
+  try:
+    web = create_interface()
+  finally:
+    sys.argv = argv
+  server = make_server('127.0.0.1', 0, web, threaded=True)
+  Thread(target=server.serve_forever, daemon=True).start()
+  web.config['WS_URL'] = 'ws://127.0.0.1:{}/ws'.format(server.server_port)
+  yield web
+  server.shutdown()
+
+def post(app, text, user_data=None):
+  response = app.test_client().post('/bot', json={'user_data': user_data, 'text': text})
+  assert response.status_code == 200
+  return response.get_json()
+
+def exchange(ws, text, user_data=None):
+  ws.send(json.dumps({'text': text, 'user_data': user_data}))
+  responses = []
+  while True:
+    data = json.loads(ws.receive(timeout=30))
+    if 'user_data' in data:
+      return responses, data['user_data']
+    responses.append(data['response'])
+
+class TestWeb(object):
+  # the conversation state goes back and forth with the client
+  def test_bot(self, app):
+    data = post(app, 'I want to block access')
+    assert data['responses'][-1].startswith('Do you want to make ACL')
+    data = post(app, 'yes', data['user_data'])
+    assert data['responses'][-1].startswith('Regarding the property Name')
+
+  # the socket keeps the state, and hands it over to POST /bot once closed
+  def test_socket(self, app):
+    ws = Client.connect(app.config['WS_URL'])
+    try:
+      responses, _ = exchange(ws, 'I want to block access')
+      assert responses[-1].startswith('Do you want to make ACL')
+      responses, user_data = exchange(ws, 'yes')
+      assert responses[-1].startswith('Regarding the property Name')
+    finally:
+      ws.close()
+    data = post(app, 'labrule', user_data)
+    assert data['responses'][-1].startswith('Regarding the property From')
+
+  # a conversation started over POST /bot goes on over the socket
+  def test_socket_resumes(self, app):
+    data = post(app, 'I want to block access')
+    ws = Client.connect(app.config['WS_URL'])
+    try:
+      responses, _ = exchange(ws, 'yes', data['user_data'])
+      assert responses[-1].startswith('Regarding the property Name')
+    finally:
+      ws.close()
+
+  # completed configurations travel with the client state, and can be edited
+  def test_edit(self, app):
+    user_data = None
+    for text in ['i want to block access', 'yes', 'labrule', '10.0.0.1', '192.168.0.0/24', 'ssh', 'after']:
+      data = post(app, text, user_data)
+      user_data = data['user_data']
+    assert "Here's your final configuration:" in data['responses']
+    data = post(app, 'edit to', user_data)
+    assert data['responses'][-1].startswith('Regarding the property To')
+    data = post(app, '10.0.0.2', data['user_data'])
+    config = data['responses'][data['responses'].index("Here's your final configuration:") + 1]
+    assert "to\t\t endpoint('10.0.0.2')" in config and "block\t\t traffic('ssh')" in config
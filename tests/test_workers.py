@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import os
+import time
+
+from interfaces.workers import *
+
+def echo(index, jobs, heartbeat):
+  while True:
+    heartbeat.value = time.time()
+    job = jobs.get()
+    if job is None:
+      return
+    results, key = job
+    results.put((index, key, os.getpid()))
+
+class TestSupervisor(object):
+  # jobs are sharded by key and dead workers are restarted
+  def test_shard_and_restart(self):
+    supervisor = Supervisor(echo, 2)
+    supervisor.interval = 0.1
+    results = supervisor._mp.Manager().Queue()
+    supervisor.start()
+    try:
+      for key in range(4):
+        assert supervisor.submit(key, (results, key))
+      got = sorted(results.get(timeout=30) for _ in range(4))
+      assert all(index == key % 2 for index, key, _ in got)
+
+      pid = got[0][2]
+      supervisor.processes[0].kill()
+      deadline = time.monotonic() + 30
+      while supervisor.metrics['restarts'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.1)
+      assert supervisor.metrics['restarts'] == 1
+      supervisor.submit(0, (results, 4))
+      index, key, new_pid = results.get(timeout=30)
+      assert (index, key) == (0, 4) and new_pid != pid
+    finally:
+      supervisor.stop()
+
+  # slots without a process (never started, or failed to restart) are skipped
+  def test_stop_empty_slots(self):
+    supervisor = Supervisor(echo, 2)
+    supervisor.stop(timeout=0)
+    assert supervisor.stats()['workers'] == 0